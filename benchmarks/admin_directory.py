@@ -0,0 +1,132 @@
+"""
+Latency of the admin user directory (/admin/users) on a large user table.
+
+Fills --rows users, logs in an admin with directory grants through the
+Flask test client, then times --requests calls for each scenario:
+the first page, pages deep into the table reached by keyset cursor,
+a filtered page, and type-ahead searches of growing prefixes. The
+target is p99 under 20 ms at a million users. The report also shows
+how long the search index took to build and how much memory the
+process grew by while building it.
+
+    python -m benchmarks.admin_directory --rows 1000000
+"""
+import argparse
+import os
+import random
+import resource
+import tempfile
+import time
+
+from sqlalchemy import insert, text
+
+from src.app import create_app
+from src.blueprints.admin import encode_cursor
+from src.models import db, Role, User
+from src.permissions import ROUTE, VIEW, assign_role, set_grant
+from src.rls import ROW
+
+NAMES = ['ada', 'alan', 'barbara', 'claude', 'donald', 'edsger', 'frances', 'grace', 'john', 'katherine',
+         'ken', 'leslie', 'margaret', 'niklaus', 'radia', 'tony']
+
+
+def fill(rows, batch=50_000):
+    for start in range(0, rows, batch):
+        db.session.execute(insert(User), [
+            {'username': f'{NAMES[i % len(NAMES)]}.{i}@example.com', 'password': 'x',
+             'display_name': f'{NAMES[(i * 7) % len(NAMES)].title()} Number{i}', 'is_active': i % 10 != 0}
+            for i in range(start, min(start + batch, rows))
+        ])
+    db.session.commit()
+
+
+def build_app(directory, rows):
+    app = create_app({
+        'SECRET_KEY': 'benchmark',
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{directory}/app.db',
+        'SESSION_TYPE': 'sqlite',
+        'SESSION_SQLITE_DIR': os.path.join(directory, 'sessions'),
+        'LOGIN_ATTEMPTS_DB': os.path.join(directory, 'login_attempts.db'),
+        'WTF_CSRF_ENABLED': False,
+        'HASH_POOL_WORKERS': 0,
+        'PASSWORD_HASH_ITERATIONS': 1000,
+    })
+    services = app.extensions['services']
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        fill(rows)
+        admin = User(username='admin', password=services.hasher.hash('pw'), display_name='Admin')
+        db.session.add(admin)
+        role = Role(name='directory')
+        db.session.add(role)
+        db.session.flush()
+        set_grant(role, ROUTE, 'admin.list_users', VIEW)
+        set_grant(role, ROW, 'user', VIEW)
+        assign_role(admin.id, role)
+        db.session.commit()
+        db.session.execute(text('ANALYZE'))
+        print(f'filled {rows} users in {time.perf_counter() - started:.1f}s')
+    return app
+
+
+def deep_cursors(app, count):
+    """Cursors pointing at random places in the table, as a client paging that far would hold"""
+    with app.app_context():
+        total = db.session.execute(text('SELECT max(id) FROM user')).scalar()
+        users = [db.session.get(User, random.randint(1, total)) for _ in range(count)]
+        return [encode_cursor(user) for user in users if user is not None]
+
+
+def timed(client, params_list):
+    latencies = []
+    for params in params_list:
+        started = time.perf_counter()
+        response = client.get('/admin/users', query_string=params)
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.status_code
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--requests', type=int, default=1000, help='Requests per scenario')
+    args = parser.parse_args()
+    random.seed(22)
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = build_app(directory, args.rows)
+        client = app.test_client()
+        client.post('/username_password_login', data={'username': 'admin', 'password': 'pw'})
+
+        search = app.extensions['services'].user_search
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        with app.app_context():
+            search.load()
+        stats = search.stats()
+        print(f"search index: {stats['entries']} entries for {stats['users']} users, built in "
+              f"{time.perf_counter() - started:.1f}s, max RSS +"
+              f"{(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024:.0f} MB")
+
+        n = args.requests
+        queries = [name[:length] for name in NAMES for length in (1, 2, 3, len(name))]
+        numbers = [f'number{random.randint(1, args.rows)}'[:random.randint(7, 12)] for _ in range(n)]
+        scenarios = {
+            'first page': [{}] * n,
+            'deep keyset page': [{'after': cursor} for cursor in deep_cursors(app, n)],
+            'filtered page': [{'active': 'false', 'created_after': '2000-01-01'}] * n,
+            'type-ahead, name': [{'q': random.choice(queries), 'limit': 20} for _ in range(n)],
+            'type-ahead, number': [{'q': q, 'limit': 20} for q in numbers],
+        }
+        for label, params_list in scenarios.items():
+            p50, p99 = timed(client, params_list)
+            print(f'  {label:<20} p50 {p50:7.2f} ms  p99 {p99:7.2f} ms')
+        app.extensions['services'].login_bookkeeping.close()
+        app.extensions['services'].audit.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Cost of the auth audit log: on the login path, in the background writer,
+and for the query API.
+
+1. Per-event cost of AuditLog.record(), the only part a request pays.
+2. Password login latency through the Flask test client with recording
+   on, and with record() swapped for a no-op.
+3. Background flush throughput, draining --events buffered events.
+4. With --events rows in auth_event spread over --days days: latency of
+   "last 20 events for a user", "failures per minute over the last
+   hour", and the time taken to purge the oldest day.
+
+    python -m benchmarks.audit_log --events 1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from src import audit
+from src.app import create_app
+from src.models import db, User
+
+
+def build_app(directory):
+    app = create_app({
+        'SECRET_KEY': 'benchmark',
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{directory}/app.db',
+        'SESSION_TYPE': 'sqlite',
+        'SESSION_SQLITE_DIR': os.path.join(directory, 'sessions'),
+        'LOGIN_ATTEMPTS_DB': os.path.join(directory, 'login_attempts.db'),
+        'WTF_CSRF_ENABLED': False,
+        'HASH_POOL_WORKERS': 0,
+        'PASSWORD_HASH_ITERATIONS': 1000,
+        # Only flushed by hand, so the timings below don't include it
+        'AUDIT_FLUSH_INTERVAL_MS': 3_600_000,
+        'AUDIT_BATCH_SIZE': 5000,
+        'AUDIT_BUFFER_SIZE': 2_000_000,
+    })
+    services = app.extensions['services']
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='someone', password=services.hasher.hash('pw'), display_name='Someone'))
+        db.session.commit()
+    return app
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+
+def login_latency(app, logins):
+    client = app.test_client()
+    latencies = []
+    for _ in range(logins):
+        started = time.perf_counter()
+        client.post('/username_password_login', data={'username': 'someone', 'password': 'pw'})
+        latencies.append(time.perf_counter() - started)
+    return percentiles(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, default=30, help='Days the stored events are spread over')
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--logins', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=1000)
+    args = parser.parse_args()
+    random.seed(23)
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = build_app(directory)
+        log = app.extensions['services'].audit
+
+        # Keep the flusher asleep: this is what a request pays, not the GIL time of a concurrent flush
+        batch_size, log.batch_size = log.batch_size, 1_000_000
+        started = time.perf_counter()
+        for i in range(100_000):
+            log.record(audit.LOGIN, 'default', i, 'someone@example.com', '10.0.0.1')
+        print(f'record(): {(time.perf_counter() - started) / 100_000 * 1e9:.0f} ns/event')
+        log.batch_size = batch_size
+        log.flush()
+
+        login_latency(app, 200)
+        real_record = log.record
+        # Alternate so drift (caches warming, the sessions file growing) doesn't favour either
+        with_audit, without_audit = [], []
+        for _ in range(4):
+            with_audit.append(login_latency(app, args.logins // 4))
+            log.flush()
+            log.record = lambda *a, **kw: None
+            without_audit.append(login_latency(app, args.logins // 4))
+            log.record = real_record
+        with_audit, without_audit = min(with_audit), min(without_audit)
+        print(f'login with audit    p50 {with_audit[0]:.3f} ms  p99 {with_audit[1]:.3f} ms')
+        print(f'login without audit p50 {without_audit[0]:.3f} ms  p99 {without_audit[1]:.3f} ms')
+
+        # Spread events over the last --days days, about 1 in 5 a failure
+        now = audit.now_ms()
+        span = args.days * audit.DAY_MS
+        kinds = [audit.LOGIN] * 3 + [audit.LOGOUT, audit.LOGIN_FAILED]
+        for _ in range(args.events):
+            log._buffer.append((now - random.randrange(span), random.choice(kinds), 'default',
+                                random.randrange(args.users), None, '10.0.0.1'))
+        started = time.perf_counter()
+        written = log.flush()
+        elapsed = time.perf_counter() - started
+        print(f'flush: {written} events in {elapsed:.1f}s ({written / elapsed:,.0f} events/s, '
+              f"largest batch {log.stats()['max_flush_ms']:.0f} ms)")
+
+        with app.app_context():
+            latencies = []
+            for _ in range(args.queries):
+                user_id = random.randrange(args.users)
+                started = time.perf_counter()
+                audit.recent_events(user_id, 20)
+                latencies.append(time.perf_counter() - started)
+            print('last 20 events for a user     p50 {:.3f} ms  p99 {:.3f} ms'.format(*percentiles(latencies)))
+
+            latencies = []
+            for _ in range(max(args.queries // 10, 10)):
+                started = time.perf_counter()
+                audit.failures_per_minute(datetime.now(timezone.utc) - timedelta(hours=1))
+                latencies.append(time.perf_counter() - started)
+            print('failures per minute, last 1h  p50 {:.3f} ms  p99 {:.3f} ms'.format(*percentiles(latencies)))
+
+        started = time.perf_counter()
+        purged = log.purge(retention_days=args.days - 1)
+        print(f'purge oldest day: {purged} events in {(time.perf_counter() - started) * 1000:.0f} ms')
+        log.close()
+        app.extensions['services'].login_bookkeeping.close()
+
+
+if __name__ == '__main__':
+    main()
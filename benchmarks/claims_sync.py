@@ -0,0 +1,88 @@
+"""
+Cost of mapping Azure AD claims onto the user at SSO login.
+
+For --users users with mapped groups, times ClaimsSync.sync() and counts
+the SQL statements it issues: on the first sync, on a repeat login with
+the same claims (the fingerprint matches), and on a login where the name
+and one group changed. Each user is loaded first, as the SSO callback
+does; that lookup isn't counted. Also shows the plan of that lookup by
+oid.
+
+    python -m benchmarks.claims_sync --users 10000
+"""
+import argparse
+import time
+
+from flask import Flask
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import load_only
+
+from src.claims_sync import ClaimsSync
+from src.models import db, Role, User
+
+ROLE_CLAIMS = {f'groups:g{i}': f'role{i}' for i in range(20)}
+
+
+def claims_for(i, generation=0):
+    return {'oid': f'oid-{i}', 'name': f'User {i}' + ' (renamed)' * generation,
+            'groups': [f'g{(i + generation) % 20}', f'g{(i + 7) % 20}', 'g-unmapped'], 'roles': []}
+
+
+def load(i):
+    """The returning-user lookup the SSO callback does"""
+    return db.session.execute(
+        select(User).options(load_only(User.id, User.display_name, User.locked_at, User.oid, User.claims_fingerprint))
+        .where(User.realm == 'default', User.oid == f'oid-{i}')).scalar_one()
+
+
+def run(sync, users, generation):
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+
+    elapsed = 0.0
+    for i in range(users):
+        user = load(i)
+        event.listen(db.engine, 'before_cursor_execute', count)
+        started = time.perf_counter()
+        sync.sync(user, claims_for(i, generation), ROLE_CLAIMS)
+        elapsed += time.perf_counter() - started
+        event.remove(db.engine, 'before_cursor_execute', count)
+    writes = sum(not s.lstrip().upper().startswith('SELECT') for s in statements)
+    return elapsed / users * 1e6, len(statements) / users, writes / users
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10_000)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(Role(name=name) for name in ROLE_CLAIMS.values())
+        # As if each had signed in before the claims were synced: oid known, nothing applied yet
+        db.session.execute(insert(User), [
+            {'username': f'user{i}@example.com', 'password': 'x', 'display_name': f'user{i}', 'oid': f'oid-{i}'}
+            for i in range(args.users)])
+        db.session.commit()
+        sync = ClaimsSync()
+
+        for label, generation in (('first sync', 0), ('repeat login, same claims', 0),
+                                  ('name and a group changed', 1)):
+            us, statements, writes = run(sync, args.users, generation)
+            print(f'{label:<28} {us:8.1f} us/login  {statements:4.1f} statements  {writes:4.1f} writes')
+        print(f'counters: {sync.stats()}')
+
+        statement = select(User.id).where(User.realm == 'default', User.oid == 'oid-7')
+        compiled = statement.compile(db.engine)
+        plan = db.session.connection().exec_driver_sql(
+            'EXPLAIN QUERY PLAN ' + str(compiled), tuple(compiled.params[name] for name in compiled.positiontup))
+        print('oid lookup:', ' | '.join(row[-1] for row in plan))
+
+
+if __name__ == '__main__':
+    main()
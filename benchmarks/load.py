@@ -0,0 +1,338 @@
+"""
+Load-test the real app over HTTP with concurrent clients.
+
+For each database backend a worker process builds the app against a fresh
+database and a local stub Azure AD authority (tests/stub_authority.py),
+serves it on 127.0.0.1 with werkzeug's threaded server and drives every
+route with --clients concurrent sessions, CSRF tokens included:
+
+    login             GET /login
+    check_username    POST /check_username (half known, half unknown names)
+    password_login    POST /username_password_login
+    register          POST /register
+    azure_round_trip  GET /azure_login -> stub sign-in -> GET REDIRECT_PATH
+
+SQLite always runs; Postgres runs too when --postgres-url (or
+BENCH_POSTGRES_URL) points at a reachable server with a driver installed.
+Results can be saved as a JSON baseline and later checked against it,
+exiting non-zero when p95 latency or throughput regress past --tolerance.
+
+    python -m benchmarks.load --clients 8 --requests 200
+    python -m benchmarks.load --save benchmarks/baselines/load.json
+    python -m benchmarks.load --check benchmarks/baselines/load.json --tolerance 0.5
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import BaseWSGIServer, make_server
+
+ROUTES = ['login', 'check_username', 'password_login', 'register', 'azure_round_trip']
+PASSWORD = 'load-test-password'
+REDIRECT_PATH = '/getAToken'
+PENDING_PATH = REDIRECT_PATH + '/pending'
+POLL_INTERVAL = 0.05
+CSRF_RE = re.compile(r'name="csrf_token" value="([^"]+)"')
+
+
+def percentile(sorted_values, pct):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct))]
+
+
+class Client:
+    """One browser: its own cookie jar and CSRF token"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.http = requests.Session()
+        page = self.http.get(f'{base_url}/login')
+        self.csrf = CSRF_RE.search(page.text).group(1)
+
+    def get(self, path, **kwargs):
+        return self.http.get(self.base_url + path, allow_redirects=False, **kwargs)
+
+    def post(self, path, data=None, json=None):
+        if data is not None:
+            data = dict(data, csrf_token=self.csrf)
+        return self.http.post(self.base_url + path, data=data, json=json,
+                              headers={'X-CSRFToken': self.csrf}, allow_redirects=False)
+
+
+def _redirects_to(response, path):
+    return response.status_code == 302 and response.headers['Location'].split('?')[0].endswith(path)
+
+
+def build_scenarios(stub, users):
+    """Each scenario takes (client, i) and returns True when the response was the expected one"""
+    def login(client, i):
+        return client.get('/login').status_code == 200
+
+    def check_username(client, i):
+        username = users[i % len(users)] if i % 2 else f'missing-{i}@example.com'
+        response = client.post('/check_username', json={'username': username})
+        return response.status_code == (200 if i % 2 else 404)
+
+    def password_login(client, i):
+        response = client.post('/username_password_login',
+                               data={'username': users[i % len(users)], 'password': PASSWORD})
+        return _redirects_to(response, '/')
+
+    def register(client, i):
+        response = client.post('/register', data={
+            'username': f'new-{uuid.uuid4().hex}@example.com', 'password': PASSWORD, 'display_name': 'New'})
+        return _redirects_to(response, '/login')
+
+    def azure_round_trip(client, i):
+        index = i % len(users)
+        response = client.get('/azure_login')
+        if response.status_code != 302:
+            return False
+        args = stub.authorize(response.headers['Location'], users[index], oid=f'oid-{index}')
+        response = client.get(REDIRECT_PATH, params=args)
+        # Unless SSO_REDEEM_WORKERS=0 the callback hands off and the browser polls
+        while response.status_code == 202 or _redirects_to(response, PENDING_PATH):
+            if response.status_code == 202:
+                time.sleep(POLL_INTERVAL)
+            response = client.get(PENDING_PATH)
+        return _redirects_to(response, '/')
+
+    return {'login': login, 'check_username': check_username, 'password_login': password_login,
+            'register': register, 'azure_round_trip': azure_round_trip}
+
+
+def drive(base_url, scenario, clients, requests_total):
+    """Run requests_total calls of one scenario spread over concurrent clients.
+
+    base_url may also be a list, e.g. one URL per application; clients are
+    spread over them round-robin.
+    """
+    base_urls = [base_url] if isinstance(base_url, str) else base_url
+    sessions = [Client(base_urls[i % len(base_urls)]) for i in range(clients)]
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(requests_total))
+
+    def worker(client):
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                ok = scenario(client, i)
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                errors += not ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(worker, sessions))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / wall, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Serves requests on a fixed number of threads, like a gunicorn gthread worker"""
+
+    def __init__(self, host, port, app, threads):
+        super().__init__(host, port, app)
+        self._pool = ThreadPoolExecutor(threads, thread_name_prefix='wsgi')
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def boot_app(stub, database_url, users, server_threads=0, applications=None):
+    """Build the app configured for the stub, seed users and serve it.
+
+    server_threads=0 uses werkzeug's thread-per-request server; otherwise
+    requests share a fixed pool of that many threads. applications (a list
+    of APPLICATIONS dicts) serves several apps, with users seeded in each
+    one's realm.
+    """
+    workdir = tempfile.mkdtemp(prefix='load-')
+    os.environ.update({
+        'SECRET_KEY': 'load-test',
+        'DATABASE_URL': database_url,
+        'CLIENT_ID': stub.client_id,
+        'CLIENT_SECRET': 'load-test-secret',
+        'AUTHORITY': stub.authority,
+        'REDIRECT_PATH': REDIRECT_PATH,
+        'SCOPE': 'User.Read',
+        'SESSION_TYPE': 'sqlite',
+        'SESSION_SQLITE_DIR': os.path.join(workdir, 'sessions'),
+        'LOGIN_ATTEMPTS_DB': os.path.join(workdir, 'login_attempts.db'),
+        'OIDC_CACHE_DIR': os.path.join(workdir, 'oidc_cache'),
+        'IDP_HTTP_CA_BUNDLE': stub.cert_path,
+        'MSAL_INSTANCE_DISCOVERY': 'false',
+    })
+    os.environ.pop('SERVER_NAME', None)
+    from src.app import create_app, warm_up
+    from src.models import db, User
+
+    app = create_app(None if applications is None else {'APPLICATIONS': applications})
+    services = app.extensions['services']
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        password_hash = services.hasher.hash(PASSWORD)
+        for application in app.extensions['applications']:
+            db.session.add_all([User(realm=application.realm, username=u, password=password_hash, display_name=u)
+                                for u in users])
+        db.session.commit()
+
+    if server_threads:
+        server = PooledWSGIServer('127.0.0.1', 0, app, server_threads)
+    else:
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # Warm up in the foreground so the first measured sign-in isn't a cold one
+    warm_up(app, azure=False)
+    services.azure.warm_up()
+    return app, server, f'http://127.0.0.1:{server.server_port}'
+
+
+def run_worker(args):
+    """Boot the app against args.database_url and a stub authority, then drive every route"""
+    from tests.stub_authority import StubAuthority
+
+    with StubAuthority(latency=args.idp_latency) as stub:
+        users = [f'user-{i}@example.com' for i in range(args.users)]
+        app, server, base_url = boot_app(stub, args.database_url, users)
+        scenarios = build_scenarios(stub, users)
+        results = {}
+        for name in args.routes:
+            results[name] = drive(base_url, scenarios[name], args.clients, args.requests)
+        server.shutdown()
+        app.extensions['services'].hasher.shutdown()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f)
+
+
+def postgres_available(url):
+    try:
+        from sqlalchemy import create_engine
+        engine = create_engine(url)
+        with engine.connect():
+            pass
+        engine.dispose()
+        return True
+    except Exception as e:
+        print(f"Skipping Postgres: {e.__class__.__name__}: {str(e).splitlines()[0]}")
+        return False
+
+
+def run_backend(database_url, args):
+    """Run one backend in its own process, so each gets a fresh app and environment"""
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        output = f.name
+    command = [sys.executable, '-m', 'benchmarks.load', '--worker', '--database-url', database_url,
+               '--output', output, '--clients', str(args.clients), '--requests', str(args.requests),
+               '--users', str(args.users), '--idp-latency', str(args.idp_latency), '--routes', *args.routes]
+    try:
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        with open(output) as f:
+            return json.load(f)
+    finally:
+        os.unlink(output)
+
+
+def regressions(baseline, current, tolerance):
+    """List every route whose p95 grew or throughput fell by more than tolerance"""
+    found = []
+    for backend, routes in current.items():
+        for route, result in routes.items():
+            base = baseline['results'].get(backend, {}).get(route)
+            if base is None:
+                continue
+            if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                found.append(f"{backend}/{route}: p95 {result['p95_ms']} ms vs baseline {base['p95_ms']} ms")
+            if result['rps'] < base['rps'] / (1 + tolerance):
+                found.append(f"{backend}/{route}: {result['rps']} req/s vs baseline {base['rps']} req/s")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per route')
+    parser.add_argument('--users', type=int, default=100, help='Seeded accounts')
+    parser.add_argument('--idp-latency', type=float, default=0.0, help='Seconds the stub token endpoint sleeps')
+    parser.add_argument('--routes', nargs='+', default=ROUTES, choices=ROUTES)
+    parser.add_argument('--postgres-url', default=os.getenv('BENCH_POSTGRES_URL'))
+    parser.add_argument('--save', metavar='PATH', help='Write results as a JSON baseline')
+    parser.add_argument('--check', metavar='PATH', help='Compare against a JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='Allowed fractional regression')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--database-url', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        backends = {'sqlite': f'sqlite:///{directory}/load.db'}
+        if args.postgres_url and postgres_available(args.postgres_url):
+            backends['postgres'] = args.postgres_url
+        for backend, url in backends.items():
+            results[backend] = run_backend(url, args)
+
+    for backend, routes in results.items():
+        for route, r in routes.items():
+            print(f"{backend:<9} {route:<17} {r['rps']:8.1f} req/s  p50 {r['p50_ms']:8.2f} ms  "
+                  f"p95 {r['p95_ms']:8.2f} ms  p99 {r['p99_ms']:8.2f} ms  errors {r['errors']}")
+
+    params = {'clients': args.clients, 'requests': args.requests, 'users': args.users,
+              'idp_latency': args.idp_latency}
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or '.', exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump({'params': params, 'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if args.check:
+        with open(args.check) as f:
+            baseline = json.load(f)
+        if baseline['params'] != params:
+            print(f"Warning: baseline was recorded with {baseline['params']}")
+        found = regressions(baseline, results, args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
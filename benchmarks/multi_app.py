@@ -0,0 +1,82 @@
+"""
+Throughput and memory with one application vs many in one process.
+
+For each --apps count a worker process serves that many applications
+(path prefixes /app0, /app1, ..., each with its own client id and user
+realm at the stub authority) from one app sharing the DB, HTTP and
+hashing pools. --clients concurrent sessions, spread round-robin over the
+applications, drive each route; the worker reports req/s per route and
+its resident memory after boot and after the run.
+
+    python -m benchmarks.multi_app --apps 1 20
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.load import boot_app, build_scenarios, drive
+
+ROUTES = ['login', 'check_username', 'password_login', 'azure_round_trip']
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS:')) / 1024
+
+
+def run_worker(args):
+    from tests.stub_authority import StubAuthority
+
+    with tempfile.TemporaryDirectory() as directory, StubAuthority() as stub:
+        applications = [{
+            'name': f'app{i}', 'path_prefix': f'/app{i}', 'client_id': f'client-{i}',
+            'client_secret': f'secret-{i}', 'authority': stub.authority, 'scopes': ['User.Read'],
+        } for i in range(args.apps)]
+        users = [f'user-{i}@example.com' for i in range(args.users)]
+        app, server, base_url = boot_app(stub, f'sqlite:///{directory}/app.db', users,
+                                         server_threads=args.server_threads, applications=applications)
+        booted_mb = rss_mb()
+        base_urls = [base_url + a['path_prefix'] for a in applications]
+        scenarios = build_scenarios(stub, users)
+        results = {name: drive(base_urls, scenarios[name], args.clients, args.requests) for name in ROUTES}
+        result = {'routes': results, 'rss_booted_mb': round(booted_mb, 1), 'rss_mb': round(rss_mb(), 1)}
+        server.shutdown()
+        app.extensions['services'].hasher.shutdown()
+    with open(args.output, 'w') as f:
+        json.dump(result, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--apps', type=int, nargs='+', default=[1, 20])
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=400, help='Requests per route')
+    parser.add_argument('--users', type=int, default=50, help='Seeded accounts per application')
+    parser.add_argument('--server-threads', type=int, default=16)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        args.apps = args.apps[0]
+        run_worker(args)
+        return
+
+    for apps in args.apps:
+        with tempfile.NamedTemporaryFile(suffix='.json') as f:
+            subprocess.run(
+                [sys.executable, '-m', 'benchmarks.multi_app', '--worker', '--output', f.name,
+                 '--apps', str(apps), '--clients', str(args.clients), '--requests', str(args.requests),
+                 '--users', str(args.users), '--server-threads', str(args.server_threads)],
+                check=True, stdout=subprocess.DEVNULL)
+            r = json.load(f)
+        print(f"{apps:>3} apps  RSS after boot {r['rss_booted_mb']:6.1f} MB  after run {r['rss_mb']:6.1f} MB")
+        for route, result in r['routes'].items():
+            print(f"          {route:<17} {result['rps']:8.1f} req/s  p95 {result['p95_ms']:8.2f} ms  "
+                  f"errors {result['errors']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Cost of rendering the login, register and index pages with and without
+the page cache.
+
+Each page is fetched --requests times by an anonymous client (the index
+also by a logged-in one) through the Flask test client. The report
+shows the time per request and the CPU time spent under Jinja per request.
+It also shows the 304 rate when the client revalidates with the ETag it
+was given.
+
+    python -m benchmarks.page_render --requests 2000
+"""
+import argparse
+import cProfile
+import os
+import pstats
+import tempfile
+import time
+
+from src.app import create_app
+from src.models import db, User
+
+PAGES = [('/login', False), ('/register', False), ('/', False), ('/', True)]
+
+
+def build_app(directory, page_cache):
+    app = create_app({
+        'SECRET_KEY': 'benchmark',
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{directory}/app.db',
+        'SESSION_TYPE': 'sqlite',
+        'SESSION_SQLITE_DIR': os.path.join(directory, 'sessions'),
+        'LOGIN_ATTEMPTS_DB': os.path.join(directory, 'login_attempts.db'),
+        'WTF_CSRF_ENABLED': False,
+        'HASH_POOL_WORKERS': 0,
+        'PASSWORD_HASH_ITERATIONS': 1000,
+        'PAGE_CACHE': page_cache,
+    })
+    services = app.extensions['services']
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='someone', password=services.hasher.hash('pw'), display_name='Someone'))
+        db.session.commit()
+    return app
+
+
+def jinja_seconds(profile):
+    stats = pstats.Stats(profile)
+    # Cumulative time in Template.render, the entry point of every Jinja render
+    return sum(row[3] for (filename, _, name), row in stats.stats.items()
+               if name == 'render' and filename.endswith(os.path.join('jinja2', 'environment.py')))
+
+
+def run(app, requests):
+    results = {}
+    for path, logged_in in PAGES:
+        client = app.test_client()
+        if logged_in:
+            client.post('/username_password_login', data={'username': 'someone', 'password': 'pw'})
+        client.get(path)
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        profile.enable()
+        for _ in range(requests):
+            client.get(path)
+        profile.disable()
+        elapsed = time.perf_counter() - started
+
+        etag = client.get(path).headers.get('ETag')
+        not_modified = sum(client.get(path, headers={'If-None-Match': etag or ''}).status_code == 304
+                           for _ in range(100))
+        label = f"{path} ({'logged in' if logged_in else 'anonymous'})"
+        results[label] = {'us': elapsed / requests * 1e6, 'jinja_us': jinja_seconds(profile) / requests * 1e6,
+                          'not_modified': not_modified}
+    app.extensions['services'].login_bookkeeping.close()
+    app.extensions['services'].audit.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per page')
+    args = parser.parse_args()
+
+    for mode, page_cache in (('render every time', '0'), ('page cache', '1')):
+        with tempfile.TemporaryDirectory() as directory:
+            results = run(build_app(directory, page_cache), args.requests)
+        print(mode)
+        for page, result in results.items():
+            print(f"  {page:<24} {result['us']:8.1f} us/request  Jinja {result['jinja_us']:7.1f} us/request  "
+                  f"304s {result['not_modified']}/100")
+
+
+if __name__ == '__main__':
+    main()
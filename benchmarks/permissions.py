@@ -0,0 +1,86 @@
+"""
+Per-request permission check cost: compiled decision table vs. a DB join.
+
+Builds roles with thousands of route and field grants in SQLite, assigns a
+user several roles, then times one check via the compiled table and the
+same check as the join a naive implementation would run per request.
+
+    python -m benchmarks.permissions --grants 5000 --checks 20000
+"""
+import argparse
+import random
+import time
+
+from flask import Flask
+from sqlalchemy import func, select
+
+from src.models import db, Grant, Role, User, UserRole
+from src.permissions import EDIT, FIELD, ROUTE, VIEW, PermissionEngine
+
+
+def build(grants, roles):
+    role_objs = [Role(name=f'role-{i}') for i in range(roles)]
+    user = User(username='bench', password='x', display_name='Bench')
+    db.session.add_all(role_objs + [user])
+    db.session.flush()
+    resources = []
+    for i in range(grants):
+        resource_type = ROUTE if i % 4 == 0 else FIELD
+        resource = f'resource-{i}'
+        resources.append((resource_type, resource))
+        db.session.add(Grant(role_id=role_objs[i % roles].id, resource_type=resource_type,
+                             resource=resource, level=random.choice((0, VIEW, EDIT))))
+    for role in role_objs[: max(roles // 2, 1)]:
+        db.session.add(UserRole(user_id=user.id, role_id=role.id))
+    db.session.commit()
+    return user.id, resources
+
+
+def join_check(user_id, resource_type, resource, level):
+    granted = db.session.execute(
+        select(func.max(Grant.level))
+        .join(UserRole, UserRole.role_id == Grant.role_id)
+        .where(UserRole.user_id == user_id, Grant.resource_type == resource_type, Grant.resource == resource)
+    ).scalar()
+    return (granted or 0) >= level
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--grants', type=int, default=5000)
+    parser.add_argument('--roles', type=int, default=20)
+    parser.add_argument('--checks', type=int, default=20000)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        user_id, resources = build(args.grants, args.roles)
+        engine = PermissionEngine(check_interval=3600)
+
+        started = time.perf_counter()
+        engine.compile(user_id)
+        compile_ms = (time.perf_counter() - started) * 1000
+
+        sample = [random.choice(resources) for _ in range(args.checks)]
+        started = time.perf_counter()
+        for resource_type, resource in sample:
+            engine.allows(user_id, resource_type, resource, VIEW)
+        table_us = (time.perf_counter() - started) / args.checks * 1e6
+
+        joins = sample[: max(args.checks // 20, 1)]
+        started = time.perf_counter()
+        for resource_type, resource in joins:
+            join_check(user_id, resource_type, resource, VIEW)
+        join_us = (time.perf_counter() - started) / len(joins) * 1e6
+
+    print(f"{args.grants} grants over {args.roles} roles")
+    print(f"compile at login:     {compile_ms:8.2f} ms")
+    print(f"compiled table check: {table_us:8.2f} us")
+    print(f"DB join check:        {join_us:8.2f} us")
+
+
+if __name__ == '__main__':
+    main()
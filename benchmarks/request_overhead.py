@@ -0,0 +1,82 @@
+"""
+Per-request framework overhead and session store reads, by route.
+
+A logged-in client requests each route --requests times through the
+Flask test client (no HTTP server, so what is left is routing, session
+handling, the principal and template work). This runs once with every
+request loading the session (SESSIONLESS_PATHS empty) and once with the
+default, where static files and /health skip the session store.
+
+    python -m benchmarks.request_overhead --requests 2000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from src.app import create_app
+from src.models import db, User
+
+ROUTES = ['/', '/login', '/static/css/styles.css', '/health']
+
+MODES = {
+    'session on every request': '',
+    'sessionless static + health': None,
+}
+
+
+def build_app(directory, sessionless_paths):
+    app = create_app({
+        'SECRET_KEY': 'benchmark',
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{directory}/app.db',
+        'SESSION_TYPE': 'sqlite',
+        'SESSION_SQLITE_DIR': os.path.join(directory, 'sessions'),
+        'LOGIN_ATTEMPTS_DB': os.path.join(directory, 'login_attempts.db'),
+        'WTF_CSRF_ENABLED': False,
+        'HASH_POOL_WORKERS': 0,
+        'PASSWORD_HASH_ITERATIONS': 1000,
+        'SESSIONLESS_PATHS': sessionless_paths,
+    })
+    services = app.extensions['services']
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='someone', password=services.hasher.hash('pw'), display_name='Someone'))
+        db.session.commit()
+    return app
+
+
+def run(app, requests):
+    client = app.test_client()
+    client.post('/username_password_login', data={'username': 'someone', 'password': 'pw'})
+    # The store under the sessionless and timing wrappers
+    store = app.session_interface.inner.inner
+    results = {}
+    for route in ROUTES:
+        client.get(route)
+        reads = store.reads
+        started = time.perf_counter()
+        for _ in range(requests):
+            client.get(route)
+        elapsed = time.perf_counter() - started
+        results[route] = {'us': elapsed / requests * 1e6, 'reads': (store.reads - reads) / requests}
+    app.extensions['services'].login_bookkeeping.close()
+    app.extensions['services'].audit.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per route')
+    args = parser.parse_args()
+
+    for mode, sessionless_paths in MODES.items():
+        with tempfile.TemporaryDirectory() as directory:
+            results = run(build_app(directory, sessionless_paths), args.requests)
+        print(mode)
+        for route, result in results.items():
+            print(f"  {route:<24} {result['us']:8.1f} us/request  "
+                  f"{result['reads']:4.2f} session store reads/request")
+
+
+if __name__ == '__main__':
+    main()
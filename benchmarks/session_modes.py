@@ -0,0 +1,98 @@
+"""
+Requests per second for each session mode: the server-side store
+(SESSION_MODE=server, with the sharded SQLite backend) and signed-cookie
+sessions (SESSION_MODE=cookie).
+
+For each mode a user logs in through the Flask test client, then
+--requests requests are timed for each scenario: the logged-in home page
+(a read-only session), a logged-in request that changes the session,
+and the anonymous login page. The report shows
+requests per second, p50 and p99, and how many session store reads and
+writes each scenario cost.
+
+    python -m benchmarks.session_modes --requests 5000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from flask import session
+
+from src.app import create_app
+from src.models import db, User
+
+MODES = ('server', 'cookie')
+
+
+def build_app(directory, mode):
+    app = create_app({
+        'SECRET_KEY': 'benchmark',
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{directory}/app.db',
+        'SESSION_TYPE': 'sqlite',
+        'SESSION_SQLITE_DIR': os.path.join(directory, 'sessions'),
+        'SESSION_MODE': mode,
+        'LOGIN_ATTEMPTS_DB': os.path.join(directory, 'login_attempts.db'),
+        'WTF_CSRF_ENABLED': False,
+        'HASH_POOL_WORKERS': 0,
+        'PASSWORD_HASH_ITERATIONS': 1000,
+    })
+
+    # Stands in for any view that writes to the session
+    @app.route('/bench/write')
+    def bench_write():
+        session['visits'] = session.get('visits', 0) + 1
+        return 'ok'
+
+    services = app.extensions['services']
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='someone', password=services.hasher.hash('pw'), display_name='Someone'))
+        db.session.commit()
+    return app
+
+
+def timed(client, path, requests):
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = client.get(path)
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.status_code
+    latencies.sort()
+    return {
+        'rps': requests / sum(latencies),
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000, help='Requests per scenario')
+    args = parser.parse_args()
+
+    for mode in MODES:
+        with tempfile.TemporaryDirectory() as directory:
+            app = build_app(directory, mode)
+            store = app.extensions['cookie_sessions'].server if mode == 'cookie' else app.session_interface
+            user = app.test_client()
+            user.post('/username_password_login', data={'username': 'someone', 'password': 'pw'})
+            user.get('/')
+            print(f"{mode}: session cookie {len(user.get_cookie('session').value)} bytes")
+
+            scenarios = {'logged-in page': (user, '/'), 'session write': (user, '/bench/write'),
+                         'anonymous page': (app.test_client(), '/login')}
+            for label, (client, path) in scenarios.items():
+                timed(client, path, min(args.requests, 200))
+                reads, writes = store.reads, store.writes
+                result = timed(client, path, args.requests)
+                print(f"  {label:<16} {result['rps']:8.0f} req/s  p50 {result['p50_ms']:.3f} ms  "
+                      f"p99 {result['p99_ms']:.3f} ms  store reads/req {(store.reads - reads) / args.requests:.2f}  "
+                      f"writes/req {(store.writes - writes) / args.requests:.2f}")
+            app.extensions['services'].login_bookkeeping.close()
+            app.extensions['services'].audit.close()
+
+
+if __name__ == '__main__':
+    main()
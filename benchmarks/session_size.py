@@ -0,0 +1,51 @@
+"""
+Measure the per-request session bytes saved by keeping the MSAL token
+cache (and the spent auth-code flow and raw id_token) out of the session.
+
+Performs one real Azure-style login against the local stub authority,
+then encodes the post-login session the old way and the new way with the
+same msgpack serializer Flask-Session uses.
+
+    python -m benchmarks.session_size
+"""
+import msal
+import msgspec
+
+from src.http_client import build_http_client
+from src.msal_apps import MsalAppRegistry
+from tests.stub_authority import StubAuthority
+
+
+def main():
+    with StubAuthority() as stub:
+        http = build_http_client(verify=stub.cert_path)
+        registry = MsalAppRegistry(http_client=http, instance_discovery=False)
+        app = registry.get(stub.client_id, stub.authority, 'secret')
+        flow = app.initiate_auth_code_flow(['User.Read'], redirect_uri='https://localhost:5000/getAToken')
+        cache = msal.SerializableTokenCache()
+        bound = registry.with_cache(stub.client_id, stub.authority, 'secret', cache=cache)
+        result = bound.acquire_token_by_auth_code_flow(
+            flow, stub.authorize(flow['auth_uri'], 'someone@example.com'))
+        http.close()
+
+    claims = result['id_token_claims']
+    principal = {
+        'user_oid': claims['oid'],
+        'user_email': claims['preferred_username'],
+        'display_name': 'Someone Example',
+        'login_method': 'azure',
+        'user_id': 42,
+    }
+    before = dict(principal, flow=flow, id_token=result['id_token'], token_cache=cache.serialize())
+    after = dict(principal)
+
+    encode = msgspec.msgpack.Encoder().encode
+    before_bytes, after_bytes = len(encode(before)), len(encode(after))
+    print(f"session before: {before_bytes:6d} bytes")
+    print(f"session after:  {after_bytes:6d} bytes")
+    print(f"saved per request read: {before_bytes - after_bytes} bytes "
+          f"({100 * (before_bytes - after_bytes) / before_bytes:.0f}%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Compare the sharded SQLite session store with the cachelib filesystem store.
+
+Each store is filled with N live sessions, then random sessions are opened
+and saved the way a request would: mostly unchanged reads, with a fraction
+of requests modifying the session.
+
+    python -m benchmarks.session_store --sessions 10000 100000 --requests 5000
+"""
+import argparse
+import random
+import tempfile
+import time
+from datetime import timedelta
+
+from cachelib.file import FileSystemCache
+from flask import Flask, Response, request
+from flask_session.cachelib import CacheLibSessionInterface
+
+from src.session_store import ShardedSQLiteSessionInterface
+
+SAMPLE_SESSION = {
+    'user_oid': '00000000-0000-0000-0000-000000000000',
+    'user_email': 'someone@example.com',
+    'display_name': 'Someone',
+    'login_method': 'azure',
+    '_flashes': [],
+}
+
+
+def build_stores(app, directory, sessions):
+    cachelib = CacheLibSessionInterface(
+        app, client=FileSystemCache(f'{directory}/cachelib', threshold=sessions * 2))
+    sqlite = ShardedSQLiteSessionInterface(app, f'{directory}/sqlite', sweep_interval=0)
+    return {'cachelib-filesystem': cachelib, 'sharded-sqlite': sqlite}
+
+
+def populate(store, sessions):
+    lifetime = timedelta(days=1)
+    sids = []
+    for i in range(sessions):
+        session = store.session_class(dict(SAMPLE_SESSION, n=i), sid=store._generate_sid(store.sid_length))
+        store._upsert_session(lifetime, session, store._get_store_id(session.sid))
+        sids.append(session.sid)
+    return sids
+
+
+def run(app, store, sids, requests, write_ratio):
+    cookie = app.config['SESSION_COOKIE_NAME']
+    latencies = []
+    for _ in range(requests):
+        sid = random.choice(sids)
+        with app.test_request_context(headers={'Cookie': f'{cookie}={sid}'}):
+            started = time.perf_counter()
+            session = store.open_session(app, request)
+            if random.random() < write_ratio:
+                session['n'] = session.get('n', 0) + 1
+            store.save_session(app, session, Response())
+            latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        'rps': requests / sum(latencies),
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[10_000])
+    parser.add_argument('--requests', type=int, default=5_000)
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.secret_key = 'benchmark'
+    for sessions in args.sessions:
+        with tempfile.TemporaryDirectory() as directory:
+            for name, store in build_stores(app, directory, sessions).items():
+                started = time.perf_counter()
+                sids = populate(store, sessions)
+                fill = time.perf_counter() - started
+                result = run(app, store, sids, args.requests, args.write_ratio)
+                print(f"{sessions:>9} live  {name:<20} fill {fill:7.1f}s  "
+                      f"{result['rps']:9.0f} req/s  p50 {result['p50_ms']:.3f} ms  p99 {result['p99_ms']:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
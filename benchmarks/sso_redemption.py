@@ -0,0 +1,118 @@
+"""
+SSO callback under a slow identity provider: inline vs off-thread redemption.
+
+Boots the app on a fixed pool of --server-threads request threads (like a
+gunicorn gthread worker) against the stub authority with --idp-latency
+seconds injected on its token endpoint. --sso-clients browsers then all
+sign in at once while a probe keeps requesting /login, once with
+SSO_REDEEM_WORKERS=0 (inline) and once with --redeem-workers I/O threads.
+
+    python -m benchmarks.sso_redemption --idp-latency 0.5 --sso-clients 200
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.load import Client, boot_app, build_scenarios, percentile
+
+
+def app_threads():
+    return sum(t.name.startswith(('wsgi', 'sso-redeem')) for t in threading.enumerate())
+
+
+def run_worker(args):
+    from tests.stub_authority import StubAuthority
+
+    os.environ['SSO_REDEEM_WORKERS'] = str(args.redeem_workers)
+    os.environ['IDP_HTTP_POOL_MAXSIZE'] = str(max(args.redeem_workers, args.server_threads))
+    with tempfile.TemporaryDirectory() as directory, StubAuthority(latency=args.idp_latency) as stub:
+        users = [f'user-{i}@example.com' for i in range(args.sso_clients)]
+        app, server, base_url = boot_app(stub, f'sqlite:///{directory}/app.db', users,
+                                                server_threads=args.server_threads)
+        sign_in = build_scenarios(stub, users)['azure_round_trip']
+        clients = [Client(base_url) for _ in range(args.sso_clients)]
+        probe = Client(base_url)
+
+        sso_latencies, probe_latencies = [], []
+        errors = 0
+        peak_threads = 0
+        done = threading.Event()
+
+        def run_probe():
+            nonlocal peak_threads
+            while not done.is_set():
+                started = time.perf_counter()
+                probe.get('/login')
+                probe_latencies.append(time.perf_counter() - started)
+                peak_threads = max(peak_threads, app_threads())
+                time.sleep(0.02)
+
+        def run_client(i):
+            nonlocal errors
+            started = time.perf_counter()
+            ok = sign_in(clients[i], i)
+            sso_latencies.append(time.perf_counter() - started)
+            errors += not ok
+
+        prober = threading.Thread(target=run_probe, daemon=True)
+        prober.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.sso_clients) as pool:
+            list(pool.map(run_client, range(args.sso_clients)))
+        wall = time.perf_counter() - started
+        done.set()
+        prober.join()
+        server.shutdown()
+
+        sso_latencies.sort()
+        probe_latencies.sort()
+        result = {
+            'sign_ins_per_s': round(len(sso_latencies) / wall, 1),
+            'sso_p50_ms': round(percentile(sso_latencies, 0.50) * 1000, 1),
+            'sso_p95_ms': round(percentile(sso_latencies, 0.95) * 1000, 1),
+            'login_p50_ms': round(percentile(probe_latencies, 0.50) * 1000, 1),
+            'login_p95_ms': round(percentile(probe_latencies, 0.95) * 1000, 1),
+            'errors': errors,
+            'peak_app_threads': peak_threads,
+            'peak_in_flight': app.extensions['services'].redeemer.stats()['peak_in_flight'],
+        }
+    with open(args.output, 'w') as f:
+        json.dump(result, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--idp-latency', type=float, default=0.5)
+    parser.add_argument('--sso-clients', type=int, default=200)
+    parser.add_argument('--server-threads', type=int, default=8)
+    parser.add_argument('--redeem-workers', type=int, default=32)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    for mode, workers in (('inline', 0), ('off-thread', args.redeem_workers)):
+        with tempfile.NamedTemporaryFile(suffix='.json') as f:
+            subprocess.run(
+                [sys.executable, '-m', 'benchmarks.sso_redemption', '--worker', '--output', f.name,
+                 '--idp-latency', str(args.idp_latency), '--sso-clients', str(args.sso_clients),
+                 '--server-threads', str(args.server_threads), '--redeem-workers', str(workers)],
+                check=True, stdout=subprocess.DEVNULL)
+            r = json.load(f)
+        print(f"{mode:<10} {r['sign_ins_per_s']:6.1f} sign-ins/s  sso p50 {r['sso_p50_ms']:8.1f} ms  "
+              f"p95 {r['sso_p95_ms']:8.1f} ms  /login during burst p50 {r['login_p50_ms']:7.1f} ms  "
+              f"p95 {r['login_p95_ms']:7.1f} ms  app threads {r['peak_app_threads']}  "
+              f"in flight {r['peak_in_flight']}  errors {r['errors']}")
+
+
+if __name__ == '__main__':
+    main()
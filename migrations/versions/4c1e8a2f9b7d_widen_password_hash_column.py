@@ -0,0 +1,33 @@
+"""widen password hash column
+
+Revision ID: 4c1e8a2f9b7d
+Revises: 78588193f474
+Create Date: 2026-10-18 10:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c1e8a2f9b7d'
+down_revision = '78588193f474'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # scrypt and high-iteration pbkdf2 hashes don't fit in 120 characters
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password',
+               existing_type=sa.String(length=120),
+               type_=sa.String(length=255),
+               existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password',
+               existing_type=sa.String(length=255),
+               type_=sa.String(length=120),
+               existing_nullable=False)
@@ -0,0 +1,57 @@
+"""add role, user_role and grant tables
+
+Revision ID: 5d2b9f6c8e14
+Revises: e7a41c09d5b3
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2b9f6c8e14'
+down_revision = 'e7a41c09d5b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('role',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.Column('description', sa.String(length=255), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('user_role',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('role_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['role_id'], ['role.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'role_id')
+    )
+    with op.batch_alter_table('user_role', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_role_role_id'), ['role_id'], unique=False)
+
+    op.create_table('grant',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('role_id', sa.Integer(), nullable=False),
+    sa.Column('resource_type', sa.String(length=10), nullable=False),
+    sa.Column('resource', sa.String(length=120), nullable=False),
+    sa.Column('level', sa.SmallInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['role_id'], ['role.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('role_id', 'resource_type', 'resource', name='uq_grant_role_resource')
+    )
+    op.execute("INSERT INTO cache_version (name, version) VALUES ('permissions', 0)")
+
+
+def downgrade():
+    op.execute("DELETE FROM cache_version WHERE name = 'permissions'")
+    op.drop_table('grant')
+    with op.batch_alter_table('user_role', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_role_role_id'))
+
+    op.drop_table('user_role')
+    op.drop_table('role')
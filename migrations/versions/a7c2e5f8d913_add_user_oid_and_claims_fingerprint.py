@@ -0,0 +1,31 @@
+"""add user oid and claims fingerprint
+
+Revision ID: a7c2e5f8d913
+Revises: f3a9d1c6b270
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c2e5f8d913'
+down_revision = 'f3a9d1c6b270'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing SSO users get their oid (and a first sync) on their next login
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('oid', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('claims_fingerprint', sa.String(length=32), nullable=True))
+        batch_op.create_unique_constraint('uq_user_realm_oid', ['realm', 'oid'])
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_user_realm_oid', type_='unique')
+        batch_op.drop_column('claims_fingerprint')
+        batch_op.drop_column('oid')
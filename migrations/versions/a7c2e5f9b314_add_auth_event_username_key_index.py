@@ -0,0 +1,25 @@
+"""add auth_event username_key index
+
+Revision ID: a7c2e5f9b314
+Revises: c5e9a3d7f120
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c2e5f9b314'
+down_revision = 'c5e9a3d7f120'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A user's recent events include those recorded under the username only
+    op.create_index('ix_auth_event_realm_username_key_ts', 'auth_event', ['realm', 'username_key', 'ts'])
+
+
+def downgrade():
+    op.drop_index('ix_auth_event_realm_username_key_ts', table_name='auth_event')
@@ -0,0 +1,30 @@
+"""add cache_version table
+
+Revision ID: b3f05d6e1a92
+Revises: 4c1e8a2f9b7d
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f05d6e1a92'
+down_revision = '4c1e8a2f9b7d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    cache_version = op.create_table('cache_version',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # Seed the stamps so concurrent first bumps never race on the insert
+    op.bulk_insert(cache_version, [{'name': 'usernames', 'version': 0}])
+
+
+def downgrade():
+    op.drop_table('cache_version')
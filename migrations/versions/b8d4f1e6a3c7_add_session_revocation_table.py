@@ -0,0 +1,35 @@
+"""add session_revocation table
+
+Revision ID: b8d4f1e6a3c7
+Revises: a7c2e5f8d913
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8d4f1e6a3c7'
+down_revision = 'a7c2e5f8d913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('session_revocation',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+    sa.Column('jti', sa.String(length=16), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('revoked_at', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('session_revocation', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_session_revocation_revoked_at'), ['revoked_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('session_revocation', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_session_revocation_revoked_at'))
+
+    op.drop_table('session_revocation')
@@ -0,0 +1,33 @@
+"""widen token_cache oid column
+
+Revision ID: c5e9a3d7f120
+Revises: b8d4f1e6a3c7
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e9a3d7f120'
+down_revision = 'b8d4f1e6a3c7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keys outside the default realm are '<realm>:<oid>': up to 50 + 1 + 64 characters
+    with op.batch_alter_table('token_cache', schema=None) as batch_op:
+        batch_op.alter_column('oid',
+               existing_type=sa.String(length=64),
+               type_=sa.String(length=128),
+               existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('token_cache', schema=None) as batch_op:
+        batch_op.alter_column('oid',
+               existing_type=sa.String(length=128),
+               type_=sa.String(length=64),
+               existing_nullable=False)
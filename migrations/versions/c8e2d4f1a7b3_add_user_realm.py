@@ -0,0 +1,31 @@
+"""add user realm
+
+Revision ID: c8e2d4f1a7b3
+Revises: 9a4c3e7d2f61
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e2d4f1a7b3'
+down_revision = '9a4c3e7d2f61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Usernames become unique per realm (one realm per application); existing users keep 'default'
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('realm', sa.String(length=50), nullable=False, server_default='default'))
+        batch_op.drop_constraint('uq_user_username', type_='unique')
+        batch_op.create_unique_constraint('uq_user_realm_username', ['realm', 'username'])
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_user_realm_username', type_='unique')
+        batch_op.create_unique_constraint('uq_user_username', ['username'])
+        batch_op.drop_column('realm')
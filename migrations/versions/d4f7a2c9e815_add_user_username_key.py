@@ -0,0 +1,50 @@
+"""add case-insensitive username key
+
+Revision ID: d4f7a2c9e815
+Revises: c8e2d4f1a7b3
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f7a2c9e815'
+down_revision = 'c8e2d4f1a7b3'
+branch_labels = None
+depends_on = None
+
+user = sa.table('user', sa.column('realm'), sa.column('username'), sa.column('username_key'))
+
+
+def upgrade():
+    # Users that only differ by case can't share a realm any more; refuse (before changing anything) rather than pick one
+    key = sa.func.lower(user.c.username)
+    clashes = op.get_bind().execute(
+        sa.select(user.c.realm, key).group_by(user.c.realm, key).having(sa.func.count() > 1)
+    ).all()
+    if clashes:
+        names = ', '.join(f'{realm}:{name}' for realm, name in clashes)
+        raise RuntimeError(f'Usernames differing only by case must be merged or renamed first: {names}')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('username_key', sa.String(length=80), nullable=True))
+
+    op.execute(user.update().values(username_key=key))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('username_key', existing_type=sa.String(length=80), nullable=False)
+        batch_op.drop_constraint('uq_user_realm_username', type_='unique')
+        batch_op.create_unique_constraint('uq_user_realm_username_key', ['realm', 'username_key'])
+
+    op.create_index('ix_user_active_username_key', 'user', ['realm', 'username_key', 'is_active'],
+                    sqlite_where=sa.text('is_active IS 1'), postgresql_where=sa.text('is_active IS TRUE'))
+
+
+def downgrade():
+    op.drop_index('ix_user_active_username_key', table_name='user')
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_user_realm_username_key', type_='unique')
+        batch_op.create_unique_constraint('uq_user_realm_username', ['realm', 'username'])
+        batch_op.drop_column('username_key')
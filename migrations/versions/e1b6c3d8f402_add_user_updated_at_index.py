@@ -0,0 +1,25 @@
+"""add user updated_at index
+
+Revision ID: e1b6c3d8f402
+Revises: d4f7a2c9e815
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1b6c3d8f402'
+down_revision = 'd4f7a2c9e815'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The admin search index picks up changed users with updated_at >= its watermark
+    op.create_index('ix_user_updated_at', 'user', ['updated_at'])
+
+
+def downgrade():
+    op.drop_index('ix_user_updated_at', table_name='user')
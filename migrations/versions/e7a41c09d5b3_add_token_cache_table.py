@@ -0,0 +1,34 @@
+"""add token_cache table
+
+Revision ID: e7a41c09d5b3
+Revises: b3f05d6e1a92
+Create Date: 2026-10-18 11:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a41c09d5b3'
+down_revision = 'b3f05d6e1a92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('token_cache',
+    sa.Column('oid', sa.String(length=64), nullable=False),
+    sa.Column('data', sa.Text(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=False),
+    sa.PrimaryKeyConstraint('oid')
+    )
+    with op.batch_alter_table('token_cache', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_token_cache_updated_at'), ['updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('token_cache', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_token_cache_updated_at'))
+
+    op.drop_table('token_cache')
@@ -0,0 +1,40 @@
+"""add auth_event table
+
+Revision ID: f3a9d1c6b270
+Revises: e1b6c3d8f402
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9d1c6b270'
+down_revision = 'e1b6c3d8f402'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('auth_event',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+    sa.Column('ts', sa.BigInteger(), nullable=False),
+    sa.Column('kind', sa.SmallInteger(), nullable=False),
+    sa.Column('realm', sa.String(length=50), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('username_key', sa.String(length=80), nullable=True),
+    sa.Column('ip', sa.String(length=45), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('auth_event', schema=None) as batch_op:
+        batch_op.create_index('ix_auth_event_user_id_ts', ['user_id', 'ts'], unique=False)
+        batch_op.create_index('ix_auth_event_kind_ts', ['kind', 'ts'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('auth_event', schema=None) as batch_op:
+        batch_op.drop_index('ix_auth_event_kind_ts')
+        batch_op.drop_index('ix_auth_event_user_id_ts')
+
+    op.drop_table('auth_event')
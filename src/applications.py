@@ -0,0 +1,180 @@
+"""
+Several internal applications served from one process.
+
+Each Application is one app on this framework with its own Azure AD
+registration (authority, client id/secret, scopes, redirect path) and its
+own user realm. They all share the process's DB connection pool, IdP HTTP
+pool, MSAL app registry and hashing pool; an Application itself is just a
+few strings, so adding another one costs next to no memory.
+
+ApplicationDispatcher resolves the application for every request from
+the Host header, or else from the first path segment, which it moves
+into SCRIPT_NAME so the routes and url_for() work unchanged under it.
+
+Applications come from the APPLICATIONS config (a list of dicts) or the
+JSON file named by APPLICATIONS_FILE, e.g.
+
+    [{"name": "hr", "path_prefix": "/hr", "client_id": "...",
+      "client_secret_env": "HR_CLIENT_SECRET",
+      "authority": "https://login.microsoftonline.com/<tenant>",
+      "scopes": ["User.Read"], "redirect_path": "/getAToken",
+      "role_claims": {"groups:<group object id>": "hr-admins", "roles:Directory.Read": "directory"}}]
+
+Without either there is a single 'default' application built from
+CLIENT_ID, CLIENT_SECRET, AUTHORITY, REDIRECT_PATH, SCOPE and
+AZURE_ROLE_CLAIMS.
+
+role_claims maps "<claim>:<value>" entries of the id_token's groups and
+roles claims to local role names; see claims_sync.py.
+"""
+import json
+import os
+
+from flask import current_app, request
+from werkzeug.exceptions import NotFound
+
+from .models import DEFAULT_REALM, REALM_LENGTH
+
+ENVIRON_KEY = 'auth.application'
+DEFAULT_APPLICATION = 'default'
+
+
+class Application:
+    """One app's Azure AD registration and user realm"""
+    __slots__ = ('name', 'client_id', 'client_secret', 'authority', 'redirect_path', 'scopes',
+                 'hosts', 'path_prefix', 'realm', 'role_claims')
+
+    def __init__(self, name: str, client_id=None, client_secret=None, authority=None,
+                 redirect_path: str = '/getAToken', scopes=(), hosts=(), path_prefix=None, realm=None,
+                 role_claims=None):
+        self.name = name
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.authority = authority
+        self.redirect_path = '/' + redirect_path.lstrip('/')
+        self.scopes = scopes.split() if isinstance(scopes, str) else list(scopes)
+        self.hosts = [host.lower() for host in hosts]
+        self.path_prefix = '/' + path_prefix.strip('/') if path_prefix else None
+        self.realm = realm or (DEFAULT_REALM if name == DEFAULT_APPLICATION else name)
+        self.role_claims = dict(json.loads(role_claims) if isinstance(role_claims, str) else role_claims or {})
+        if self.path_prefix and self.path_prefix.count('/') != 1:
+            raise ValueError(f'Application {name!r}: path_prefix must be a single path segment')
+        if ':' in self.realm:
+            raise ValueError(f'Application {name!r}: realm may not contain ":"')
+        if len(self.realm) > REALM_LENGTH:
+            raise ValueError(f'Application {name!r}: realm may be at most {REALM_LENGTH} characters')
+
+    @classmethod
+    def from_dict(cls, data: dict, env=None) -> 'Application':
+        env = os.environ if env is None else env
+        data = dict(data)
+        # Keep secrets out of the applications file
+        secret_env = data.pop('client_secret_env', None)
+        if secret_env and not data.get('client_secret'):
+            data['client_secret'] = env.get(secret_env)
+        return cls(**data)
+
+    def token_cache_key(self, oid):
+        """Token caches are per realm; the default realm keeps plain oids"""
+        if not oid or self.realm == DEFAULT_REALM:
+            return oid
+        return f'{self.realm}:{oid}'
+
+    def __repr__(self) -> str:
+        return f'<Application {self.name}>'
+
+
+class ApplicationRegistry:
+    """All configured applications, indexed for per-request lookup by host and path prefix"""
+
+    def __init__(self, applications):
+        self._by_name = {}
+        self._by_host = {}
+        self._by_prefix = {}
+        self.fallback = None
+        for application in applications:
+            if application.name in self._by_name:
+                raise ValueError(f'Duplicate application {application.name!r}')
+            self._by_name[application.name] = application
+            for host in application.hosts:
+                self._by_host[host] = application
+            if application.path_prefix:
+                self._by_prefix[application.path_prefix] = application
+            if not application.hosts and not application.path_prefix:
+                if self.fallback is not None:
+                    raise ValueError('Only one application may have neither hosts nor a path_prefix')
+                self.fallback = application
+
+    @classmethod
+    def from_config(cls, config, env=None) -> 'ApplicationRegistry':
+        entries = config.get('APPLICATIONS')
+        if entries is None and config.get('APPLICATIONS_FILE'):
+            with open(config['APPLICATIONS_FILE']) as f:
+                entries = json.load(f)
+        if entries is None:
+            return cls([Application(
+                DEFAULT_APPLICATION,
+                client_id=config.get('CLIENT_ID'),
+                client_secret=config.get('CLIENT_SECRET'),
+                authority=config.get('AUTHORITY'),
+                redirect_path=config.get('REDIRECT_PATH') or '/getAToken',
+                scopes=config.get('SCOPE') or [],
+                role_claims=config.get('AZURE_ROLE_CLAIMS'),
+            )])
+        return cls([entry if isinstance(entry, Application) else Application.from_dict(entry, env)
+                    for entry in entries])
+
+    def __iter__(self):
+        return iter(self._by_name.values())
+
+    def __len__(self) -> int:
+        return len(self._by_name)
+
+    def get(self, name: str):
+        return self._by_name.get(name)
+
+    @property
+    def redirect_paths(self) -> set:
+        return {application.redirect_path for application in self}
+
+    def resolve(self, host: str, path: str):
+        """Return (application, path_prefix) for a request; prefix is None unless it matched on path"""
+        application = self._by_host.get(host.rsplit(':', 1)[0].lower()) if host else None
+        if application is not None:
+            return application, None
+        if self._by_prefix:
+            segment = '/' + path.lstrip('/').split('/', 1)[0]
+            application = self._by_prefix.get(segment)
+            if application is not None:
+                return application, segment
+        return self.fallback, None
+
+
+class ApplicationDispatcher:
+    """WSGI middleware tagging each request with its application"""
+
+    def __init__(self, wsgi_app, registry: ApplicationRegistry):
+        self.wsgi_app = wsgi_app
+        self.registry = registry
+
+    def __call__(self, environ, start_response):
+        host = environ.get('HTTP_HOST') or environ.get('SERVER_NAME', '')
+        path = environ.get('PATH_INFO', '')
+        application, prefix = self.registry.resolve(host, path)
+        if application is None:
+            return NotFound()(environ, start_response)
+        if prefix:
+            environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + prefix
+            environ['PATH_INFO'] = path[len(prefix):]
+        environ[ENVIRON_KEY] = application
+        return self.wsgi_app(environ, start_response)
+
+
+def current_application() -> Application:
+    """The application the current request was resolved to"""
+    application = request.environ.get(ENVIRON_KEY)
+    if application is None:
+        # e.g. a test_request_context() that didn't go through the dispatcher
+        registry = current_app.extensions.get('applications')
+        application = registry.fallback if registry is not None else None
+    return application
@@ -0,0 +1,131 @@
+"""
+Fingerprinted, precompressed static assets.
+
+`flask assets-build` copies every file under static/ into static/dist/
+with a content hash in its name (css/styles.3f2a9c1b04de.css), writes a
+.gz next to each one (and a .br if the optional brotli package is
+installed), and records the names in static/dist/manifest.json.
+
+Templates reference assets with asset_url('css/styles.css'). If the
+manifest lists the file, that resolves to /assets/<hashed name>. The
+asset route there serves the best precompressed variant the browser
+accepts, with a year-long immutable Cache-Control. A changed file gets
+a new name, so browsers never revalidate an asset once they have it.
+Without a manifest (e.g. in development), asset_url() falls back to the
+plain /static/ URL.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import Blueprint, Flask, abort, current_app, request, send_file, url_for
+
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 12
+MAX_AGE = 365 * 24 * 3600
+
+# Not worth compressing: already compressed or too small to matter
+_SKIP_COMPRESSION = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico', '.woff', '.woff2', '.gz', '.br', '.zip'}
+_MIN_COMPRESS_BYTES = 256
+
+# (Accept-Encoding token, file suffix), best first
+_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+bp = Blueprint('assets', __name__)
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def _fingerprinted(path: str, digest: str) -> str:
+    stem, ext = os.path.splitext(path)
+    return f'{stem}.{digest[:HASH_LENGTH]}{ext}'
+
+
+def build_assets(source_dir: str, out_dir: str) -> dict:
+    """Fingerprint and precompress every file in source_dir into out_dir; returns the manifest"""
+    brotli = _brotli()
+    source_dir = os.path.abspath(source_dir)
+    out_dir = os.path.abspath(out_dir)
+    manifest = {}
+    for root, dirs, files in os.walk(source_dir):
+        # Don't feed a previous build back into this one
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != out_dir)
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, source_dir).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            hashed = _fingerprinted(logical, hashlib.sha256(data).hexdigest())
+            target = os.path.join(out_dir, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+            if os.path.splitext(name)[1].lower() not in _SKIP_COMPRESSION and len(data) >= _MIN_COMPRESS_BYTES:
+                # mtime=0 keeps the .gz byte-identical across builds
+                with open(target + '.gz', 'wb') as f:
+                    f.write(gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target + '.br', 'wb') as f:
+                        f.write(brotli.compress(data, quality=11))
+            manifest[logical] = hashed
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(out_dir: str) -> dict:
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def assets_dir(app: Flask) -> str:
+    return app.config.get('ASSETS_DIR') or os.path.join(app.static_folder, 'dist')
+
+
+def init_assets(app: Flask):
+    """Load the build manifest and expose asset_url() to templates"""
+    app.extensions['assets'] = load_manifest(assets_dir(app))
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.register_blueprint(bp)
+
+
+def asset_url(filename: str) -> str:
+    """URL of a static file, fingerprinted if it has been built"""
+    hashed = current_app.extensions['assets'].get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('assets.asset', filename=hashed)
+
+
+@bp.route('/assets/<path:filename>')
+def asset(filename):
+    # Only names from the manifest; this is not a general file server
+    if filename not in current_app.extensions['assets'].values():
+        abort(404)
+    path = os.path.join(assets_dir(current_app), filename)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for token, suffix in _ENCODINGS:
+        if request.accept_encodings[token] and os.path.exists(path + suffix):
+            path += suffix
+            encoding = token
+            break
+    response = send_file(path, mimetype=mimetype, max_age=MAX_AGE, conditional=True, etag=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,237 @@
+"""
+Append-only audit log of authentication events.
+
+Logins, failures, locks, unlocks and logouts are recorded in the
+auth_event table. A request only appends a small tuple to an in-memory
+ring buffer, a deque whose append and popleft are atomic, so recording
+takes no lock and never touches the database. A background thread
+drains the buffer every flush_interval seconds, or sooner once
+batch_size events are waiting, with one executemany INSERT per batch.
+When the buffer is full the oldest events are overwritten and counted
+as dropped. Whatever is left is flushed at interpreter exit.
+
+Events older than retention_days are purged a whole day at a time, by
+the flusher every purge_interval seconds or with `flask audit-purge`.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from flask import Flask, current_app, g, request
+from sqlalchemy import delete, func, insert, select, union
+
+from .models import db, AuthEvent, User, username_key
+
+logger = logging.getLogger(__name__)
+
+# Event codes stored in auth_event.kind; never renumber
+LOGIN = 1
+LOGIN_FAILED = 2
+LOGIN_BLOCKED = 3
+LOCKED = 4
+UNLOCKED = 5
+LOGOUT = 6
+SSO_LOGIN = 7
+SSO_FAILED = 8
+SSO_LOGOUT = 9
+
+KIND_NAMES = {LOGIN: 'login', LOGIN_FAILED: 'login_failed', LOGIN_BLOCKED: 'login_blocked', LOCKED: 'locked',
+              UNLOCKED: 'unlocked', LOGOUT: 'logout', SSO_LOGIN: 'sso_login', SSO_FAILED: 'sso_failed',
+              SSO_LOGOUT: 'sso_logout'}
+FAILURE_KINDS = (LOGIN_FAILED, LOGIN_BLOCKED, SSO_FAILED)
+
+DAY_MS = 24 * 3600 * 1000
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class AuditLog:
+    """Ring buffer of auth events, drained to auth_event in bulk by a background thread"""
+
+    def __init__(self, app: Flask, flush_interval: float = 0.5, batch_size: int = 1000,
+                 capacity: int = 50_000, retention_days: int = 365, purge_interval: float = 3600):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.capacity = capacity
+        self.retention_days = retention_days
+        self.purge_interval = purge_interval
+        self._buffer = deque(maxlen=capacity)
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._purged_at = time.monotonic()
+        # Plain counters bumped without a lock; close enough for gauges
+        self.recorded = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.flushed_rows = 0
+        self.purged_rows = 0
+        self.max_flush_ms = 0.0
+        atexit.register(self.close)
+
+    def record(self, kind: int, realm: str, user_id: int = None, username: str = None, ip: str = None):
+        """Queue an event; never touches the database"""
+        buffer = self._buffer
+        if len(buffer) >= self.capacity:
+            self.dropped += 1
+        buffer.append((now_ms(), kind, realm, user_id, username_key(username) if username else None, ip))
+        self.recorded += 1
+        if self._thread is None:
+            self._start()
+        if len(buffer) >= self.batch_size and not self._wake.is_set():
+            self._wake.set()
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._flush_forever, name='audit-log', daemon=True)
+            self._thread.start()
+
+    def _flush_forever(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                if time.monotonic() - self._purged_at >= self.purge_interval:
+                    self._purged_at = time.monotonic()
+                    self.purge()
+            except Exception as e:
+                logger.warning("Audit log flush failed: %s", e)
+
+    def flush(self) -> int:
+        """Insert everything buffered so far; returns the number of events written"""
+        written = 0
+        with self._flush_lock:
+            while self._buffer:
+                batch = []
+                try:
+                    while len(batch) < self.batch_size:
+                        batch.append(self._buffer.popleft())
+                except IndexError:
+                    pass
+                started = time.perf_counter()
+                with self.app.app_context():
+                    try:
+                        db.session.execute(insert(AuthEvent), [
+                            {'ts': ts, 'kind': kind, 'realm': realm, 'user_id': user_id, 'username_key': key,
+                             'ip': ip}
+                            for ts, kind, realm, user_id, key, ip in batch])
+                        db.session.commit()
+                    except Exception:
+                        db.session.rollback()
+                        # Back to the front in their original order; if new events filled the buffer
+                        # meanwhile, the newest are the ones lost
+                        self._buffer.extendleft(reversed(batch))
+                        self.failed_flushes += 1
+                        raise
+                self.max_flush_ms = max(self.max_flush_ms, (time.perf_counter() - started) * 1000)
+                self.flushes += 1
+                self.flushed_rows += len(batch)
+                written += len(batch)
+        return written
+
+    def purge(self, retention_days: int = None) -> int:
+        """Delete events from days wholly outside the retention period; returns the number deleted"""
+        days = self.retention_days if retention_days is None else retention_days
+        cutoff = (now_ms() // DAY_MS - days) * DAY_MS
+        # Every kind is listed so the delete is a range scan of ix_auth_event_kind_ts per kind
+        with self.app.app_context():
+            deleted = db.session.execute(
+                delete(AuthEvent).where(AuthEvent.kind.in_(KIND_NAMES), AuthEvent.ts < cutoff)
+            ).rowcount
+            db.session.commit()
+        self.purged_rows += deleted
+        return deleted
+
+    def close(self):
+        """Stop the flusher and write out what is left"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning("Final audit log flush failed: %s", e)
+
+    def stats(self) -> dict:
+        return {
+            'depth': len(self._buffer),
+            'recorded': self.recorded,
+            'dropped': self.dropped,
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes,
+            'flushed_rows': self.flushed_rows,
+            'purged_rows': self.purged_rows,
+            'max_flush_ms': round(self.max_flush_ms, 3),
+        }
+
+
+def audit(kind: int, user_id: int = None, username: str = None):
+    """Record an event for the current request's application and client address"""
+    current_app.extensions['services'].audit.record(
+        kind, g.application.realm, user_id=user_id, username=username, ip=request.remote_addr)
+
+
+# -- queries --
+
+def recent_events(user_id: int, limit: int = 50) -> list:
+    """The user's latest events, newest first.
+
+    Attempts turned away by the lockout pre-check never looked the user
+    up, so they are only recorded under the username (username_key).
+    Events recorded under either are matched: the latest `limit` of each
+    come from a backwards walk of ix_auth_event_user_id_ts and of
+    ix_auth_event_realm_username_key_ts, and only those are merged.
+    """
+    user = select(User.realm, User.username_key).where(User.id == user_id).subquery()
+    newest = (AuthEvent.ts.desc(), AuthEvent.id.desc())
+    by_id = select(AuthEvent.id).where(AuthEvent.user_id == user_id).order_by(*newest).limit(limit)
+    by_username = (
+        select(AuthEvent.id)
+        .where(AuthEvent.realm == user.c.realm, AuthEvent.username_key == user.c.username_key)
+        .order_by(*newest).limit(limit))
+    ids = union(by_id.subquery().select(), by_username.subquery().select())
+    return db.session.execute(
+        select(AuthEvent).where(AuthEvent.id.in_(ids)).order_by(*newest).limit(limit)
+    ).scalars().all()
+
+
+def failures_per_minute(since: datetime, until: datetime = None, realm: str = None) -> list:
+    """(minute, count) of failed and blocked logins, oldest first.
+
+    A range scan of ix_auth_event_kind_ts per failure kind; without a
+    realm it is answered from the index alone.
+    """
+    minute = (AuthEvent.ts // 60_000).label('minute')
+    criteria = [AuthEvent.kind.in_(FAILURE_KINDS), AuthEvent.ts >= int(since.timestamp() * 1000)]
+    if until is not None:
+        criteria.append(AuthEvent.ts < int(until.timestamp() * 1000))
+    if realm is not None:
+        criteria.append(AuthEvent.realm == realm)
+    rows = db.session.execute(
+        select(minute, func.count()).where(*criteria).group_by(minute).order_by(minute)
+    ).all()
+    return [(datetime.fromtimestamp(m * 60, timezone.utc), count) for m, count in rows]
+
+
+def as_dict(event: AuthEvent) -> dict:
+    return {
+        'at': datetime.fromtimestamp(event.ts / 1000, timezone.utc).isoformat(),
+        'event': KIND_NAMES.get(event.kind, str(event.kind)),
+        'realm': event.realm,
+        'user_id': event.user_id,
+        'username': event.username_key,
+        'ip': event.ip,
+    }
@@ -0,0 +1,108 @@
+"""
+Azure AD plumbing shared by every application in the process: the IdP
+HTTP transport, the MSAL app registry, the OIDC metadata cache and the
+per-user token caches. Methods take the Application whose registration
+(client id/secret, authority, scopes) they act for.
+
+This module imports msal, requests and PyJWT, so it is only imported the
+first time an Azure route (or the warm-up) needs it; see
+Services.azure.
+"""
+import logging
+import os
+
+import msal
+
+from .http_client import build_http_client_from_env
+from .msal_apps import MsalAppRegistry
+from .oidc_cache import OidcMetadataCache
+from .token_store import delete_token_cache, id_token_hint, load_token_cache, save_token_cache
+
+logger = logging.getLogger(__name__)
+
+
+class AzureAuth:
+    """Everything the Azure routes need, built once per process and shared by all applications"""
+
+    def __init__(self, applications, settings, instance_path: str):
+        self.applications = applications
+
+        # Shared keep-alive transport (pool size, timeouts, retries) for every MSAL app
+        self.http_client = build_http_client_from_env(settings)
+        options = {}
+        # Authorities other than Azure AD (e.g. a local stub) can't answer instance discovery
+        if str(settings.get('MSAL_INSTANCE_DISCOVERY', 'true')).lower() in ('0', 'false', 'no'):
+            options['instance_discovery'] = False
+        self.registry = MsalAppRegistry(http_client=self.http_client, **options)
+
+        # Discovery documents and signing keys shared on disk by every worker; read
+        # now so a fresh worker neither re-discovers nor fetches keys on its first login
+        cache_dir = settings.get('OIDC_CACHE_DIR') or os.path.join(instance_path, 'oidc_cache')
+        self.msal_http_cache = os.path.join(cache_dir, 'msal_http_cache.json')
+        self.oidc_cache = OidcMetadataCache(cache_dir, self.http_client)
+        for authority in {application.authority for application in applications if application.authority}:
+            self.oidc_cache.load(authority)
+        self.registry.persist_http_cache(self.msal_http_cache)
+
+    def msal_app(self, application, cache=None):
+        # Apps are built once per (client_id, authority) and shared; only the cache is per call
+        return self.registry.with_cache(
+            application.client_id, application.authority,
+            client_credential=application.client_secret, cache=cache)
+
+    def build_auth_code_flow(self, application, redirect_uri: str) -> dict:
+        return self.msal_app(application).initiate_auth_code_flow(
+            application.scopes, redirect_uri=redirect_uri)
+
+    def redeem_auth_code(self, application, flow, auth_response, cache):
+        """The identity-provider round trip; needs no request context so it can run off-thread"""
+        result = self.msal_app(application, cache=cache).acquire_token_by_auth_code_flow(flow, auth_response)
+        return result, cache
+
+    def validate_id_token(self, application, id_token: str) -> dict:
+        """Verify the id_token signature locally against the cached signing keys"""
+        return self.oidc_cache.validate_id_token(application.authority, application.client_id, id_token)
+
+    # -- per-user token caches, one per realm and oid --
+
+    @staticmethod
+    def new_token_cache():
+        return msal.SerializableTokenCache()
+
+    @staticmethod
+    def load_token_cache(application, oid):
+        return load_token_cache(application.token_cache_key(oid))
+
+    @staticmethod
+    def save_token_cache(application, oid, cache):
+        return save_token_cache(application.token_cache_key(oid), cache)
+
+    @staticmethod
+    def delete_token_cache(application, oid):
+        return delete_token_cache(application.token_cache_key(oid))
+
+    @staticmethod
+    def id_token_hint(cache) -> str:
+        return id_token_hint(cache)
+
+    def warm_up(self) -> bool:
+        """Resolve every application's authority metadata up front so first logins skip discovery"""
+        ready = True
+        refreshed = set()
+        for application in self.applications:
+            if not application.authority:
+                continue
+            ready = self.registry.warm_up(application.client_id, application.authority,
+                                          client_credential=application.client_secret) and ready
+            if application.authority in refreshed:
+                continue
+            refreshed.add(application.authority)
+            try:
+                # No network when another worker already cached fresh metadata
+                self.oidc_cache.refresh(application.authority)
+            except Exception as e:
+                logger.warning("OIDC metadata warm-up failed for %s: %s", application.authority, e)
+        self.registry.save_http_cache(self.msal_http_cache)
+        if refreshed:
+            self.oidc_cache.start_refresher()
+        return ready
@@ -0,0 +1,211 @@
+"""Registration, username/password login, logout and account unlocking"""
+from datetime import datetime, timezone
+
+from flask import Blueprint, current_app, flash, g, jsonify, redirect, request, url_for
+from sqlalchemy import select
+from sqlalchemy.orm import load_only
+
+from .. import audit
+from ..cookie_session import revoke_current_session, revoke_user_sessions
+from ..hashing import HasherBusy
+from ..lockout import LOCKED_MESSAGE, attempt_key, lock_user, unlock_user
+from ..models import db, User, username_key
+from ..page_cache import render_page
+from .. import principal
+from ..permissions import engine as permission_engine, require_permission, EDIT
+from ..services import services
+from ..utils import busy_response
+
+bp = Blueprint('accounts', __name__)
+
+
+@bp.route('/register')
+def register():
+    return render_page('register.html')
+
+
+@bp.route('/register', methods=['POST'])
+def register_user():
+    username = request.form.get('username', '').strip()
+    password = request.form.get('password', '').strip()
+    display_name = request.form.get('display_name', '').strip()
+
+    # Validate input
+    is_valid, error_message = User.validate_registration(username, password, display_name)
+    if not is_valid:
+        flash(error_message, 'error')
+        return redirect(url_for('accounts.register'))
+
+    # Check if username already exists in this application's realm, in any case; answered from the unique index
+    realm = g.application.realm
+    existing_user = db.session.execute(
+        select(select(User.username_key).where(User.realm == realm, User.username_key == username_key(username))
+               .exists())
+        .execution_options(skip_rls=True)
+    ).scalar()
+    if existing_user:
+        flash('Username already exists', 'error')
+        return redirect(url_for('accounts.register'))
+
+    svc = services()
+    try:
+        with svc.metrics.stage('password_hash'):
+            hashed_password = svc.hasher.hash(password)
+    except HasherBusy:
+        return busy_response('register.html')
+
+    try:
+        new_user = User(realm=realm, username=username, password=hashed_password, display_name=display_name)
+        db.session.add(new_user)
+        svc.username_index.bump()
+        # Flush first so the new id is read before commit expires the object
+        db.session.flush()
+        user_id, key = new_user.id, new_user.username_key
+        db.session.commit()
+        svc.username_index.add(username, realm)
+        svc.user_search.upsert(user_id, realm, key, display_name)
+        flash('User registered successfully!', 'success')
+        return redirect(url_for('accounts.login'))
+    except Exception as e:
+        db.session.rollback()
+        flash('An error occurred during registration. Please try again.', 'error')
+        return redirect(url_for('accounts.register'))
+
+
+@bp.route('/check_username', methods=['POST'])
+def check_username():
+    try:
+        data = request.get_json()
+        username = data.get('username', '').strip()
+
+        if not username:
+            return jsonify({
+                'success': False,
+                'message': 'Username is required'
+            }), 400
+
+        # Check if user exists, answered from the in-memory index when possible
+        if not services().username_index.exists(username, g.application.realm):
+            return jsonify({
+                'success': False,
+                'message': 'This username is not registered. Please contact the website administrator to register.'
+            }), 404
+
+        # User exists
+        return jsonify({
+            'success': True,
+            'message': 'Username found'
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': 'An error occurred. Please try again.'
+        }), 500
+
+
+@bp.route('/login')
+def login():
+    return render_page('login.html')
+
+
+@bp.route('/username_password_login', methods=['POST'])
+def username_password_login():
+    username = request.form.get('username', '').strip()
+    password = request.form.get('password', '').strip()
+
+    if not username or not password:
+        flash('Both username and password are required', 'error')
+        return redirect(url_for('accounts.login'))
+
+    svc = services()
+    realm = g.application.realm
+    key = attempt_key(realm, username)
+    # Known-locked accounts are turned away before the DB lookup and any hashing
+    if svc.login_attempts.is_locked(key):
+        audit.audit(audit.LOGIN_BLOCKED, username=username)
+        flash(LOCKED_MESSAGE, 'error')
+        return redirect(url_for('accounts.login'))
+
+    # Auth lookups must see every user, whoever is currently logged in; only the columns a login needs
+    user = db.session.execute(
+        select(User)
+        .options(load_only(User.id, User.username, User.password, User.display_name, User.locked_at))
+        .where(User.realm == realm, User.username_key == username_key(username))
+        .execution_options(skip_rls=True)
+    ).scalar_one_or_none()
+
+    if user and user.locked_at is not None:
+        # Locked on another host or before a restart; remember it locally
+        svc.login_attempts.mark_locked(key, blocked=True)
+        audit.audit(audit.LOGIN_BLOCKED, user.id, username)
+        flash(LOCKED_MESSAGE, 'error')
+        return redirect(url_for('accounts.login'))
+
+    try:
+        with svc.metrics.stage('password_verify'):
+            password_ok = bool(user) and svc.hasher.verify(user.password, password)
+    except HasherBusy:
+        return busy_response('login.html')
+
+    if password_ok:
+        svc.login_attempts.reset(key)
+        if svc.hasher.needs_rehash(user.password):
+            _upgrade_password_hash(user.id, user.password, password)
+        principal.login(user, user.username, user.username, 'username_password', g.application)
+        svc.login_bookkeeping.record(user.id, last_login=datetime.now(timezone.utc))
+        audit.audit(audit.LOGIN, user.id, username)
+        # Compile the user's permissions now so page checks are plain lookups
+        permission_engine.compile(user.id)
+        flash('Successfully authenticated!', 'success')
+        return redirect(url_for('main.index'))
+    else:
+        audit.audit(audit.LOGIN_FAILED, user.id if user else None, username)
+        if user and svc.login_attempts.record_failure(key):
+            lock_user(user.id)
+            revoke_user_sessions(user.id)
+            audit.audit(audit.LOCKED, user.id, username)
+            flash(LOCKED_MESSAGE, 'error')
+            return redirect(url_for('accounts.login'))
+        flash('Invalid username or password. Please contact the website administrator to reset your password.', 'error')
+        return redirect(url_for('accounts.login'))
+
+
+@bp.route('/logout')
+def logout():
+    # Azure sessions also sign out of Azure AD
+    user = principal.current_principal()
+    if user is not None and user.login_method == 'azure':
+        return redirect(url_for('azure.azure_logout'))
+    if user is not None:
+        audit.audit(audit.LOGOUT, user.user_id, user.email)
+    revoke_current_session()
+    principal.logout()
+    flash('You have been logged out successfully', 'success')
+    return redirect(url_for('accounts.login'))
+
+
+@bp.route('/admin/users/<int:user_id>/unlock', methods=['POST'])
+@require_permission(EDIT)
+def unlock_account(user_id):
+    user = db.get_or_404(User, user_id)
+    unlock_user(user, services().login_attempts)
+    audit.audit(audit.UNLOCKED, user.id, user.username)
+    flash(f'Unlocked {user.username}', 'success')
+    return redirect(request.referrer or url_for('main.index'))
+
+
+def _upgrade_password_hash(user_id, old_hash, password):
+    """Re-hash a password stored with outdated parameters in the background and save it"""
+    app = current_app._get_current_object()
+
+    def save(new_hash):
+        with app.app_context():
+            try:
+                # Only replace the hash we verified, in case it changed meanwhile
+                User.query.filter_by(id=user_id, password=old_hash).update({'password': new_hash})
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.warning("Password hash upgrade failed for user %s: %s", user_id, e)
+    services().hasher.rehash_in_background(password, save)
@@ -0,0 +1,155 @@
+"""JSON user directory for admin tools: keyset-paginated listing, type-ahead search and auth events"""
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta, timezone
+
+from flask import Blueprint, abort, g, jsonify, request
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import load_only
+
+from .. import audit
+from ..models import db, User
+from ..permissions import require_permission, VIEW
+from ..services import services
+from ..user_search import IndexNotReady
+
+bp = Blueprint('admin', __name__)
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+# A search pages through at most this many matches (the response says 'truncated' when there
+# were more); type-ahead should narrow the query instead
+MAX_MATCHES = 500
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def encode_cursor(user: User) -> str:
+    raw = json.dumps([user.username_key, user.id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    try:
+        key, user_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError, TypeError):
+        raise BadRequest('after is not a valid cursor')
+    if not isinstance(key, str) or not isinstance(user_id, int):
+        raise BadRequest('after is not a valid cursor')
+    return key, user_id
+
+
+def _datetime_arg(name: str):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise BadRequest(f'{name} must be an ISO 8601 date or time')
+
+
+def _filters() -> list:
+    criteria = []
+    active = request.args.get('active')
+    if active is not None:
+        if active.lower() not in ('true', 'false', '1', '0'):
+            raise BadRequest('active must be true or false')
+        criteria.append(User.is_active.is_(active.lower() in ('true', '1')))
+    created_after = _datetime_arg('created_after')
+    if created_after is not None:
+        criteria.append(User.created_at >= created_after)
+    created_before = _datetime_arg('created_before')
+    if created_before is not None:
+        criteria.append(User.created_at < created_before)
+    return criteria
+
+
+def _limit() -> int:
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest('limit must be a number')
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def _as_json(user: User) -> dict:
+    return {
+        'id': user.id,
+        'username': user.username,
+        'display_name': user.display_name,
+        'is_active': user.is_active,
+        'locked': user.locked_at is not None,
+        'created_at': user.created_at.isoformat() if user.created_at else None,
+        'last_login': user.last_login.isoformat() if user.last_login else None,
+    }
+
+
+@bp.route('/admin/users')
+@require_permission(VIEW)
+def list_users():
+    try:
+        limit = _limit()
+        criteria = _filters()
+        after = request.args.get('after')
+        if after:
+            # Seek past the last row of the previous page; the (realm, username_key) index serves it in order
+            criteria.append(tuple_(User.username_key, User.id) > tuple_(*decode_cursor(after)))
+    except BadRequest as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    realm = g.application.realm
+    query = request.args.get('q', '').strip()
+    truncated = False
+    if query:
+        # The index only narrows the candidates; filters, order and row-level security still come from the query
+        try:
+            ids = services().user_search.search(realm, query, MAX_MATCHES + 1)
+        except IndexNotReady as e:
+            return jsonify({'success': False, 'message': str(e)}), 503, {'Retry-After': '5'}
+        if not ids:
+            return jsonify({'users': [], 'next': None, 'truncated': False})
+        truncated = len(ids) > MAX_MATCHES
+        criteria.append(User.id.in_(ids[:MAX_MATCHES]))
+
+    users = db.session.execute(
+        select(User)
+        .options(load_only(User.id, User.username, User.username_key, User.display_name, User.is_active,
+                           User.locked_at, User.created_at, User.last_login))
+        .where(User.realm == realm, *criteria)
+        .order_by(User.username_key, User.id)
+        .limit(limit + 1)
+    ).scalars().all()
+    next_cursor = encode_cursor(users[limit - 1]) if len(users) > limit else None
+    return jsonify({'users': [_as_json(user) for user in users[:limit]], 'next': next_cursor, 'truncated': truncated})
+
+
+@bp.route('/admin/users/<int:user_id>/events')
+@require_permission(VIEW)
+def user_events(user_id):
+    # Only users this admin may see in the directory
+    visible = db.session.execute(
+        select(User.id).where(User.id == user_id, User.realm == g.application.realm)).scalar_one_or_none()
+    if visible is None:
+        abort(404)
+    try:
+        limit = _limit()
+    except BadRequest as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'events': [audit.as_dict(event) for event in audit.recent_events(user_id, limit)]})
+
+
+@bp.route('/admin/auth_failures')
+@require_permission(VIEW)
+def auth_failures():
+    """Failed and blocked logins per minute over the last `minutes` (default 60, at most a week)"""
+    try:
+        minutes = min(max(int(request.args.get('minutes', 60)), 1), 7 * 24 * 60)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'minutes must be a number'}), 400
+    since = datetime.now(timezone.utc) - timedelta(minutes=minutes)
+    counts = audit.failures_per_minute(since, realm=g.application.realm)
+    return jsonify({'failures': [{'minute': minute.isoformat(), 'count': count} for minute, count in counts]})
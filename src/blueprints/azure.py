@@ -0,0 +1,234 @@
+"""
+Azure AD sign-in: starting the auth code flow, the redirect callback
+(inline or via the redemption pool) and Azure logout, each against the
+registration of the application the request was resolved to.
+
+msal, requests and PyJWT are only imported once one of these routes runs;
+see Services.azure.
+"""
+import logging
+from datetime import datetime, timezone
+
+from flask import Blueprint, abort, flash, g, redirect, render_template, request, session, url_for
+from sqlalchemy import select
+from sqlalchemy.orm import load_only
+
+from .. import audit, principal
+from ..cookie_session import revoke_current_session
+from ..lockout import LOCKED_MESSAGE
+from ..metrics import log_event
+from ..models import db, User, username_key
+from ..permissions import engine as permission_engine
+from ..redemption import RedemptionBusy, RedemptionTimeout
+from ..services import services
+from ..utils import busy_response
+
+bp = Blueprint('azure', __name__)
+
+
+@bp.record_once
+def register_redirect_routes(state):
+    # Callback paths are configuration (they must match each app registration in Azure AD)
+    for redirect_path in sorted(state.app.extensions['applications'].redirect_paths):
+        state.add_url_rule(redirect_path, view_func=authorized)
+        state.add_url_rule(redirect_path + '/pending', view_func=authorized_pending)
+
+
+def _redirect_url(suffix=''):
+    """The current application's callback URL, under its host or path prefix"""
+    return request.url_root.rstrip('/') + g.application.redirect_path + suffix
+
+
+@bp.route('/azure_login')
+def azure_login():
+    redirect_uri = _redirect_url()
+    log_event('azure_login', sample=services().log_sample_rate, application=g.application.name,
+              redirect_uri=redirect_uri)
+    session["flow"] = services().azure.build_auth_code_flow(g.application, redirect_uri)
+    return redirect(session["flow"]["auth_uri"])
+
+
+@bp.route('/azure_logout')
+def azure_logout():
+    """Handle Azure logout process"""
+    azure = services().azure
+    # Get the email that was used in the attempted login
+    attempted_email = session.get('attempted_email', '')
+
+    # Grab the ID token hint before the session (and the user's token cache) go away
+    user = principal.current_principal()
+    oid = user.oid if user is not None and user.login_method == 'azure' else None
+    if oid:
+        audit.audit(audit.SSO_LOGOUT, user.user_id, user.email)
+    id_token = azure.id_token_hint(_load_cache()) if oid else ''
+    azure.delete_token_cache(g.application, oid)
+
+    # Keep the current flash messages through the logout
+    temp_messages = session.get('_flashes', [])
+    revoke_current_session()
+    principal.logout()
+    session['_flashes'] = temp_messages
+
+    # Construct the Azure logout URL
+    logout_url = (
+        f"{g.application.authority}/oauth2/v2.0/logout"
+        f"?post_logout_redirect_uri={url_for('accounts.login', _external=True)}"
+        f"&id_token_hint={id_token}"  # Add the ID token hint
+    )
+
+    return redirect(logout_url)
+
+
+def authorized():
+    application = g.application
+    if request.path != application.redirect_path:
+        # Another application's callback path
+        abort(404)
+    svc = services()
+    azure = svc.azure
+    redeemer = svc.redeemer
+    # Always a fresh cache: the browser may still be signed in as someone else, whose
+    # tokens must not end up saved under the oid this redemption signs in
+    cache = azure.new_token_cache()
+    # The flow is single use; don't carry it around in the session any longer
+    flow = session.pop("flow", {})
+    auth_response = request.args.to_dict()
+
+    def redeem():
+        with svc.metrics.stage('token_exchange'):
+            return azure.redeem_auth_code(application, flow, auth_response, cache)
+
+    if not redeemer.enabled:
+        return _finish_azure_login(redeem)
+    try:
+        session['redeem_ticket'] = redeemer.submit(redeem)
+    except RedemptionBusy:
+        return busy_response('login.html')
+    return redirect(_redirect_url('/pending'))
+
+
+def authorized_pending():
+    """Polled by the browser until the off-thread redemption has finished"""
+    if request.path != g.application.redirect_path + '/pending':
+        abort(404)
+    try:
+        future = services().redeemer.poll(session.get('redeem_ticket'))
+    except KeyError:
+        session.pop('redeem_ticket', None)
+        flash('Your sign-in has expired. Please try again.', 'error')
+        return redirect(url_for('accounts.login'))
+    except RedemptionTimeout:
+        session.pop('redeem_ticket', None)
+        flash('The sign-in service took too long to respond. Please try again.', 'error')
+        return redirect(url_for('accounts.login'))
+    if future is None:
+        return render_template('signing_in.html'), 202, {'Refresh': '1', 'Cache-Control': 'no-store'}
+    session.pop('redeem_ticket', None)
+    return _finish_azure_login(future.result)
+
+
+def _finish_azure_login(redeem):
+    """Turn a token redemption into a logged-in session; redeem() returns (result, cache)"""
+    import jwt
+
+    svc = services()
+    application = g.application
+    try:
+        result, cache = redeem()
+
+        if "error" in result:
+            error_msg = f"Authentication Error: {result.get('error')}"
+            if 'error_description' in result:
+                error_msg += f" - {result.get('error_description')}"
+            audit.audit(audit.SSO_FAILED)
+
+            flash(error_msg, 'error')
+            return redirect(url_for('azure.azure_logout'))
+
+        # Verify the id_token signature locally against the cached signing keys
+        with svc.metrics.stage('id_token_validation'):
+            claims = svc.azure.validate_id_token(application, result.get('id_token', ''))
+        # Claim names only; the values are personal data
+        log_event('azure_claims', sample=svc.log_sample_rate, application=application.name,
+                  tid=claims.get('tid'), claims=sorted(claims))
+
+        oid = claims.get('oid')
+        email = claims.get('preferred_username')
+
+        if not oid or not email:
+            audit.audit(audit.SSO_FAILED, username=email)
+            flash('Failed to get user information from authentication response', 'error')
+            return redirect(url_for('azure.azure_logout'))
+
+        # Store the email that was attempted to be used for login
+        session['attempted_email'] = email
+
+        # Returning users are found by their immutable oid; on the first SSO login, by a username
+        # matching the email (Azure AD may case it differently) on an account not yet tied to another oid
+        columns = load_only(User.id, User.display_name, User.locked_at, User.oid, User.claims_fingerprint)
+        by_oid = (
+            select(User).options(columns)
+            .where(User.realm == application.realm, User.oid == oid)
+            .execution_options(skip_rls=True))
+        user = db.session.execute(by_oid).scalar_one_or_none()
+        if user is None:
+            user = db.session.execute(
+                select(User).options(columns)
+                .where(User.realm == application.realm, User.username_key == username_key(email),
+                       User.oid.is_(None))
+                .execution_options(skip_rls=True)
+            ).scalar_one_or_none()
+        if user is None:
+            # A concurrent first login to the same account may have tied it to the oid in between
+            user = db.session.execute(by_oid).scalar_one_or_none()
+
+        if user and user.locked_at is not None:
+            audit.audit(audit.LOGIN_BLOCKED, user.id, email)
+            flash(LOCKED_MESSAGE, 'error')
+            return redirect(url_for('azure.azure_logout'))
+
+        if not user:
+            audit.audit(audit.SSO_FAILED, username=email)
+            flash(f'No local account found matching your Azure email ({email}). Please contact your administrator to register.', 'error')
+            return redirect(url_for('azure.azure_logout'))
+
+        # Clear the attempted_email since login was successful
+        session.pop('attempted_email', None)
+
+        # Name, oid and mapped roles; no writes at all when the claims are as last time
+        with svc.metrics.stage('claims_sync'):
+            svc.claims_sync.sync(user, claims, application.role_claims)
+
+        # Store user information in session
+        principal.login(user, oid, email, 'azure', application)
+        svc.login_bookkeeping.record(user.id, last_login=datetime.now(timezone.utc))
+        audit.audit(audit.SSO_LOGIN, user.id, email)
+        permission_engine.compile(user.id)
+        flash('Successfully authenticated!', 'success')
+        svc.azure.save_token_cache(application, oid, cache)
+
+        return redirect(url_for('main.index'))
+
+    except jwt.InvalidTokenError as e:
+        audit.audit(audit.SSO_FAILED)
+        flash(f'Authentication error: the ID token could not be verified ({e})', 'error')
+        return redirect(url_for('azure.azure_logout'))
+    except ValueError as e:
+        audit.audit(audit.SSO_FAILED)
+        flash(f'Authentication error: {str(e)}', 'error')
+        return redirect(url_for('azure.azure_logout'))
+    except Exception as e:
+        audit.audit(audit.SSO_FAILED)
+        flash(f'Unexpected error during authentication: {str(e)}', 'error')
+        log_event('azure_login_failed', level=logging.ERROR, application=application.name,
+                  error=type(e).__name__, detail=str(e))
+        return redirect(url_for('azure.azure_logout'))
+
+
+def _load_cache():
+    # Only Azure users have a token cache, and it lives in its own table
+    azure = services().azure
+    user = principal.current_principal()
+    if user is None or user.login_method != 'azure':
+        return azure.new_token_cache()
+    return azure.load_token_cache(g.application, user.oid)
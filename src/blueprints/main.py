@@ -0,0 +1,32 @@
+"""Home page, health check and the per-request context shared by every template"""
+from flask import Blueprint, g, has_request_context
+
+from ..applications import current_application
+from ..page_cache import render_page
+from ..principal import current_principal
+
+bp = Blueprint('main', __name__)
+
+
+@bp.before_app_request
+def resolve_application():
+    # Who the user is gets worked out only when something asks (see current_principal)
+    g.application = current_application()
+
+
+@bp.app_context_processor
+def inject_user():
+    if not has_request_context():
+        return dict(application=None, principal=None)
+    return dict(application=getattr(g, 'application', None), principal=current_principal())
+
+
+@bp.route('/')
+def index():
+    return render_page('index.html')
+
+
+@bp.route('/health')
+def health():
+    # Listed in SESSIONLESS_PATHS, so no session is loaded for it
+    return 'ok', 200, {'Cache-Control': 'no-store'}
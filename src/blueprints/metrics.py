@@ -0,0 +1,30 @@
+"""Prometheus scrape endpoint, enabled by setting METRICS_TOKEN"""
+import hmac
+
+from flask import Blueprint, Response, abort, request
+
+from ..metrics import ENDPOINT_KEY, stats_gauges
+from ..services import services
+
+bp = Blueprint('metrics', __name__)
+
+
+@bp.before_app_request
+def tag_endpoint():
+    # Read back by MetricsMiddleware once the response is out
+    request.environ[ENDPOINT_KEY] = request.endpoint
+
+
+@bp.route('/metrics')
+def metrics():
+    svc = services()
+    token = svc.settings.get('METRICS_TOKEN')
+    if not token:
+        abort(404)
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        abort(401)
+    gauges = {}
+    for component, stats in svc.stats().items():
+        gauges.update(stats_gauges(f'auth_{component}', stats))
+    return Response(svc.metrics.render(gauges), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,113 @@
+"""
+Azure AD claims mapped onto the local user on every SSO login.
+
+The claims that matter (oid, name, groups, roles) and the application's
+role_claims mapping are hashed into a fingerprint kept on the user row.
+A repeat login whose fingerprint matches does nothing more, so the
+common case is read-only. When it differs, only what changed is written:
+the display name, the stored oid, and the memberships of roles that
+role_claims maps to ("groups:<id>" or "roles:<name>" -> role name).
+
+Roles that no mapping entry points at are never touched, so roles an
+admin assigned by hand survive SSO logins. When the token reports a
+group overage (too many groups to list; see _claim_names), group-mapped
+memberships are left as they are.
+"""
+import hashlib
+import json
+import logging
+import threading
+
+from sqlalchemy import select
+
+from .models import db, Role, User, UserRole
+from .permissions import assign_role, revoke_role
+
+logger = logging.getLogger(__name__)
+
+MAPPED_CLAIMS = ('groups', 'roles')
+
+
+def claims_fingerprint(claims: dict, role_claims: dict) -> str:
+    """Hash of the claims a sync would apply, and of the mapping it would apply them with"""
+    relevant = [claims.get('oid'), claims.get('name'), sorted(role_claims.items())]
+    relevant.extend(sorted(claims.get(claim) or ()) for claim in MAPPED_CLAIMS)
+    relevant.append(sorted(claims.get('_claim_names') or {}))
+    return hashlib.blake2b(json.dumps(relevant, separators=(',', ':')).encode(), digest_size=16).hexdigest()
+
+
+class ClaimsSync:
+    """Applies changed claims to users and counts how often there was nothing to do"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.profile_updates = 0
+        self.roles_added = 0
+        self.roles_removed = 0
+
+    def sync(self, user: User, claims: dict, role_claims: dict) -> bool:
+        """Bring the user in line with the claims; returns whether anything was written"""
+        fingerprint = claims_fingerprint(claims, role_claims)
+        if user.claims_fingerprint == fingerprint:
+            with self._lock:
+                self.hits += 1
+            return False
+
+        profile_changed = False
+        name = (claims.get('name') or '').strip()[:50]
+        if name and name != user.display_name:
+            user.display_name = name
+            profile_changed = True
+        oid = claims.get('oid')
+        if oid and oid != user.oid:
+            user.oid = oid
+            profile_changed = True
+        added, removed, missing = self._sync_roles(user.id, claims, role_claims)
+        # Keep trying on later logins until every mapped role exists
+        user.claims_fingerprint = None if missing else fingerprint
+        db.session.commit()
+
+        with self._lock:
+            self.misses += 1
+            self.profile_updates += profile_changed
+            self.roles_added += added
+            self.roles_removed += removed
+        return True
+
+    @staticmethod
+    def _sync_roles(user_id: int, claims: dict, role_claims: dict):
+        overage = set(claims.get('_claim_names') or {})
+        managed = {}
+        for key, role_name in role_claims.items():
+            claim = key.split(':', 1)[0]
+            if claim not in overage:
+                managed.setdefault(role_name, set()).add(key)
+        if not managed:
+            return 0, 0, 0
+        present = {f'{claim}:{value}' for claim in MAPPED_CLAIMS for value in claims.get(claim) or ()}
+        wanted = {role_name for role_name, keys in managed.items() if keys & present}
+
+        current = set(db.session.execute(
+            select(Role.name).join(UserRole, UserRole.role_id == Role.id)
+            .where(UserRole.user_id == user_id, Role.name.in_(managed))
+        ).scalars())
+        to_add, to_remove = wanted - current, current - wanted
+        if not to_add and not to_remove:
+            return 0, 0, 0
+        roles = {role.name: role for role in db.session.execute(
+            select(Role).where(Role.name.in_(to_add | to_remove))).scalars()}
+        missing = to_add - roles.keys()
+        for role_name in missing:
+            logger.warning("role_claims maps to role %r, which doesn't exist", role_name)
+        for role_name in to_add - missing:
+            assign_role(user_id, roles[role_name])
+        for role_name in to_remove:
+            revoke_role(user_id, roles[role_name])
+        return len(to_add) - len(missing), len(to_remove), len(missing)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'profile_updates': self.profile_updates,
+                    'roles_added': self.roles_added, 'roles_removed': self.roles_removed}
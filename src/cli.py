@@ -0,0 +1,76 @@
+"""Flask CLI commands, registered on the app by create_app()"""
+from datetime import timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from . import audit
+from .assets import assets_dir, build_assets
+from .hashing import benchmark_schemes
+from .lockout import unlock_user
+from .models import DEFAULT_REALM, User, username_key
+from .services import services
+
+
+@click.command('hash-benchmark')
+@click.option('--target-ms', default=250.0, show_default=True, help='Verify latency budget per login')
+@with_appcontext
+def hash_benchmark(target_ms):
+    """Time password verify per scheme and recommend parameters for this machine"""
+    click.echo(f"Current method: {services().hasher.method}")
+    for result in benchmark_schemes(target_ms):
+        click.echo(
+            f"{result['scheme']:<16} {result['reference']} verifies in {result['reference_ms']:.1f} ms; "
+            f"recommended {result['recommended']} (~{result['estimated_ms']:.0f} ms)")
+
+
+@click.command('unlock-user')
+@click.argument('username')
+@click.option('--realm', default=DEFAULT_REALM, show_default=True, help="The user's application realm")
+@with_appcontext
+def unlock_user_command(username, realm):
+    """Clear the failed-login lock on an account"""
+    user = User.query.filter_by(realm=realm, username_key=username_key(username)).first()
+    if user is None:
+        raise click.ClickException(f"No user named {username} in realm {realm}")
+    unlock_user(user, services().login_attempts)
+    services().audit.record(audit.UNLOCKED, realm, user.id, username)
+    click.echo(f"Unlocked {username}")
+
+
+@click.command('token-cache-evict')
+@click.option('--max-age-days', default=90, show_default=True, help='Drop caches unused for this long')
+@with_appcontext
+def token_cache_evict(max_age_days):
+    """Delete token caches whose refresh tokens have expired"""
+    from .token_store import evict_expired  # pulls in msal
+    click.echo(f"Evicted {evict_expired(timedelta(days=max_age_days))} token caches")
+
+
+@click.command('audit-purge')
+@click.option('--retention-days', type=int, default=None, help='Defaults to AUDIT_RETENTION_DAYS (365)')
+@with_appcontext
+def audit_purge(retention_days):
+    """Delete auth events from days outside the retention period"""
+    click.echo(f"Purged {services().audit.purge(retention_days)} auth events")
+
+
+@click.command('session-revocations-purge')
+@with_appcontext
+def session_revocations_purge():
+    """Delete session revocations older than any session they could still end"""
+    click.echo(f"Purged {current_app.extensions['session_revocations'].purge()} session revocations")
+
+
+@click.command('assets-build')
+@with_appcontext
+def assets_build():
+    """Fingerprint and precompress the static files into static/dist"""
+    manifest = build_assets(current_app.static_folder, assets_dir(current_app))
+    for logical, hashed in sorted(manifest.items()):
+        click.echo(f"{logical} -> {hashed}")
+
+
+commands = [hash_benchmark, unlock_user_command, token_cache_evict, audit_purge, session_revocations_purge,
+            assets_build]
@@ -1,6 +1,42 @@
 import os
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-class Config:
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
-        'sqlite:///' + os.path.join(basedir, 'app.db')
+
+def load_config(overrides=None) -> dict:
+    """Flask config read from the environment, with create_app() overrides on top"""
+    config = {
+        'SECRET_KEY': os.getenv('SECRET_KEY'),
+        'SQLALCHEMY_DATABASE_URI': os.getenv('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'app.db'),
+        'SERVER_NAME': os.getenv('SERVER_NAME'),
+        # Server-side sessions; sqlite is the built-in sharded store, anything else goes to Flask-Session
+        'SESSION_TYPE': os.getenv('SESSION_TYPE', 'sqlite'),
+        'SESSION_FILE_DIR': os.getenv('SESSION_FILE_DIR'),
+        'SESSION_SQLITE_DIR': os.getenv('SESSION_SQLITE_DIR'),
+        'SESSION_SQLITE_SHARDS': os.getenv('SESSION_SQLITE_SHARDS'),
+        # SESSION_MODE=cookie keeps sessions in short-lived signed cookies (see cookie_session.py);
+        # the server-side store above then only holds the SSO login flow
+        'SESSION_MODE': os.getenv('SESSION_MODE', 'server'),
+        'SESSION_TOKEN_LIFETIME': os.getenv('SESSION_TOKEN_LIFETIME'),
+        'SESSION_REVOCATION_CHECK_INTERVAL': os.getenv('SESSION_REVOCATION_CHECK_INTERVAL'),
+        'SESSION_REVOCATION_MAX_STALENESS': os.getenv('SESSION_REVOCATION_MAX_STALENESS'),
+        # Space-separated paths (prefixes end in '/') served without a session; default: static files, assets, /health
+        'SESSIONLESS_PATHS': os.getenv('SESSIONLESS_PATHS'),
+        # PAGE_CACHE=0 renders login/register/index through Jinja on every request
+        'PAGE_CACHE': os.getenv('PAGE_CACHE', '1'),
+        # Output of `flask assets-build`; defaults to static/dist
+        'ASSETS_DIR': os.getenv('ASSETS_DIR'),
+        # Azure AD
+        'CLIENT_ID': os.getenv('CLIENT_ID'),
+        'CLIENT_SECRET': os.getenv('CLIENT_SECRET'),
+        'AUTHORITY': os.getenv('AUTHORITY'),
+        'REDIRECT_PATH': os.getenv('REDIRECT_PATH') or '/getAToken',
+        'SCOPE': (os.getenv('SCOPE') or '').split(),
+        # JSON object mapping "groups:<id>" / "roles:<name>" token claims to local role names
+        'AZURE_ROLE_CLAIMS': os.getenv('AZURE_ROLE_CLAIMS'),
+        # JSON list of applications served by this process; see src/applications.py
+        'APPLICATIONS_FILE': os.getenv('APPLICATIONS_FILE'),
+    }
+    # Unset variables are left out rather than set to None, so Flask's and the extensions' defaults apply
+    config = {key: value for key, value in config.items() if value is not None}
+    config.update(overrides or {})
+    return config
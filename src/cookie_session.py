@@ -0,0 +1,341 @@
+"""
+Stateless signed-cookie sessions, selected with SESSION_MODE=cookie.
+
+With the server-side store every request that touches the session costs a
+store read, and another round trip when it changes. In cookie mode the
+session travels in the cookie instead, as a compact signed token
+(itsdangerous, HMAC-SHA256, zlib-compressed when that helps). Besides the
+session data, which for a logged-in user is the principal (user id, login
+method, application...), the token carries a random token id (jti), its
+issue time in milliseconds and the permission version current when it
+was signed. Reading a session is then a signature check, with no I/O.
+
+Tokens are short-lived: they stop verifying SESSION_TOKEN_LIFETIME
+seconds after they were signed, and are re-signed once half of that has
+passed, so active users stay logged in.
+
+A signed token can't be taken back, so logout revokes its jti and an
+account lock revokes every token carrying a login from before the lock.
+The login time is part of the principal, so re-signing never moves it.
+Revocations go to the session_revocation table; each worker mirrors the
+ones younger than the token lifetime in two dicts, polling for new rows
+at most every SESSION_REVOCATION_CHECK_INTERVAL seconds. Older rows can't
+match a live token, so the mirror stays small and rows are purged, by a
+background thread once per token lifetime or with
+`flask session-revocations-purge`.
+
+Polling happens while a session is opened, so it uses a connection of
+its own and leaves the request's transaction alone. When the database
+can't be reached the last list keeps being served, for at most
+SESSION_REVOCATION_MAX_STALENESS seconds; after that opening a session
+fails rather than let a revoked token through.
+
+Tokens are signed, not encrypted. Keys in SERVER_KEYS (the Azure auth
+code flow holding the PKCE verifier and nonce, the redemption ticket)
+are kept in the server-side store, as is a whole session too large for a
+cookie; the token then also carries the store's session id. That only
+happens during an SSO login. The MSAL token cache lives in its own table
+either way.
+"""
+import hashlib
+import logging
+import secrets
+import threading
+import time
+from datetime import timedelta
+
+from flask import Flask, current_app, session
+from flask.sessions import SecureCookieSession, SecureCookieSessionInterface
+from itsdangerous import BadSignature
+from sqlalchemy import delete, insert, select
+
+from . import permissions
+from .models import db, SessionRevocation
+from .principal import session_logins
+
+logger = logging.getLogger(__name__)
+
+SERVER_KEYS = frozenset({'flow', 'redeem_ticket'})
+
+# Browsers keep 4 KB per cookie, name and attributes included
+MAX_TOKEN_BYTES = 3800
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class RevocationList:
+    """Revoked token ids and users younger than the token lifetime, mirrored from session_revocation"""
+
+    def __init__(self, lifetime: float = 900, check_interval: float = 1.0, max_staleness: float = 60.0):
+        self.lifetime_ms = int(lifetime * 1000)
+        self.check_interval = check_interval
+        self.max_staleness = max_staleness
+        self._tokens = {}  # jti -> revoked_at (ms)
+        self._users = {}  # user_id -> latest revoked_at (ms)
+        self._last_id = 0
+        self._checked_at = None
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+        self._purger = None
+        self.refreshes = 0
+        self.failed_refreshes = 0
+        self.purged_rows = 0
+
+    def _refresh_if_stale(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        if self._purger is None:
+            self._start_purger(current_app._get_current_object())
+        horizon = now_ms() - self.lifetime_ms
+        try:
+            # Not db.session: this runs while the session is opened, and mustn't begin or end the request's transaction
+            with db.engine.connect() as connection:
+                rows = connection.execute(
+                    select(SessionRevocation.id, SessionRevocation.jti, SessionRevocation.user_id,
+                           SessionRevocation.revoked_at)
+                    .where(SessionRevocation.id > self._last_id, SessionRevocation.revoked_at > horizon)
+                    .order_by(SessionRevocation.id)
+                ).all()
+        except Exception as e:
+            with self._lock:
+                self.failed_refreshes += 1
+            if self._refreshed_at is None or now - self._refreshed_at > self.max_staleness:
+                raise
+            logger.warning("Session revocation check failed, using the list from %.0f s ago: %s",
+                           now - self._refreshed_at, e)
+            return
+        with self._lock:
+            for row_id, jti, user_id, revoked_at in rows:
+                self._add(jti, user_id, revoked_at)
+                self._last_id = max(self._last_id, row_id)
+            # Forget what can no longer match a live token
+            self._tokens = {jti: at for jti, at in self._tokens.items() if at > horizon}
+            self._users = {user_id: at for user_id, at in self._users.items() if at > horizon}
+            self._refreshed_at = now
+            self.refreshes += 1
+
+    def _start_purger(self, app: Flask):
+        with self._lock:
+            if self._purger is not None:
+                return
+            self._purger = threading.Thread(target=self._purge_forever, args=(app,),
+                                            name='session-revocation-purge', daemon=True)
+        self._purger.start()
+
+    def _purge_forever(self, app: Flask):
+        while True:
+            time.sleep(self.lifetime_ms / 1000)
+            try:
+                with app.app_context():
+                    self.purge()
+            except Exception as e:
+                logger.warning("Session revocation purge failed: %s", e)
+
+    def _add(self, jti, user_id, revoked_at):
+        if jti is not None:
+            self._tokens[jti] = revoked_at
+        if user_id is not None and revoked_at > self._users.get(user_id, 0):
+            self._users[user_id] = revoked_at
+
+    def _revoke(self, jti=None, user_id=None):
+        revoked_at = now_ms()
+        db.session.execute(insert(SessionRevocation).values(jti=jti, user_id=user_id, revoked_at=revoked_at))
+        db.session.commit()
+        # Other workers notice within check_interval; this one at once
+        with self._lock:
+            self._add(jti, user_id, revoked_at)
+
+    def revoke_token(self, jti: str):
+        """Logout: the token with this id, and every re-signed copy of it, stops working"""
+        self._revoke(jti=jti)
+
+    def revoke_user(self, user_id: int):
+        """Account lock: every token the user holds now stops working; later logins are unaffected"""
+        self._revoke(user_id=user_id)
+
+    def is_revoked(self, jti: str, user_id, logged_in_at: int) -> bool:
+        """Whether the token jti, carrying user_id's login from logged_in_at (ms), has been revoked"""
+        self._refresh_if_stale()
+        if jti in self._tokens:
+            return True
+        return user_id in self._users and logged_in_at <= self._users[user_id]
+
+    def purge(self) -> int:
+        """Delete rows older than the token lifetime"""
+        with db.engine.begin() as connection:
+            purged = connection.execute(
+                delete(SessionRevocation).where(SessionRevocation.revoked_at <= now_ms() - self.lifetime_ms)
+            ).rowcount
+        with self._lock:
+            self.purged_rows += purged
+        return purged
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'revoked_tokens': len(self._tokens), 'revoked_users': len(self._users),
+                    'refreshes': self.refreshes, 'failed_refreshes': self.failed_refreshes,
+                    'purged_rows': self.purged_rows}
+
+
+class CookieSession(SecureCookieSession):
+    """The session dict plus the token fields that aren't part of it"""
+
+    def __init__(self, initial=None, jti=None, issued_at=None, sid=None):
+        super().__init__(initial)
+        self.jti = jti or secrets.token_urlsafe(12)
+        # Milliseconds; None until the session has been signed
+        self.issued_at = issued_at
+        # Server-side store id, while part of the session lives there
+        self.sid = sid
+
+
+class CookieSessionInterface(SecureCookieSessionInterface):
+    """Signed-token sessions, with the server-side interface ``server`` for what can't go in the cookie"""
+
+    salt = 'auth-session'
+    digest_method = staticmethod(hashlib.sha256)
+    session_class = CookieSession
+
+    def __init__(self, server, revocations: RevocationList, lifetime: float = 900):
+        self.server = server
+        self.revocations = revocations
+        self.lifetime = lifetime
+        self._lock = threading.Lock()
+        self.issued = 0
+        self.rejected = 0
+        self.revoked = 0
+        self.server_reads = 0
+        self.server_writes = 0
+
+    def open_session(self, app: Flask, request):
+        serializer = self.get_signing_serializer(app)
+        if serializer is None:
+            return None
+        token = request.cookies.get(self.get_cookie_name(app))
+        if not token:
+            return self.session_class()
+        try:
+            data, jti, issued_at, version, sid = serializer.loads(token, max_age=self.lifetime)
+        except (BadSignature, ValueError):
+            # Expired, tampered with, or a server-side session id from before the switch
+            with self._lock:
+                self.rejected += 1
+            return self.session_class()
+        # One token can carry a login to each application on the host. An account lock is checked against
+        # the login time, which re-signing leaves alone, not issued_at: a worker that hasn't seen the lock
+        # yet may re-sign the token, and that must not make it outlive the lock.
+        logins = session_logins(data) or [(None, None)]
+        if any(self.revocations.is_revoked(jti, user_id, logged_in_at or 0) for user_id, logged_in_at in logins):
+            with self._lock:
+                self.revoked += 1
+            return self.session_class()
+        permissions.engine.saw_version(version)
+        if sid:
+            server_data = self.server._retrieve_session_data(self.server._get_store_id(sid))
+            with self._lock:
+                self.server_reads += 1
+            # Gone from the store (expired): carry on with what the cookie holds
+            data.update(server_data or {})
+        return self.session_class(data, jti=jti, issued_at=issued_at, sid=sid)
+
+    def save_session(self, app: Flask, session: CookieSession, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session:
+            if session.modified:
+                if session.sid:
+                    self.server._delete_session(self.server._get_store_id(session.sid))
+                response.delete_cookie(name, domain=domain, path=path, secure=secure, samesite=samesite,
+                                       httponly=httponly)
+                response.vary.add('Cookie')
+            return
+
+        issued_at = now_ms()
+        stale = session.issued_at is None or issued_at - session.issued_at >= self.lifetime * 500
+        if not session.modified and not stale:
+            return
+
+        serializer = self.get_signing_serializer(app)
+        version = permissions.engine.version or 0
+        cookie_data = {key: value for key, value in session.items() if key not in SERVER_KEYS}
+        server_data = {key: value for key, value in session.items() if key in SERVER_KEYS}
+        sid = session.sid or secrets.token_urlsafe(32)
+        token = serializer.dumps([cookie_data, session.jti, issued_at, version, sid if server_data else None])
+        if len(token) > MAX_TOKEN_BYTES:
+            server_data = dict(session)
+            token = serializer.dumps([{}, session.jti, issued_at, version, sid])
+
+        if server_data:
+            self.server._upsert_session(timedelta(seconds=self.lifetime),
+                                        self.server.session_class(server_data, sid=sid),
+                                        self.server._get_store_id(sid))
+            with self._lock:
+                self.server_writes += 1
+        elif session.sid:
+            self.server._delete_session(self.server._get_store_id(session.sid))
+
+        response.set_cookie(name, token, expires=self.get_expiration_time(app, session), httponly=httponly,
+                            domain=domain, path=path, secure=secure, samesite=samesite)
+        response.vary.add('Cookie')
+        with self._lock:
+            self.issued += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {'issued': self.issued, 'rejected': self.rejected, 'revoked': self.revoked,
+                     'server_reads': self.server_reads, 'server_writes': self.server_writes}
+        stats.update(self.revocations.stats())
+        return stats
+
+
+def init_session_revocations(app: Flask):
+    """The revocation list both session modes check logins against.
+
+    Server-side sessions slide their expiry, so there a lock is kept for
+    the whole session lifetime: a session idle that long has expired, and
+    one used sooner drops the revoked login on that use.
+    """
+    settings = app.config
+    if (settings.get('SESSION_MODE') or 'server').lower() == 'cookie':
+        lifetime = float(settings.get('SESSION_TOKEN_LIFETIME') or 900)
+    else:
+        lifetime = app.permanent_session_lifetime.total_seconds()
+    app.extensions['session_revocations'] = RevocationList(
+        lifetime=lifetime, check_interval=float(settings.get('SESSION_REVOCATION_CHECK_INTERVAL') or 1.0),
+        max_staleness=float(settings.get('SESSION_REVOCATION_MAX_STALENESS') or 60.0))
+
+
+def init_cookie_session(app: Flask):
+    """Put the signed-cookie interface in front of the server-side one already installed"""
+    lifetime = float(app.config.get('SESSION_TOKEN_LIFETIME') or 900)
+    interface = CookieSessionInterface(app.session_interface, app.extensions['session_revocations'],
+                                       lifetime=lifetime)
+    app.extensions['cookie_sessions'] = interface
+    app.session_interface = interface
+
+
+def revoke_current_session():
+    """On logout, before the session is cleared: the current token stops working everywhere"""
+    interface = current_app.extensions.get('cookie_sessions')
+    if interface is not None and isinstance(session, CookieSession) and session.issued_at is not None:
+        interface.revocations.revoke_token(session.jti)
+        # Whatever the session goes on to hold (flash messages) is signed under a new id
+        session.jti = secrets.token_urlsafe(12)
+
+
+def revoke_user_sessions(user_id: int):
+    """When an account is locked: every current login of the user stops working, in either session mode"""
+    revocations = current_app.extensions.get('session_revocations')
+    if revocations is not None:
+        revocations.revoke_user(user_id)
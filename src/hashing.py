@@ -0,0 +1,275 @@
+"""
+Password hashing service.
+
+PBKDF2 is CPU bound and holds the GIL, so hashing on the request thread
+stalls every other request in the worker. Hashes are computed in a small
+process pool behind a bounded admission queue: when the queue is full the
+caller gets HasherBusy right away and can answer "busy, retry" instead of
+piling up more work.
+
+Stored hashes use werkzeug's self-describing format,
+``<scheme>:<params>$<salt>$<hash>`` (e.g. ``pbkdf2:sha256:600000$...`` or
+``scrypt:32768:8:1$...``), so the method prefix versions every hash. A hash
+whose prefix differs from the configured method is upgraded on the next
+successful login.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full or a hash took too long"""
+
+
+def build_method(algorithm: str = 'pbkdf2:sha256', iterations=None) -> str:
+    """Build a werkzeug hash method string, e.g. pbkdf2:sha256:600000"""
+    if iterations and algorithm.startswith('pbkdf2') and algorithm.count(':') == 1:
+        return f'{algorithm}:{int(iterations)}'
+    return algorithm
+
+
+def normalize_method(method: str) -> str:
+    """Fill in werkzeug's defaults so equivalent methods compare equal"""
+    name, *args = method.split(':')
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    if name == 'scrypt':
+        n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+        return f'scrypt:{n}:{r}:{p}'
+    return method
+
+
+def hash_method(pwhash: str) -> str:
+    """Return the method prefix of a stored hash"""
+    return pwhash.split('$', 1)[0]
+
+
+class PasswordHasher:
+    """Hash and verify passwords off the request thread with admission control"""
+
+    def __init__(self, method: str = 'pbkdf2:sha256', workers: int = 2,
+                 max_pending: int = 16, timeout: float = 10.0):
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # Runs rehash_in_background's on_done, off the pool's result-delivery thread
+        self._saver = None
+        self._stats_lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._failed = 0
+        self._timed_out = 0
+        self._rejected = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._recent = deque(maxlen=256)
+
+    @classmethod
+    def from_env(cls, env=None) -> 'PasswordHasher':
+        """Build the hasher from PASSWORD_HASH_* and HASH_POOL_* settings (default: os.environ)"""
+        env = os.environ if env is None else env
+        return cls(
+            method=build_method(env.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256'),
+                                env.get('PASSWORD_HASH_ITERATIONS')),
+            workers=int(env.get('HASH_POOL_WORKERS', 2)),
+            max_pending=int(env.get('HASH_POOL_MAX_PENDING', 16)),
+            timeout=float(env.get('HASH_POOL_TIMEOUT', 10)),
+        )
+
+    def _executor(self):
+        # Created on first use so gunicorn forks workers before any pool exists.
+        # Spawn rather than fork, because forking a threaded worker is unsafe.
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def _saver_thread(self):
+        if self._saver is None:
+            with self._pool_lock:
+                if self._saver is None:
+                    self._saver = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rehash-save')
+        return self._saver
+
+    def _release(self, _future=None):
+        with self._stats_lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def _record(self, started: float, outcome: str):
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            if outcome == 'failed':
+                self._failed += 1
+            elif outcome == 'timed_out':
+                self._timed_out += 1
+            else:
+                # Latency covers successful hashes only, so errors and timeouts don't skew it
+                self._completed += 1
+                self._latency_total += elapsed
+                self._latency_max = max(self._latency_max, elapsed)
+                self._recent.append(elapsed)
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._rejected += 1
+            raise HasherBusy('Password hashing queue is full')
+        with self._stats_lock:
+            self._pending += 1
+        started = time.perf_counter()
+        if self.workers <= 0:
+            # Inline mode for development and tests
+            try:
+                result = func(*args)
+            except Exception:
+                self._record(started, 'failed')
+                raise
+            finally:
+                self._release()
+            self._record(started, 'completed')
+            return result
+        try:
+            future = self._executor().submit(func, *args)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is held until the job finishes, not until the caller gives
+        # up on it: cancel() can't stop a hash a worker process has started
+        future.add_done_callback(self._release)
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            self._record(started, 'timed_out')
+            raise HasherBusy('Password hashing timed out')
+        except Exception:
+            self._record(started, 'failed')
+            raise
+        self._record(started, 'completed')
+        return result
+
+    def hash(self, password: str, method=None) -> str:
+        """Hash a password with the configured (or given) method"""
+        return self._run(generate_password_hash, password, method or self.method)
+
+    def verify(self, pwhash: str, password: str) -> bool:
+        """Check a password against a stored hash"""
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """True when a stored hash was made with outdated scheme or parameters"""
+        return normalize_method(hash_method(pwhash)) != normalize_method(self.method)
+
+    def rehash_in_background(self, password: str, on_done):
+        """Hash password with the current method off-thread, then call on_done(new_hash).
+
+        Upgrades are best effort: if the queue is full the upgrade is skipped
+        and simply retried on the user's next login. on_done runs on a
+        separate thread: done-callbacks run on the pool's result thread, and
+        a slow commit there would hold up every other caller's result.
+        """
+        if not self._slots.acquire(blocking=False):
+            return False
+
+        def finish(new_hash):
+            try:
+                on_done(new_hash)
+            finally:
+                self._slots.release()
+
+        if self.workers <= 0:
+            finish(generate_password_hash(password, self.method))
+            return True
+        future = self._executor().submit(generate_password_hash, password, self.method)
+
+        def callback(f):
+            if f.cancelled() or f.exception() is not None:
+                self._slots.release()
+                return
+            try:
+                self._saver_thread().submit(finish, f.result())
+            except RuntimeError:
+                # Shutting down
+                self._slots.release()
+
+        future.add_done_callback(callback)
+        return True
+
+    def stats(self) -> dict:
+        """Queue depth and per-hash latency (seconds) for monitoring"""
+        with self._stats_lock:
+            recent = sorted(self._recent)
+            return {
+                'queue_depth': self._pending,
+                'max_pending': self.max_pending,
+                'completed': self._completed,
+                'failed': self._failed,
+                'timed_out': self._timed_out,
+                'rejected': self._rejected,
+                'latency_avg': self._latency_total / self._completed if self._completed else 0.0,
+                'latency_max': self._latency_max,
+                'latency_p95': recent[int(len(recent) * 0.95)] if recent else 0.0,
+            }
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            if self._saver is not None:
+                self._saver.shutdown(wait=False)
+                self._saver = None
+
+
+def benchmark_schemes(target_ms: float = 250.0, samples: int = 3) -> list:
+    """Time verify per scheme on this machine and recommend parameters for target_ms.
+
+    PBKDF2 cost is linear in iterations and scrypt cost is roughly linear in
+    N, so each scheme is timed at a reference cost and scaled to the budget.
+    Returns a list of dicts with the reference timing and recommended method.
+    """
+    def time_verify(method):
+        pwhash = generate_password_hash('benchmark-password', method)
+        best = float('inf')
+        for _ in range(samples):
+            started = time.perf_counter()
+            check_password_hash(pwhash, 'benchmark-password')
+            best = min(best, time.perf_counter() - started)
+        return best * 1000
+
+    results = []
+    for hash_name in ('sha256', 'sha512'):
+        reference = 100_000
+        ms = time_verify(f'pbkdf2:{hash_name}:{reference}')
+        iterations = max(int(reference * target_ms / ms) // 10_000 * 10_000, 10_000)
+        method = f'pbkdf2:{hash_name}:{iterations}'
+        results.append({'scheme': f'pbkdf2:{hash_name}', 'reference': f'pbkdf2:{hash_name}:{reference}',
+                        'reference_ms': ms, 'recommended': method, 'estimated_ms': ms * iterations / reference})
+
+    reference_n = 2 ** 14
+    ms = time_verify(f'scrypt:{reference_n}:8:1')
+    n = reference_n
+    # N must be a power of two; memory use is 128 * N * r bytes
+    while n * 2 * ms / reference_n <= target_ms and n < 2 ** 20:
+        n *= 2
+    while n > 2 ** 10 and n * ms / reference_n > target_ms:
+        n //= 2
+    results.append({'scheme': 'scrypt', 'reference': f'scrypt:{reference_n}:8:1', 'reference_ms': ms,
+                    'recommended': f'scrypt:{n}:8:1', 'estimated_ms': ms * n / reference_n})
+    return results
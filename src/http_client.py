@@ -0,0 +1,137 @@
+"""
+Shared keep-alive HTTP transport for outbound identity-provider calls.
+
+MSAL accepts any requests.Session-like object as its http_client. We hand
+every MSAL app the same pooled session so TLS handshakes are amortised
+across logins, every call has a connect/read timeout, and transient
+failures get a small, bounded number of retries.
+"""
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+
+class TransportStats:
+    """Connection-reuse counters for monitoring"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.errors = 0
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'connections_opened': self.connections_opened,
+                # Every request that did not need a new connection reused one
+                'connections_reused': max(self.requests - self.connections_opened, 0),
+                'errors': self.errors,
+            }
+
+
+def _counting_pool(base, stats):
+    # urllib3 reconnects dropped connections in place, so count socket
+    # connects rather than connection objects
+    class CountingConnection(base.ConnectionCls):
+        def connect(self):
+            stats.incr('connections_opened')
+            return super().connect()
+
+    class CountingPool(base):
+        ConnectionCls = CountingConnection
+
+    CountingPool.__name__ = 'Counting' + base.__name__
+    return CountingPool
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that counts requests and newly opened connections"""
+
+    def __init__(self, stats: TransportStats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool(HTTPConnectionPool, self.stats),
+            'https': _counting_pool(HTTPSConnectionPool, self.stats),
+        }
+
+    def send(self, request, **kwargs):
+        self.stats.incr('requests')
+        try:
+            return super().send(request, **kwargs)
+        except requests.RequestException:
+            self.stats.incr('errors')
+            raise
+
+
+class IdpSession(requests.Session):
+    """requests.Session with a default (connect, read) timeout on every call"""
+
+    def __init__(self, timeout, stats: TransportStats):
+        super().__init__()
+        self.timeout = timeout
+        self.stats = stats
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        # A configured CA bundle must win over REQUESTS_CA_BUNDLE from the environment
+        kwargs.setdefault('verify', self.verify)
+        return super().request(method, url, **kwargs)
+
+
+def build_http_client(pool_connections=4, pool_maxsize=10, connect_timeout=3.05,
+                      read_timeout=10.0, retries=2, backoff_factor=0.3, verify=True) -> IdpSession:
+    """Build a pooled session suitable for passing to MSAL as http_client"""
+    stats = TransportStats()
+    session = IdpSession((connect_timeout, read_timeout), stats)
+    session.verify = verify
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 502, 503, 504),
+        # Auth codes are single use, so a POST is only retried when the
+        # connection failed before the request was sent
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = CountingHTTPAdapter(
+        stats,
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=retry,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def build_http_client_from_env(env=None) -> IdpSession:
+    """Build the shared identity-provider session from IDP_HTTP_* settings (default: os.environ)"""
+    env = os.environ if env is None else env
+    verify = env.get('IDP_HTTP_CA_BUNDLE') or True
+    return build_http_client(
+        pool_connections=int(env.get('IDP_HTTP_POOL_CONNECTIONS', 4)),
+        pool_maxsize=int(env.get('IDP_HTTP_POOL_MAXSIZE', 10)),
+        connect_timeout=float(env.get('IDP_HTTP_CONNECT_TIMEOUT', 3.05)),
+        read_timeout=float(env.get('IDP_HTTP_READ_TIMEOUT', 10)),
+        retries=int(env.get('IDP_HTTP_RETRIES', 2)),
+        backoff_factor=float(env.get('IDP_HTTP_BACKOFF', 0.3)),
+        verify=verify,
+    )
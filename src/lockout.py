@@ -0,0 +1,175 @@
+"""
+Failed-login lockout tracking.
+
+Bumping a counter on the user row for every wrong password serialises on
+that row during a credential-stuffing attack. Failures are instead kept
+in a small SQLite file next to the app (shared by every worker on the
+host), counted over a sliding window, and only the lock itself is written
+to the main database, once, when the threshold is crossed. Locked
+usernames are remembered in memory so repeat attempts are turned away
+before any database lookup or password hashing.
+
+User.locked_at stays the source of truth. The host-local record of a
+lock is only a cache that expires after locked_ttl seconds; the next
+attempt then looks at the user row again. So an unlock done on another
+host takes effect here within locked_ttl.
+
+Usernames are only unique per realm, so the tracker is keyed by
+attempt_key(realm, username).
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import update
+
+from .models import db, User, username_key
+
+LOCKED_MESSAGE = 'This account is locked. Please contact the website administrator to unlock it.'
+
+
+class LoginAttemptTracker:
+    """Sliding-window failed-login counter backed by a host-local SQLite file"""
+
+    def __init__(self, path: str, max_failures: int = 10, window: float = 24 * 3600,
+                 locked_refresh: float = 5.0, locked_ttl: float = 60.0, prune_interval: float = 600.0):
+        self.path = path
+        self.max_failures = max_failures
+        self.window = window
+        self.locked_refresh = locked_refresh
+        self.locked_ttl = locked_ttl
+        self.prune_interval = prune_interval
+        self._pruned_at = time.monotonic()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._locked = {}  # username -> when the lock was cached (time.time())
+        self._locked_loaded_at = 0.0
+        self.blocked_attempts = 0
+        self.failures = 0
+        self.locks = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn().executescript('''
+            CREATE TABLE IF NOT EXISTS failures (
+                username TEXT NOT NULL,
+                ts REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_failures_username_ts ON failures (username, ts);
+            -- Older files kept locks here for good; they are re-learned from the user rows
+            DROP TABLE IF EXISTS locked;
+            CREATE TABLE IF NOT EXISTS locked_cache (
+                username TEXT PRIMARY KEY,
+                cached_at REAL NOT NULL
+            ) WITHOUT ROWID;
+        ''')
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _refresh_locked(self):
+        now = time.monotonic()
+        if now - self._locked_loaded_at < self.locked_refresh:
+            return
+        locked = dict(self._conn().execute(
+            'SELECT username, cached_at FROM locked_cache WHERE cached_at > ?', (time.time() - self.locked_ttl,)))
+        with self._lock:
+            self._locked = locked
+            self._locked_loaded_at = now
+
+    def is_locked(self, username: str) -> bool:
+        """Cheap pre-check; counts the attempt as blocked when locked"""
+        self._refresh_locked()
+        cached_at = self._locked.get(username)
+        if cached_at is not None and time.time() - cached_at < self.locked_ttl:
+            with self._lock:
+                self.blocked_attempts += 1
+            return True
+        return False
+
+    def mark_locked(self, username: str, blocked: bool = False):
+        """Remember a lock (e.g. one found on the user row) for every worker on this host, for locked_ttl"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute('INSERT OR REPLACE INTO locked_cache (username, cached_at) VALUES (?, ?)', (username, now))
+        conn.execute('DELETE FROM failures WHERE username = ?', (username,))
+        with self._lock:
+            self._locked[username] = now
+            if blocked:
+                self.blocked_attempts += 1
+
+    def record_failure(self, username: str) -> bool:
+        """Record a wrong password; returns True when this failure crosses the threshold"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute('INSERT INTO failures (username, ts) VALUES (?, ?)', (username, now))
+        count = conn.execute(
+            'SELECT COUNT(*) FROM failures WHERE username = ? AND ts > ?',
+            (username, now - self.window)).fetchone()[0]
+        with self._lock:
+            self.failures += 1
+            prune = time.monotonic() - self._pruned_at >= self.prune_interval
+            if prune:
+                self._pruned_at = time.monotonic()
+        if prune:
+            # Failures of users who stay under the threshold would otherwise pile up forever
+            self.prune()
+        if count < self.max_failures:
+            return False
+        self.mark_locked(username)
+        with self._lock:
+            self.locks += 1
+        return True
+
+    def reset(self, username: str):
+        """Forget failures after a successful login (no write when there were none)"""
+        conn = self._conn()
+        if conn.execute('SELECT 1 FROM failures WHERE username = ? LIMIT 1', (username,)).fetchone():
+            conn.execute('DELETE FROM failures WHERE username = ?', (username,))
+
+    def unlock(self, username: str):
+        conn = self._conn()
+        conn.execute('DELETE FROM locked_cache WHERE username = ?', (username,))
+        conn.execute('DELETE FROM failures WHERE username = ?', (username,))
+        with self._lock:
+            self._locked.pop(username, None)
+
+    def prune(self) -> int:
+        """Drop failures older than the window, and expired lock records; run from record_failure"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute('DELETE FROM locked_cache WHERE cached_at <= ?', (now - self.locked_ttl,))
+        return conn.execute('DELETE FROM failures WHERE ts <= ?', (now - self.window,)).rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'blocked_attempts': self.blocked_attempts, 'failures': self.failures,
+                    'locks': self.locks, 'locked_users': len(self._locked)}
+
+
+def attempt_key(realm: str, username: str) -> str:
+    """Tracker key for a username within a realm (realm names never contain ':'); ignores case"""
+    return f'{realm}:{username_key(username)}'
+
+
+def lock_user(user_id: int):
+    """Persist the lock on the user row; only called when the threshold is crossed"""
+    db.session.execute(
+        update(User)
+        .where(User.id == user_id, User.locked_at.is_(None))
+        .values(locked_at=datetime.now(timezone.utc))
+    )
+    db.session.commit()
+
+
+def unlock_user(user: User, tracker: LoginAttemptTracker):
+    """Admin action: clear the lock on the row and in the local store"""
+    user.locked_at = None
+    db.session.commit()
+    tracker.unlock(attempt_key(user.realm, user.username))
@@ -0,0 +1,254 @@
+"""
+Request, database and auth-stage metrics in Prometheus text format.
+
+Every thread records into its own shard (a plain dict only that thread
+writes to), so observing a value takes no lock; a scrape sums the shards.
+Shards of threads that have exited are folded into one retired shard, so
+thread-per-request servers don't grow the shard list without bound.
+
+What is recorded:
+
+    http_request_duration_seconds    per endpoint, method and status
+    db_queries_per_request           per endpoint
+    db_query_seconds_per_request     per endpoint
+    db_query_duration_seconds        every SQL statement
+    auth_stage_duration_seconds      password_hash, password_verify, token_exchange,
+                                     id_token_validation, session_load, session_save
+
+Service stats (hasher, username index, lockout, write-behind, redemption
+pool, IdP transport, OIDC cache, permissions) are added as gauges at
+scrape time. log_event() replaces ad-hoc prints with sampled, structured
+log lines written off the request thread.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Request latency', ('endpoint', 'method', 'status'), LATENCY_BUCKETS),
+    'db_queries_per_request': ('SQL statements per request', ('endpoint',), COUNT_BUCKETS),
+    'db_query_seconds_per_request': ('Time spent in SQL per request', ('endpoint',), LATENCY_BUCKETS),
+    'db_query_duration_seconds': ('SQL statement latency', (), LATENCY_BUCKETS),
+    'auth_stage_duration_seconds': ('Latency of each authentication stage', ('stage',), LATENCY_BUCKETS),
+}
+
+ENDPOINT_KEY = 'metrics.endpoint'
+
+# [queries, seconds] for the request being served on this thread/context
+_request_queries = ContextVar('metrics_request_queries', default=None)
+
+events = logging.getLogger('src.events')
+
+
+class Metrics:
+    """Histograms kept in per-thread shards; scrape with render()"""
+
+    def __init__(self, histograms=None, compact_every: int = 256):
+        self.histograms = dict(HISTOGRAMS if histograms is None else histograms)
+        self.compact_every = compact_every
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+                if len(self._shards) % self.compact_every == 0:
+                    self._compact()
+        return shard
+
+    def _compact(self):
+        # Called with the lock held; exited threads can't write to their shards any more
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                _merge(self._retired, shard)
+        self._shards = live
+
+    def observe(self, name: str, value: float, *labels):
+        """Add one observation to histogram name; labels in the family's label order"""
+        shard = self._shard()
+        key = (name, labels)
+        series = shard.get(key)
+        if series is None:
+            # One slot per bucket, one for +Inf, then the running sum
+            series = shard[key] = [0] * (len(self.histograms[name][2]) + 2)
+        series[bisect_left(self.histograms[name][2], value)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def timer(self, name: str, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, *labels)
+
+    def stage(self, stage: str):
+        """Time one authentication stage, e.g. with metrics.stage('password_verify'):"""
+        return self.timer('auth_stage_duration_seconds', stage)
+
+    def collect(self) -> dict:
+        """Sum of every shard: {(name, labels): [bucket counts..., +Inf count, sum]}"""
+        with self._lock:
+            self._compact()
+            totals = {key: list(series) for key, series in self._retired.items()}
+            shards = [shard for _, shard in self._shards]
+        for shard in shards:
+            # Copy first; the owning thread may add series while we read
+            _merge(totals, dict(shard))
+        return totals
+
+    def render(self, gauges=None) -> str:
+        """Prometheus text exposition of the histograms plus {name: value} gauges"""
+        totals = self.collect()
+        lines = []
+        for name, (help_text, label_names, buckets) in self.histograms.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (series_name, labels), series in sorted(totals.items()):
+                if series_name != name:
+                    continue
+                pairs = [f'{k}="{_escape(v)}"' for k, v in zip(label_names, labels)]
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), series):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else repr(float(bound))
+                    bucket_labels = ','.join(pairs + [f'le="{le}"'])
+                    lines.append(f'{name}_bucket{{{bucket_labels}}} {cumulative}')
+                label_text = '{' + ','.join(pairs) + '}' if pairs else ''
+                lines.append(f'{name}_sum{label_text} {series[-1]}')
+                lines.append(f'{name}_count{label_text} {cumulative}')
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _merge(into: dict, shard: dict):
+    for key, series in shard.items():
+        target = into.get(key)
+        if target is None:
+            into[key] = list(series)
+        else:
+            for i, value in enumerate(series):
+                target[i] += value
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def stats_gauges(prefix: str, stats: dict) -> dict:
+    """Turn a component's stats() dict into gauges, skipping anything non-numeric"""
+    return {f'{prefix}_{key}': float(value) for key, value in stats.items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)}
+
+
+class MetricsMiddleware:
+    """WSGI middleware timing every request and counting its SQL statements"""
+
+    def __init__(self, wsgi_app, metrics: Metrics):
+        self.wsgi_app = wsgi_app
+        self.metrics = metrics
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        queries = [0, 0.0]
+        token = _request_queries.set(queries)
+        status = ['500']
+
+        def recording_start_response(status_line, headers, exc_info=None):
+            status[0] = status_line.split(' ', 1)[0]
+            return start_response(status_line, headers, exc_info)
+
+        try:
+            return self.wsgi_app(environ, recording_start_response)
+        finally:
+            _request_queries.reset(token)
+            endpoint = environ.get(ENDPOINT_KEY) or 'unmatched'
+            metrics = self.metrics
+            metrics.observe('http_request_duration_seconds', time.perf_counter() - started,
+                            endpoint, environ.get('REQUEST_METHOD', ''), status[0])
+            metrics.observe('db_queries_per_request', queries[0], endpoint)
+            metrics.observe('db_query_seconds_per_request', queries[1], endpoint)
+
+
+def instrument_engine(engine, metrics: Metrics):
+    """Time every SQL statement on engine and charge it to the current request"""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_started'].pop()
+        metrics.observe('db_query_duration_seconds', elapsed)
+        queries = _request_queries.get()
+        if queries is not None:
+            queries[0] += 1
+            queries[1] += elapsed
+
+
+class TimedSessionInterface:
+    """Wraps the app's session interface to time session load and save"""
+
+    def __init__(self, inner, metrics: Metrics):
+        self.inner = inner
+        self.metrics = metrics
+
+    def open_session(self, app, request):
+        with self.metrics.stage('session_load'):
+            return self.inner.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        with self.metrics.stage('session_save'):
+            return self.inner.save_session(app, session, response)
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+def log_event(event_name: str, sample: float = 1.0, level: int = logging.INFO, **fields):
+    """Log one structured event as a JSON line; sample < 1 keeps only that fraction"""
+    if sample < 1.0 and random.random() >= sample:
+        return
+    if not events.isEnabledFor(level):
+        return
+    events.log(level, json.dumps(dict(event=event_name, **fields), default=str, sort_keys=True))
+
+
+def init_event_logging(stream=None):
+    """Write events from a background thread so request threads never block on the log stream"""
+    if events.handlers:
+        return None
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, handler)
+    events.addHandler(logging.handlers.QueueHandler(records))
+    events.setLevel(logging.INFO)
+    events.propagate = False
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -1,18 +1,47 @@
 from datetime import datetime
 from typing import Optional
-from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String, DateTime, Integer, func
+from sqlalchemy.orm import Mapped, mapped_column, validates
+from sqlalchemy import BigInteger, String, DateTime, Index, Integer, SmallInteger, Text, ForeignKey, UniqueConstraint, func, select, text, update
 from flask_sqlalchemy import SQLAlchemy
 
 # Initialize SQLAlchemy with type support
 db = SQLAlchemy()
 
+# Realm of users created before there were several applications
+DEFAULT_REALM = 'default'
+REALM_LENGTH = 50
+
+
+def username_key(username: str) -> str:
+    """Normalized form usernames are looked up and kept unique by.
+
+    lower() rather than casefold() so the key stays within the column
+    length and matches SQL lower(), which the migration backfilled with.
+    """
+    return username.lower()
+
+
 class User(db.Model):
     __tablename__ = 'user'
+    __table_args__ = (
+        # Usernames are unique per realm, ignoring case; each application has its own realm unless configured to share one
+        UniqueConstraint('realm', 'username_key', name='uq_user_realm_username_key'),
+        # Active usernames for the username index, read from this index alone (SQLite only counts a
+        # partial index as covering if the columns in its WHERE are in it too, hence is_active)
+        Index('ix_user_active_username_key', 'realm', 'username_key', 'is_active',
+              sqlite_where=text('is_active IS 1'), postgresql_where=text('is_active IS TRUE')),
+        # Returning SSO users are found by their immutable Azure AD object id
+        UniqueConstraint('realm', 'oid', name='uq_user_realm_oid'),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    username: Mapped[str] = mapped_column(String(80), unique=True, nullable=False)
-    password: Mapped[str] = mapped_column(String(120), nullable=False)
+    realm: Mapped[str] = mapped_column(String(REALM_LENGTH), nullable=False, default=DEFAULT_REALM, server_default=DEFAULT_REALM)
+    username: Mapped[str] = mapped_column(String(80), nullable=False)
+    # username_key(username); filled in on insert (bulk inserts too) and kept in step by the validator below
+    username_key: Mapped[str] = mapped_column(
+        String(80), nullable=False,
+        default=lambda context: username_key(context.get_current_parameters()['username']))
+    password: Mapped[str] = mapped_column(String(255), nullable=False)
     display_name: Mapped[str] = mapped_column(String(50), nullable=False)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
@@ -27,15 +56,28 @@ class User(db.Model):
         DateTime(timezone=True),
         nullable=False,
         server_default=func.now(),
-        onupdate=func.now()
+        onupdate=func.now(),
+        # The admin search index polls for users changed since it last looked
+        index=True
     )
     created_by: Mapped[Optional[str]] = mapped_column(String(80), nullable=True)
     updated_by: Mapped[Optional[str]] = mapped_column(String(80), nullable=True)
     is_active: Mapped[bool] = mapped_column(default=True, nullable=False, server_default="1")
+    # Set when too many wrong passwords were tried; cleared by an admin
+    locked_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Azure AD object id, stored on the first SSO login
+    oid: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    # Hash of the id_token claims last applied to this row (see claims_sync.py)
+    claims_fingerprint: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
     
     def __repr__(self) -> str:
         return f'<User {self.username}>'
 
+    @validates('username')
+    def _set_username_key(self, key, username):
+        self.username_key = username_key(username)
+        return username
+
     @staticmethod
     def validate_registration(username: str, password: str, display_name: str) -> tuple[bool, str]:
         """Validate registration input fields"""
@@ -51,4 +93,128 @@ class User(db.Model):
             return False, "Password must be less than 120 characters"
         if len(display_name) > 50:
             return False, "Display name must be less than 50 characters"
-        return True, ""
\ No newline at end of file
+        return True, ""
+
+
+class CacheVersion(db.Model):
+    """Version stamps that let each worker know when its in-memory caches are stale"""
+    __tablename__ = 'cache_version'
+
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        return f'<CacheVersion {self.name}={self.version}>'
+
+    @staticmethod
+    def current(name: str) -> int:
+        """Read a version stamp (0 if it was never bumped)"""
+        version = db.session.execute(
+            select(CacheVersion.version).where(CacheVersion.name == name)
+        ).scalar_one_or_none()
+        return version or 0
+
+    @staticmethod
+    def bump(name: str) -> None:
+        """Increment a version stamp as part of the current transaction"""
+        result = db.session.execute(
+            update(CacheVersion)
+            .where(CacheVersion.name == name)
+            .values(version=CacheVersion.version + 1)
+        )
+        if result.rowcount == 0:
+            db.session.add(CacheVersion(name=name, version=1))
+
+
+
+class TokenCacheEntry(db.Model):
+    """Serialized MSAL token cache for one Azure user, kept out of the session"""
+    __tablename__ = 'token_cache'
+
+    # The user's oid, prefixed with the realm outside the default one (Application.token_cache_key)
+    oid: Mapped[str] = mapped_column(String(128), primary_key=True)
+    data: Mapped[str] = mapped_column(Text, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now(),
+        index=True
+    )
+
+    def __repr__(self) -> str:
+        return f'<TokenCacheEntry {self.oid}>'
+
+
+
+class Role(db.Model):
+    __tablename__ = 'role'
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String(80), unique=True, nullable=False)
+    description: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+
+    def __repr__(self) -> str:
+        return f'<Role {self.name}>'
+
+
+class UserRole(db.Model):
+    __tablename__ = 'user_role'
+
+    user_id: Mapped[int] = mapped_column(ForeignKey('user.id'), primary_key=True)
+    role_id: Mapped[int] = mapped_column(ForeignKey('role.id'), primary_key=True, index=True)
+
+
+class Grant(db.Model):
+    """Access level a role has on a route (endpoint name) or a field ("model.column")"""
+    __tablename__ = 'grant'
+    __table_args__ = (UniqueConstraint('role_id', 'resource_type', 'resource', name='uq_grant_role_resource'),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    role_id: Mapped[int] = mapped_column(ForeignKey('role.id'), nullable=False)
+    resource_type: Mapped[str] = mapped_column(String(10), nullable=False)  # 'route' or 'field'
+    resource: Mapped[str] = mapped_column(String(120), nullable=False)
+    level: Mapped[int] = mapped_column(SmallInteger, nullable=False)  # 0 hide, 1 view, 2 edit
+
+    def __repr__(self) -> str:
+        return f'<Grant {self.resource_type}:{self.resource}={self.level}>'
+
+
+class AuthEvent(db.Model):
+    """One authentication event (see audit.py); rows are only ever inserted, and purged by age"""
+    __tablename__ = 'auth_event'
+    __table_args__ = (
+        # "Last N events for user X", by id and by username (attempts that never looked the user up)
+        Index('ix_auth_event_user_id_ts', 'user_id', 'ts'),
+        Index('ix_auth_event_realm_username_key_ts', 'realm', 'username_key', 'ts'),
+        # "Failures per minute", and retention by age
+        Index('ix_auth_event_kind_ts', 'kind', 'ts'),
+    )
+
+    # Kept small: integer milliseconds instead of a datetime, an event code instead of a name
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
+    ts: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    kind: Mapped[int] = mapped_column(SmallInteger, nullable=False)
+    realm: Mapped[str] = mapped_column(String(REALM_LENGTH), nullable=False)
+    # No foreign key: users are never deleted, and failures for unknown usernames have no user
+    user_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    username_key: Mapped[Optional[str]] = mapped_column(String(80), nullable=True)
+    ip: Mapped[Optional[str]] = mapped_column(String(45), nullable=True)
+
+    def __repr__(self) -> str:
+        return f'<AuthEvent {self.kind} user={self.user_id} ts={self.ts}>'
+
+
+class SessionRevocation(db.Model):
+    """A revoked session token (jti) or all of a user's tokens signed before revoked_at; see cookie_session.py"""
+    __tablename__ = 'session_revocation'
+
+    # Workers poll for rows with a higher id than they have seen
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
+    jti: Mapped[Optional[str]] = mapped_column(String(16), nullable=True)
+    user_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # Milliseconds since the epoch; rows older than the token lifetime can't match a live token
+    revoked_at: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True)
+
+    def __repr__(self) -> str:
+        return f'<SessionRevocation jti={self.jti} user={self.user_id}>'
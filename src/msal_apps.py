@@ -0,0 +1,177 @@
+"""
+Registry of MSAL confidential client apps.
+
+Building a ConfidentialClientApplication does authority/OpenID discovery
+over the network, so we build one per (client_id, authority) and reuse it
+for every request. The per-user token cache needs an app of its own, as
+MSAL keeps the cache on the app; that one is built per call with the same
+pooled http client and http cache, so it repeats no discovery.
+
+The http cache can be persisted as JSON so a fresh worker skips discovery
+too. Only what MSAL reads back from a cached response (status, headers,
+body) is written; responses come back as CachedResponse.
+"""
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import weakref
+
+import msal
+from requests import HTTPError
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+# MSAL keeps its expiry bookkeeping in the http cache under this key
+_INDEX_KEY = '_index_'
+
+# path -> registry whose http cache is written there at exit; one atexit hook per process
+_save_at_exit = weakref.WeakValueDictionary()
+_save_at_exit_lock = threading.Lock()
+_save_hook_registered = False
+
+
+class CachedResponse:
+    """The parts of a requests.Response that MSAL reads from its http cache"""
+
+    def __init__(self, status_code: int, headers: dict, text: str):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.text = text
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError(f'{self.status_code} (cached response)', response=self)
+
+
+def _encode_http_cache(http_cache: dict) -> dict:
+    encoded = {}
+    for key, value in http_cache.items():
+        if key == _INDEX_KEY:
+            encoded[key] = value
+        else:
+            encoded[key] = {'status_code': value.status_code, 'headers': dict(value.headers), 'text': value.text}
+    return encoded
+
+
+def _decode_http_cache(encoded: dict) -> dict:
+    decoded = {}
+    for key, value in encoded.items():
+        if key == _INDEX_KEY:
+            sequence, timestamps = value
+            decoded[key] = (sequence, timestamps)
+        else:
+            decoded[key] = CachedResponse(int(value['status_code']), value['headers'], value['text'])
+    return decoded
+
+
+def _save_http_caches():
+    for path, registry in list(_save_at_exit.items()):
+        registry.save_http_cache(path)
+
+
+class MsalAppRegistry:
+    """Thread-safe registry of long-lived MSAL apps keyed by (client_id, authority)"""
+
+    def __init__(self, http_client=None, **app_options):
+        self._apps = {}
+        self._lock = threading.Lock()
+        # Shared MSAL http cache so even a rebuilt app skips discovery GETs
+        self._http_cache = {}
+        self.http_client = http_client
+        self.app_options = app_options
+
+    def set_http_client(self, http_client):
+        """Use this transport for every app built from now on"""
+        with self._lock:
+            self.http_client = http_client
+            self._apps.clear()
+
+    def get(self, client_id: str, authority: str, client_credential=None) -> msal.ConfidentialClientApplication:
+        """Return the shared app for this client/authority, building it on first use"""
+        key = (client_id, authority)
+        app = self._apps.get(key)
+        if app is not None:
+            return app
+        with self._lock:
+            # Another thread may have built it while we waited on the lock
+            app = self._apps.get(key)
+            if app is None:
+                app = self._build(client_id, authority, client_credential)
+                self._apps[key] = app
+            return app
+
+    def _build(self, client_id: str, authority: str, client_credential=None, **options):
+        return msal.ConfidentialClientApplication(
+            client_id, authority=authority,
+            client_credential=client_credential,
+            http_client=self.http_client,
+            http_cache=self._http_cache,
+            **self.app_options, **options)
+
+    def with_cache(self, client_id: str, authority: str, client_credential=None, cache=None) -> msal.ConfidentialClientApplication:
+        """Return an app that reads and writes the given token cache"""
+        app = self.get(client_id, authority, client_credential)
+        if cache is None:
+            return app
+        # Building the shared app above filled the http cache with the
+        # authority's discovery responses, so this does no network I/O
+        return self._build(client_id, authority, client_credential, token_cache=cache)
+
+    def warm_up(self, client_id: str, authority: str, client_credential=None) -> bool:
+        """Pre-resolve authority metadata, e.g. when a worker boots"""
+        if not client_id or not authority:
+            return False
+        try:
+            self.get(client_id, authority, client_credential)
+            return True
+        except Exception as e:
+            # A worker must still boot if the authority is briefly unreachable,
+            # the app will be built on first use instead
+            logger.warning("MSAL warm-up failed for %s: %s", authority, e)
+            return False
+
+    def persist_http_cache(self, path: str):
+        """Seed MSAL's http cache (discovery responses) from path and write it back at exit"""
+        global _save_hook_registered
+        try:
+            with open(path) as f:
+                cached = _decode_http_cache(json.load(f))
+        except FileNotFoundError:
+            cached = {}
+        except Exception as e:
+            # A corrupt or incompatible file just means starting afresh
+            logger.warning("Ignoring unreadable MSAL http cache %s: %s", path, e)
+            cached = {}
+        with self._lock:
+            self._http_cache.update(cached)
+        # The registry that persisted a path last is the one saved there
+        with _save_at_exit_lock:
+            _save_at_exit[path] = self
+            if not _save_hook_registered:
+                atexit.register(_save_http_caches)
+                _save_hook_registered = True
+
+    def save_http_cache(self, path: str):
+        """Write MSAL's http cache to path atomically"""
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                with self._lock:
+                    encoded = _encode_http_cache(self._http_cache)
+                json.dump(encoded, f)
+            os.replace(tmp, path)
+        except Exception as e:
+            logger.warning("Could not save MSAL http cache %s: %s", path, e)
+            if tmp is not None and os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def clear(self):
+        """Drop all cached apps (e.g. after rotating the client secret)"""
+        with self._lock:
+            self._apps.clear()
+
@@ -0,0 +1,255 @@
+"""
+On-disk cache of OIDC discovery documents and signing keys (JWKS).
+
+Each authority gets one JSON file in a directory shared by every worker on
+the host, holding its discovery document and JWKS with expiry times taken
+from the HTTP Cache-Control / Expires headers. Workers read the file at
+import, so a fresh worker validates id_tokens without any network I/O.
+Entries are refreshed in the background before they expire (re-reading
+the file first, in case another worker already did), and the JWKS is
+re-fetched when a token arrives signed with an unknown kid.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import jwt
+
+logger = logging.getLogger(__name__)
+
+
+def cache_lifetime(headers, default: float, minimum: float) -> float:
+    """Seconds a response may be cached for, from its Cache-Control or Expires header"""
+    directives = {}
+    for part in headers.get('Cache-Control', '').split(','):
+        name, _, value = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"')
+    if 'no-store' in directives or 'no-cache' in directives:
+        return minimum
+    lifetime = default
+    if directives.get('max-age', '').isdigit():
+        lifetime = int(directives['max-age']) - int(headers.get('Age', 0) or 0)
+    elif headers.get('Expires'):
+        try:
+            lifetime = parsedate_to_datetime(headers['Expires']).timestamp() - time.time()
+        except (TypeError, ValueError):
+            lifetime = minimum
+    return max(minimum, lifetime)
+
+
+class OidcMetadataCache:
+    """Discovery + JWKS per authority, persisted to disk and shared between workers"""
+
+    def __init__(self, directory: str, http_client, default_ttl: float = 24 * 3600,
+                 min_ttl: float = 300, refresh_ahead: float = 0.1, kid_refetch_interval: float = 60):
+        self.directory = directory
+        self.http_client = http_client
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self.refresh_ahead = refresh_ahead
+        self.kid_refetch_interval = kid_refetch_interval
+        self._entries = {}
+        self._keys = {}
+        self._jwks_fetched_at = {}
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._refresher = None
+        self.disk_loads = 0
+        self.fetches = 0
+        self.kid_misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    # -- persistence --
+
+    def _path(self, authority: str) -> str:
+        digest = hashlib.sha256(authority.rstrip('/').encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f'oidc-{digest}.json')
+
+    def _read_disk(self, authority: str):
+        try:
+            with open(self._path(authority)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('authority') == authority else None
+
+    def _write_disk(self, authority: str, entry: dict):
+        # Write to a temp file and rename, so other workers never see half a file
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp, self._path(authority))
+        except OSError as e:
+            logger.warning("Could not persist OIDC metadata for %s: %s", authority, e)
+            if tmp is not None and os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def _install(self, authority: str, entry: dict):
+        with self._lock:
+            previous = self._entries.get(authority)
+            self._entries[authority] = entry
+            if previous is None or previous.get('jwks') != entry.get('jwks'):
+                self._keys.pop(authority, None)
+
+    def load(self, authority: str) -> bool:
+        """Read an authority's cached metadata from disk (no network); True when found"""
+        if not authority:
+            return False
+        entry = self._read_disk(authority)
+        if entry is None:
+            return False
+        self._install(authority, entry)
+        self.disk_loads += 1
+        return True
+
+    # -- fetching --
+
+    def _fetch(self, entry: dict, name: str, url: str):
+        response = self.http_client.get(url)
+        response.raise_for_status()
+        self.fetches += 1
+        now = time.time()
+        entry[name] = response.json()
+        entry[f'{name}_fetched'] = now
+        entry[f'{name}_expires'] = now + cache_lifetime(response.headers, self.default_ttl, self.min_ttl)
+
+    @staticmethod
+    def _fresh(entry, name: str, now: float) -> bool:
+        return entry is not None and name in entry and entry[f'{name}_expires'] > now
+
+    def _due(self, entry, name: str, now: float) -> bool:
+        """True once less than refresh_ahead of the entry's lifetime is left"""
+        if not self._fresh(entry, name, now):
+            return True
+        expires, fetched = entry[f'{name}_expires'], entry[f'{name}_fetched']
+        return now >= expires - self.refresh_ahead * (expires - fetched)
+
+    @staticmethod
+    def _age_key(entry):
+        return (entry.get('jwks_fetched', 0), entry.get('discovery_fetched', 0))
+
+    def refresh(self, authority: str, force_jwks: bool = False, early: bool = False) -> dict:
+        """Bring an authority's entry up to date, fetching only what expired (or is due, if early)"""
+        stale = self._due if early else (lambda entry, name, now: not self._fresh(entry, name, now))
+        with self._lock:
+            now = time.time()
+            entry = self._entries.get(authority)
+            on_disk = self._read_disk(authority)
+            # Another worker may have refreshed already
+            if on_disk is not None and (entry is None or self._age_key(on_disk) > self._age_key(entry)):
+                entry = on_disk
+            entry = dict(entry or {'authority': authority})
+            fetched = False
+            if stale(entry, 'discovery', now):
+                url = f"{authority.rstrip('/')}/v2.0/.well-known/openid-configuration"
+                self._fetch(entry, 'discovery', url)
+                fetched = True
+            if force_jwks or stale(entry, 'jwks', now):
+                self._fetch(entry, 'jwks', entry['discovery']['jwks_uri'])
+                self._jwks_fetched_at[authority] = time.monotonic()
+                fetched = True
+            if fetched or on_disk is None:
+                self._write_disk(authority, entry)
+            self._install(authority, entry)
+            return entry
+
+    def _entry(self, authority: str) -> dict:
+        entry = self._entries.get(authority)
+        now = time.time()
+        if not (self._fresh(entry, 'discovery', now) and self._fresh(entry, 'jwks', now)):
+            entry = self.refresh(authority)
+        return entry
+
+    def discovery(self, authority: str) -> dict:
+        return self._entry(authority)['discovery']
+
+    def jwks(self, authority: str) -> dict:
+        return self._entry(authority)['jwks']
+
+    def signing_key(self, authority: str, kid: str) -> jwt.PyJWK:
+        """Return the key for kid, re-fetching the JWKS once if the kid is unknown"""
+        key = self._keyset(authority).get(kid)
+        if key is not None:
+            return key
+        self.kid_misses += 1
+        last = self._jwks_fetched_at.get(authority)
+        # Rate-limit refetches so tokens with bogus kids can't hammer the provider
+        if last is None or time.monotonic() - last >= self.kid_refetch_interval:
+            self.refresh(authority, force_jwks=True)
+            key = self._keyset(authority).get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f'Unknown signing key {kid!r}')
+        return key
+
+    def _keyset(self, authority: str) -> dict:
+        jwks = self.jwks(authority)
+        keys = self._keys.get(authority)
+        if keys is None:
+            keys = {}
+            for data in jwks.get('keys', []):
+                if data.get('use', 'sig') != 'sig' or 'kid' not in data:
+                    continue
+                try:
+                    keys[data['kid']] = jwt.PyJWK(data)
+                except jwt.PyJWTError:
+                    continue
+            with self._lock:
+                self._keys[authority] = keys
+        return keys
+
+    def validate_id_token(self, authority: str, client_id: str, id_token: str, leeway: float = 60) -> dict:
+        """Check an id_token's signature, audience, issuer and lifetime; returns its claims"""
+        header = jwt.get_unverified_header(id_token)
+        key = self.signing_key(authority, header.get('kid'))
+        issuer = self.discovery(authority)['issuer']
+        if '{tenantid}' in issuer:
+            # Multi-tenant authorities publish a templated issuer
+            tid = jwt.decode(id_token, options={'verify_signature': False}).get('tid', '')
+            issuer = issuer.replace('{tenantid}', tid)
+        return jwt.decode(id_token, key, algorithms=[key.algorithm_name or 'RS256'],
+                          audience=client_id, issuer=issuer, leeway=leeway)
+
+    # -- background refresh --
+
+    def _next_refresh_delay(self) -> float:
+        now = time.time()
+        delays = []
+        for entry in list(self._entries.values()):
+            for name in ('discovery', 'jwks'):
+                if f'{name}_expires' in entry:
+                    expires, fetched = entry[f'{name}_expires'], entry[f'{name}_fetched']
+                    delays.append(expires - self.refresh_ahead * (expires - fetched) - now)
+        return min(max(min(delays, default=3600), 5), 3600)
+
+    def _refresh_forever(self):
+        while not self._stop.wait(self._next_refresh_delay()):
+            now = time.time()
+            for authority, entry in list(self._entries.items()):
+                if not (self._due(entry, 'discovery', now) or self._due(entry, 'jwks', now)):
+                    continue
+                try:
+                    self.refresh(authority, early=True)
+                except Exception as e:
+                    logger.warning("Background OIDC refresh failed for %s: %s", authority, e)
+
+    def start_refresher(self):
+        """Keep every loaded authority fresh from a daemon thread"""
+        with self._lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._refresh_forever, name='oidc-refresh', daemon=True)
+                self._refresher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        return {'authorities': len(self._entries), 'disk_loads': self.disk_loads,
+                'fetches': self.fetches, 'kid_misses': self.kid_misses}
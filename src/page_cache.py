@@ -0,0 +1,198 @@
+"""
+Render cache for the mostly static pages (login, register, index).
+
+The first GET of a page renders it once with placeholder markers standing
+in for its per-request pieces: the CSRF token, the flashed messages and
+the user's display name. The output is split at the markers into a
+skeleton, cached per template and variant. A variant is the
+application, URL prefix, anonymous or logged-in, and the user's compiled
+permission bits. Later requests join the skeleton back together with the
+real values, so Jinja runs only for the small _flashes.html fragment, and
+only when there is something to flash.
+
+Cached skeletons live for the life of the process, so a deploy starts
+fresh. When template auto-reload is on, they are also dropped whenever
+a template file changes.
+
+Pages get an ETag built from the skeleton and the per-request values.
+The signed CSRF token changes every second, so the ETag uses the raw
+session token plus a time window inside WTF_CSRF_TIME_LIMIT instead.
+An unchanged page is then answered with 304.
+"""
+import hashlib
+import os
+import re
+import secrets
+import threading
+import time
+
+from flask import Flask, Response, current_app, g, get_flashed_messages, render_template, request, session
+from flask_wtf.csrf import generate_csrf
+from markupsafe import Markup, escape
+
+from .permissions import current_table
+from .principal import Principal, current_principal
+
+CSRF = 'csrf'
+FLASHES = 'flashes'
+DISPLAY_NAME = 'display_name'
+
+
+def flashed_messages_html() -> Markup:
+    """The flashed messages as HTML; skips rendering entirely when there are none"""
+    if '_flashes' not in session:
+        return Markup('')
+    messages = get_flashed_messages(with_categories=True)
+    return Markup(current_app.jinja_env.get_template('_flashes.html').render(messages=messages))
+
+
+class PageCache:
+    """Skeletons of rendered templates, keyed by template and variant"""
+
+    def __init__(self, app: Flask, check_interval: float = 1.0):
+        self.app = app
+        self.check_interval = check_interval
+        self._nonce = secrets.token_hex(8)
+        self._marker = re.compile(f'@@splice:(\\w+):{self._nonce}@@')
+        self._skeletons = {}
+        self._lock = threading.Lock()
+        self._templates_version = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def _marker_for(self, name: str) -> Markup:
+        return Markup(f'@@splice:{name}:{self._nonce}@@')
+
+    def clear(self):
+        with self._lock:
+            self._skeletons.clear()
+
+    def _check_templates(self):
+        # Without auto-reload Jinja doesn't pick up template edits before a restart either
+        if not self.app.jinja_env.auto_reload:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        version = []
+        for folder in _template_folders(self.app):
+            for root, _, files in os.walk(folder):
+                for name in files:
+                    path = os.path.join(root, name)
+                    version.append((path, os.stat(path).st_mtime_ns))
+        version = hash(tuple(sorted(version)))
+        if version != self._templates_version:
+            self._templates_version = version
+            self.clear()
+
+    def _variant(self, template_name: str, principal):
+        application = getattr(g, 'application', None)
+        key = (template_name, request.script_root, application.name if application is not None else None)
+        if principal is None:
+            return key + (None,)
+        table = current_table()
+        return key + (bool(principal.display_name), table.view_bits, table.edit_bits)
+
+    def _build(self, template_name: str, principal):
+        """Render the page with markers in place of its dynamic parts and split it at them"""
+        context = {
+            'csrf_token': lambda: self._marker_for(CSRF),
+            'flashed_messages_html': lambda: self._marker_for(FLASHES),
+        }
+        if principal is not None:
+            context['principal'] = Principal(
+                principal.user_id, principal.oid, principal.email,
+                self._marker_for(DISPLAY_NAME) if principal.display_name else principal.display_name,
+                principal.login_method, principal.application, principal.logged_in_at)
+        parts = self._marker.split(render_template(template_name, **context))
+        # parts alternates literal text and slot names: text, slot, text, slot, ..., text
+        digest = hashlib.blake2b('\0'.join(parts).encode(), digest_size=16).hexdigest()
+        return tuple(parts), digest
+
+    def render(self, template_name: str) -> Response:
+        """The rendered template as a response, honouring If-None-Match"""
+        self._check_templates()
+        principal = current_principal()
+        key = self._variant(template_name, principal)
+        cached = self._skeletons.get(key)
+        if cached is None:
+            cached = self._build(template_name, principal)
+            with self._lock:
+                self._skeletons[key] = cached
+                self.misses += 1
+        else:
+            self.hits += 1
+        parts, digest = cached
+        slots = set(parts[1::2])
+
+        # Work out the ETag before any per-request rendering so a 304 skips it
+        etag = None
+        if FLASHES not in slots or '_flashes' not in session:
+            etag = self._etag(digest, slots, principal)
+            if etag in request.if_none_match:
+                self.not_modified += 1
+                response = Response(status=304)
+                return self._headers(response, etag)
+
+        values = {}
+        if CSRF in slots:
+            values[CSRF] = generate_csrf()
+        if FLASHES in slots:
+            values[FLASHES] = flashed_messages_html()
+        if DISPLAY_NAME in slots:
+            values[DISPLAY_NAME] = escape(principal.display_name)
+        body = ''.join(part if i % 2 == 0 else values[part] for i, part in enumerate(parts))
+        return self._headers(Response(body, mimetype='text/html'), etag)
+
+    def _etag(self, digest: str, slots: set, principal) -> str:
+        h = hashlib.blake2b(digest.encode(), digest_size=16)
+        if CSRF in slots:
+            generate_csrf()
+            field = current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token')
+            h.update(str(session.get(field)).encode())
+            # A 304 re-uses the signed token in the browser's copy; make that copy go stale well before it expires
+            limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+            if limit:
+                h.update(str(int(time.time()) // max(limit // 2, 1)).encode())
+        if DISPLAY_NAME in slots:
+            h.update(principal.display_name.encode())
+        return h.hexdigest()
+
+    @staticmethod
+    def _headers(response: Response, etag):
+        if etag is not None:
+            response.set_etag(etag)
+        # Per-user pages: only the browser may keep a copy, and it has to ask first
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+        return response
+
+    def stats(self) -> dict:
+        return {'entries': len(self._skeletons), 'hits': self.hits, 'misses': self.misses,
+                'not_modified': self.not_modified}
+
+
+def _template_folders(app: Flask):
+    folders = [os.path.join(app.root_path, app.template_folder)] if app.template_folder else []
+    for blueprint in app.blueprints.values():
+        if blueprint.template_folder:
+            folders.append(os.path.join(blueprint.root_path, blueprint.template_folder))
+    return folders
+
+
+def init_page_cache(app: Flask):
+    app.jinja_env.globals['flashed_messages_html'] = flashed_messages_html
+    if str(app.config.get('PAGE_CACHE', '1')).lower() not in ('0', 'false', 'no'):
+        app.extensions['page_cache'] = PageCache(app)
+
+
+def render_page(template_name: str):
+    """render_template() for GET pages, through the page cache when it is enabled"""
+    cache = current_app.extensions.get('page_cache')
+    if cache is None:
+        return render_template(template_name)
+    return cache.render(template_name)
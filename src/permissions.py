@@ -0,0 +1,221 @@
+"""
+Route and field permissions with hide / view / edit levels.
+
+Policies are user -> roles -> grants. At login (or the first check after
+an admin edit) a user's grants are compiled into a PermissionTable: two
+integer bitmasks, one bit per resource for "can view" and one for "can
+edit". Checking a route or field is then a dict lookup and a shift rather
+than a join. Compiled tables are cached per worker and thrown away when
+the 'permissions' CacheVersion stamp moves.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Optional
+
+from flask import abort, flash, redirect, request, url_for
+from sqlalchemy import func, select
+
+from .models import db, CacheVersion, Grant, Role, UserRole
+from .principal import current_principal
+
+HIDE = 0
+VIEW = 1
+EDIT = 2
+
+ROUTE = 'route'
+FIELD = 'field'
+
+VERSION_NAME = 'permissions'
+
+
+class ResourceIndex:
+    """Assigns every (type, resource) a stable bit position within this worker"""
+
+    def __init__(self):
+        self._bits = {}
+        self._lock = threading.Lock()
+
+    def get(self, resource_type: str, resource: str):
+        return self._bits.get((resource_type, resource))
+
+    def bit(self, resource_type: str, resource: str) -> int:
+        key = (resource_type, resource)
+        bit = self._bits.get(key)
+        if bit is None:
+            with self._lock:
+                bit = self._bits.setdefault(key, len(self._bits))
+        return bit
+
+    def __len__(self):
+        return len(self._bits)
+
+
+class PermissionTable:
+    """Compiled decisions for one user"""
+    __slots__ = ('version', 'view_bits', 'edit_bits', '_index')
+
+    def __init__(self, version: int, index: ResourceIndex, view_bits: int = 0, edit_bits: int = 0):
+        self.version = version
+        self.view_bits = view_bits
+        self.edit_bits = edit_bits
+        self._index = index
+
+    def level(self, resource_type: str, resource: str) -> int:
+        bit = self._index.get(resource_type, resource)
+        if bit is None:
+            return HIDE
+        if (self.edit_bits >> bit) & 1:
+            return EDIT
+        if (self.view_bits >> bit) & 1:
+            return VIEW
+        return HIDE
+
+    def allows(self, resource_type: str, resource: str, level: int = VIEW) -> bool:
+        return self.level(resource_type, resource) >= level
+
+
+class PermissionEngine:
+    """Compiles and caches PermissionTables, invalidated by a DB version stamp"""
+
+    def __init__(self, max_users: int = 10_000, check_interval: float = 1.0):
+        self.max_users = max_users
+        self.check_interval = check_interval
+        self.index = ResourceIndex()
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self.compiles = 0
+
+    def _current_version(self) -> int:
+        now = time.monotonic()
+        if self._version is None or now - self._checked_at >= self.check_interval:
+            version = CacheVersion.current(VERSION_NAME)
+            with self._lock:
+                if version != self._version:
+                    self._tables.clear()
+                self._version = version
+                self._checked_at = now
+        return self._version
+
+    @property
+    def version(self) -> Optional[int]:
+        """The version stamp this worker last saw; None before its first check"""
+        return self._version
+
+    def saw_version(self, version: int):
+        """A newer stamp seen elsewhere (e.g. in a session cookie another worker signed)
+        means our tables are stale: check on the next lookup rather than after check_interval"""
+        if self._version is not None and version > self._version:
+            self._checked_at = 0.0
+
+    def compile(self, user_id: int) -> PermissionTable:
+        """Build a user's decision table with a single grouped query"""
+        version = self._current_version()
+        rows = db.session.execute(
+            select(Grant.resource_type, Grant.resource, func.max(Grant.level))
+            .join(UserRole, UserRole.role_id == Grant.role_id)
+            .where(UserRole.user_id == user_id)
+            .group_by(Grant.resource_type, Grant.resource)
+        ).all()
+        view_bits = edit_bits = 0
+        for resource_type, resource, level in rows:
+            bit = 1 << self.index.bit(resource_type, resource)
+            if level >= VIEW:
+                view_bits |= bit
+            if level >= EDIT:
+                edit_bits |= bit
+        table = PermissionTable(version, self.index, view_bits, edit_bits)
+        with self._lock:
+            self._tables[user_id] = table
+            self._tables.move_to_end(user_id)
+            if len(self._tables) > self.max_users:
+                self._tables.popitem(last=False)
+            self.compiles += 1
+        return table
+
+    def table_for(self, user_id: int) -> PermissionTable:
+        """Return the cached table for a user, compiling it if missing or stale"""
+        version = self._current_version()
+        table = self._tables.get(user_id)
+        if table is None or table.version != version:
+            table = self.compile(user_id)
+        return table
+
+    def allows(self, user_id, resource_type: str, resource: str, level: int = VIEW) -> bool:
+        if user_id is None:
+            return False
+        return self.table_for(user_id).allows(resource_type, resource, level)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'cached_users': len(self._tables), 'resources': len(self.index),
+                    'compiles': self.compiles, 'version': self._version}
+
+
+engine = PermissionEngine()
+
+
+# -- admin edits; each bumps the version stamp in the same transaction --
+
+def set_grant(role: Role, resource_type: str, resource: str, level: int):
+    """Create or change a role's grant on a route or field"""
+    grant = db.session.execute(
+        select(Grant).filter_by(role_id=role.id, resource_type=resource_type, resource=resource)
+    ).scalar_one_or_none()
+    if grant is None:
+        db.session.add(Grant(role_id=role.id, resource_type=resource_type, resource=resource, level=level))
+    else:
+        grant.level = level
+    CacheVersion.bump(VERSION_NAME)
+
+
+def assign_role(user_id: int, role: Role):
+    """Give a user a role"""
+    if db.session.get(UserRole, (user_id, role.id)) is None:
+        db.session.add(UserRole(user_id=user_id, role_id=role.id))
+    CacheVersion.bump(VERSION_NAME)
+
+
+def revoke_role(user_id: int, role: Role):
+    """Take a role away from a user"""
+    link = db.session.get(UserRole, (user_id, role.id))
+    if link is not None:
+        db.session.delete(link)
+    CacheVersion.bump(VERSION_NAME)
+
+
+# -- Flask helpers --
+
+def current_table():
+    """The logged-in user's compiled PermissionTable, or None; looked up once per request"""
+    principal = current_principal()
+    if principal is None:
+        return None
+    if principal.permissions is None:
+        principal.permissions = engine.table_for(principal.user_id)
+    return principal.permissions
+
+
+def can(resource: str, level: int = VIEW, resource_type: str = FIELD) -> bool:
+    """Check the logged-in user's level on a field (or route); usable from templates"""
+    table = current_table()
+    return table is not None and table.allows(resource_type, resource, level)
+
+
+def require_permission(level: int = VIEW, resource: str = None):
+    """Protect a view; the resource defaults to the view's endpoint name"""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            table = current_table()
+            if table is None:
+                flash('Please log in to continue', 'error')
+                return redirect(url_for('accounts.login'))
+            if not table.allows(ROUTE, resource or request.endpoint, level):
+                abort(403)
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,123 @@
+"""
+The logged-in user of the current request.
+
+Login stores the user as one short list under session['principal']
+rather than six separate keys, along with the time of the login, which
+account locks are checked against (see cookie_session). Applications on
+one host share the session cookie, so each keeps its own principal: the
+default application under 'principal', any other under
+'principal:<name>'. Logging in to (or out of) one application leaves the
+others alone. current_principal() turns it into a Principal the first
+time a request asks who the user is, and keeps it in the request environ
+for the rest of the request. Requests that never ask don't look at the
+session for it at all.
+
+Permissions are not stored in the session, because their bit positions
+are only stable within a worker. Login compiles them into the worker's
+PermissionEngine. The first check in a request then pins that compiled
+table on the Principal (see permissions.current_table()).
+"""
+import time
+from typing import Optional
+
+from flask import current_app, request, session
+
+from .applications import DEFAULT_APPLICATION, current_application
+
+SESSION_KEY = 'principal'
+ENVIRON_KEY = 'auth.principal'
+
+# How sessions written before the principal existed kept the user
+_LEGACY_KEYS = ('user_id', 'user_oid', 'user_email', 'display_name', 'login_method', 'application')
+
+
+class Principal:
+    """Who is logged in, and how"""
+    __slots__ = ('user_id', 'oid', 'email', 'display_name', 'login_method', 'application', 'logged_in_at',
+                 'permissions')
+
+    def __init__(self, user_id: int, oid=None, email=None, display_name=None, login_method=None,
+                 application: str = DEFAULT_APPLICATION, logged_in_at: Optional[int] = None):
+        self.user_id = user_id
+        self.oid = oid
+        self.email = email
+        self.display_name = display_name
+        self.login_method = login_method
+        self.application = application
+        # Milliseconds; None for sessions written before it was recorded
+        self.logged_in_at = logged_in_at
+        # The compiled PermissionTable, once this request has checked anything
+        self.permissions = None
+
+    def to_session(self) -> list:
+        return [self.user_id, self.oid, self.email, self.display_name, self.login_method, self.application,
+                self.logged_in_at]
+
+    @classmethod
+    def from_session(cls, data) -> 'Principal':
+        return cls(*data)
+
+    def __repr__(self) -> str:
+        return f'<Principal {self.user_id} {self.login_method}>'
+
+
+def session_key(application_name: str) -> str:
+    """Where an application's principal lives in the session"""
+    if application_name == DEFAULT_APPLICATION:
+        return SESSION_KEY
+    return f'{SESSION_KEY}:{application_name}'
+
+
+def session_logins(data) -> list:
+    """(user id, logged_in_at) for each application logged in to in session data"""
+    return [(value[0], value[6] if len(value) > 6 else None) for key, value in data.items()
+            if key == SESSION_KEY or key.startswith(SESSION_KEY + ':')]
+
+
+def login(user, oid, email, login_method: str, application) -> Principal:
+    """Record user as logged in to application"""
+    principal = Principal(user.id, oid, email, user.display_name, login_method, application.name,
+                          int(time.time() * 1000))
+    session[session_key(application.name)] = principal.to_session()
+    request.environ[ENVIRON_KEY] = principal
+    return principal
+
+
+def current_principal() -> Optional[Principal]:
+    """The logged-in user, or None; reads the session at most once per request"""
+    environ = request.environ
+    if ENVIRON_KEY not in environ:
+        environ[ENVIRON_KEY] = _load()
+    return environ[ENVIRON_KEY]
+
+
+def logout():
+    """Log out of the current application; the session is cleared once no application has a login left"""
+    application = current_application()
+    session.pop(session_key(application.name if application is not None else DEFAULT_APPLICATION), None)
+    if not session_logins(session):
+        session.clear()
+    request.environ[ENVIRON_KEY] = None
+
+
+def _load() -> Optional[Principal]:
+    if 'user_id' in session:
+        # Convert an older session once; it is written back in the new form
+        data = [session.get(key) for key in _LEGACY_KEYS]
+        data[-1] = data[-1] or DEFAULT_APPLICATION
+        for key in _LEGACY_KEYS:
+            session.pop(key, None)
+        session[session_key(data[-1])] = data
+    # A login only counts for the application it happened in
+    application = current_application()
+    key = session_key(application.name if application is not None else DEFAULT_APPLICATION)
+    data = session.get(key)
+    if data is None:
+        return None
+    principal = Principal.from_session(data)
+    revocations = current_app.extensions.get('session_revocations')
+    if revocations is not None and revocations.is_revoked(None, principal.user_id, principal.logged_in_at or 0):
+        # Logged in before the account was locked; server-side sessions keep the login until this drops it
+        session.pop(key, None)
+        return None
+    return principal
@@ -0,0 +1,150 @@
+"""
+Off-request redemption of SSO authorization codes.
+
+Swapping the auth code for tokens is a network round trip to the identity
+provider. Done inline, a slow provider ties up one request thread per
+login and the worker soon has none left for anything else. With a
+RedemptionPool the callback view only submits the redemption to a small
+dedicated I/O thread pool and returns right away; the browser then polls a
+pending page until the result is ready.
+
+Admission is bounded: at most max_pending redemptions are held (queued or
+running) per process, and callers past that get RedemptionBusy at once.
+Redemptions not finished after `timeout` seconds are abandoned.
+
+Deferred mode is the default (DEFAULT_WORKERS threads per process).
+Results live in this process, so the poll has to come back to the same
+process: one process with threads, or sticky routing. Deployments that
+spread one browser's requests over several processes without that set
+SSO_REDEEM_WORKERS=0, which runs redemption inline on the request thread.
+"""
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Redemptions wait on the network, so a few threads cover many logins at once
+DEFAULT_WORKERS = 8
+
+
+class RedemptionBusy(Exception):
+    """Raised when the redemption queue is full"""
+
+
+class RedemptionTimeout(Exception):
+    """Raised when a redemption took longer than the configured timeout"""
+
+
+class RedemptionPool:
+    """Run redemptions on a bounded I/O thread pool and hand out poll tickets"""
+
+    def __init__(self, workers: int = 16, max_pending: int = 256, timeout: float = 30.0):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._lock = threading.Lock()
+        self._tickets = {}
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.peak_in_flight = 0
+
+    @classmethod
+    def from_env(cls, env=None) -> 'RedemptionPool':
+        """Build the pool from SSO_REDEEM_* settings (default: os.environ)"""
+        env = os.environ if env is None else env
+        return cls(
+            workers=int(env.get('SSO_REDEEM_WORKERS', DEFAULT_WORKERS)),
+            max_pending=int(env.get('SSO_REDEEM_MAX_PENDING', 256)),
+            timeout=float(env.get('SSO_REDEEM_TIMEOUT', 30)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='sso-redeem')
+        return self._pool
+
+    def submit(self, func, *args) -> str:
+        """Start func(*args) off-thread and return a ticket to poll with"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise RedemptionBusy('Too many sign-ins in progress')
+        with self._lock:
+            self.submitted += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.submitted - self.completed)
+        try:
+            future = self._executor().submit(func, *args)
+        except Exception:
+            with self._lock:
+                self.submitted -= 1
+            self._slots.release()
+            raise
+        future.add_done_callback(self._finished)
+        if len(self._tickets) >= self.max_pending:
+            self.discard_stale()
+        ticket = secrets.token_urlsafe(16)
+        with self._lock:
+            self._tickets[ticket] = (future, time.monotonic())
+        return ticket
+
+    def _finished(self, future):
+        self._slots.release()
+        with self._lock:
+            self.completed += 1
+
+    def poll(self, ticket: str):
+        """Return the finished future for a ticket, or None while it is still running.
+
+        Raises KeyError for unknown (or already collected) tickets and
+        RedemptionTimeout once the redemption has run past the timeout.
+        """
+        with self._lock:
+            future, started = self._tickets[ticket]
+            if future.done():
+                del self._tickets[ticket]
+                return future
+            if time.monotonic() - started < self.timeout:
+                return None
+            del self._tickets[ticket]
+            self.timed_out += 1
+        future.cancel()
+        raise RedemptionTimeout('Sign-in took too long')
+
+    def discard_stale(self) -> int:
+        """Forget tickets nobody came back for"""
+        cutoff = time.monotonic() - self.timeout * 2
+        with self._lock:
+            stale = [t for t, (f, started) in self._tickets.items() if started < cutoff]
+            for ticket in stale:
+                self._tickets[ticket][0].cancel()
+                del self._tickets[ticket]
+        return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'in_flight': self.submitted - self.completed,
+                'peak_in_flight': self.peak_in_flight,
+                'tickets': len(self._tickets),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+            }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,152 @@
+"""
+Row-level security compiled to SQL.
+
+A row policy is a function that takes the acting user's RlsContext and
+returns a SQLAlchemy where-clause for one model. Policies are compiled
+once per (user, model) and cached, in an LRU as large as the permission
+engine's, until the permissions version stamp moves. They are then
+injected into every ORM select() through a do_orm_execute hook with
+with_loader_criteria, so the database only ever returns rows the user
+may see.
+
+RLS applies to requests made by a logged-in user (current_principal()).
+Inside a request the context also carries the application's user realm,
+so even users who may see every row only see their own realm's users.
+Code running without a user (CLI commands, background jobs, the login
+lookups themselves) runs unfiltered; auth-path queries that must see
+every user opt out with .execution_options(skip_rls=True).
+"""
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, has_request_context
+from sqlalchemy import event, true
+from sqlalchemy.orm import with_loader_criteria
+
+from . import permissions
+from .models import User
+from .principal import current_principal
+
+ROW = 'row'
+
+_policies = {}
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_acting_as = ContextVar('rls_acting_as', default=None)
+# Set while policies are being compiled, so their own queries aren't filtered
+_compiling = ContextVar('rls_compiling', default=False)
+
+
+class RlsContext:
+    """What a policy knows about the acting user"""
+    __slots__ = ('user_id', 'permissions', 'realm')
+
+    def __init__(self, user_id, permissions_table, realm=None):
+        self.user_id = user_id
+        self.permissions = permissions_table
+        # None outside a request (CLI, background jobs): no realm restriction
+        self.realm = realm
+
+    def can_see_all(self, model_name: str) -> bool:
+        """True when a role grants view on every row of a model ('row' grant)"""
+        return self.permissions.allows(ROW, model_name, permissions.VIEW)
+
+
+def row_policy(model):
+    """Register the row policy for a model"""
+    def decorator(func):
+        _policies[model] = func
+        clear_cache()
+        return func
+    return decorator
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+@contextmanager
+def acting_as(user_id):
+    """Apply RLS for user_id outside a request, e.g. in a background job"""
+    token = _acting_as.set(user_id)
+    try:
+        yield
+    finally:
+        _acting_as.reset(token)
+
+
+def current_user_id():
+    user_id = _acting_as.get()
+    if user_id is None and has_request_context():
+        principal = current_principal()
+        user_id = principal.user_id if principal is not None else None
+    return user_id
+
+
+def current_realm():
+    application = getattr(g, 'application', None) if has_request_context() else None
+    return application.realm if application is not None else None
+
+
+def predicate(model, user_id, realm=None):
+    """Return the cached where-clause restricting model to user_id's rows"""
+    table = permissions.engine.table_for(user_id)
+    key = (user_id, realm, model)
+    cached = _cache.get(key)
+    if cached is not None and cached[0] == table.version:
+        with _cache_lock:
+            if key in _cache:
+                _cache.move_to_end(key)
+        return cached[1]
+    clause = _policies[model](RlsContext(user_id, table, realm))
+    with _cache_lock:
+        if _cache and next(reversed(_cache.values()))[0] != table.version:
+            # The permissions version moved: every older clause is stale, not just this user's
+            _cache.clear()
+        _cache[key] = (table.version, clause)
+        _cache.move_to_end(key)
+        # LRU sized like the permission engine's table cache, one entry per policy per user
+        while len(_cache) > permissions.engine.max_users * max(len(_policies), 1):
+            _cache.popitem(last=False)
+    return clause
+
+
+def _apply_rls(execute_state):
+    if not _policies or not execute_state.is_select:
+        return
+    if execute_state.is_column_load or execute_state.is_relationship_load:
+        # The parent select was already filtered
+        return
+    if execute_state.execution_options.get('skip_rls') or _compiling.get():
+        return
+    user_id = current_user_id()
+    if user_id is None:
+        return
+    realm = current_realm()
+    token = _compiling.set(True)
+    try:
+        criteria = [
+            with_loader_criteria(model, predicate(model, user_id, realm), include_aliases=True)
+            for model in _policies
+        ]
+    finally:
+        _compiling.reset(token)
+    execute_state.statement = execute_state.statement.options(*criteria)
+
+
+def init_rls(db):
+    """Install the RLS hook on the Flask-SQLAlchemy session class"""
+    session_class = db.session.session_factory.class_
+    if not event.contains(session_class, 'do_orm_execute', _apply_rls):
+        event.listen(session_class, 'do_orm_execute', _apply_rls)
+
+
+@row_policy(User)
+def _user_rows(ctx: RlsContext):
+    # Users see their own row unless a role grants view on all user rows (of their realm)
+    if ctx.can_see_all('user'):
+        return true() if ctx.realm is None else User.realm == ctx.realm
+    return User.id == ctx.user_id
@@ -0,0 +1,125 @@
+"""
+Long-lived helpers shared by every request and every application in the
+process: the password hasher, username index, lockout tracker,
+write-behind buffer, audit log and SSO redemption pool. create_app() builds them once; views reach them through
+services(). The Azure AD pieces pull in msal and requests, so they are
+only built the first time an Azure route asks for them.
+"""
+import os
+import threading
+from collections import ChainMap
+
+from flask import Flask, current_app
+
+from . import permissions
+from .audit import AuditLog
+from .claims_sync import ClaimsSync
+from .hashing import PasswordHasher
+from .lockout import LoginAttemptTracker
+from .metrics import Metrics
+from .redemption import RedemptionPool
+from .user_search import UserSearchIndex
+from .username_index import UsernameIndex
+from .write_behind import WriteBehindBuffer
+
+
+class Services:
+    """Process-wide service objects, stored as app.extensions['services']"""
+
+    def __init__(self, app: Flask):
+        self.app = app
+        # Tunables come from the app config first, then the environment
+        self.settings = settings = ChainMap(app.config, os.environ)
+
+        # Answers /check_username from memory; invalidated through the 'usernames' version stamp
+        self.username_index = UsernameIndex(
+            negative_size=int(settings.get('USERNAME_INDEX_NEGATIVE_SIZE', 10000)),
+            check_interval=float(settings.get('USERNAME_INDEX_CHECK_INTERVAL', 1.0)))
+
+        # Type-ahead search for the admin user directory; follows user edits through updated_at
+        self.user_search = UserSearchIndex(check_interval=float(settings.get('USER_SEARCH_CHECK_INTERVAL', 1.0)))
+
+        # PBKDF2 runs in a bounded process pool so it doesn't hold the request thread's GIL
+        self.hasher = PasswordHasher.from_env(settings)
+
+        # last_login and similar bookkeeping is written in bulk by a background flusher
+        self.login_bookkeeping = WriteBehindBuffer(
+            app,
+            flush_interval=float(settings.get('WRITE_BEHIND_INTERVAL_MS', 500)) / 1000,
+            batch_size=int(settings.get('WRITE_BEHIND_BATCH_SIZE', 500)),
+            max_pending=int(settings.get('WRITE_BEHIND_MAX_PENDING', 10000)))
+
+        # Auth events go to a ring buffer and reach the auth_event table in background batches
+        self.audit = AuditLog(
+            app,
+            flush_interval=float(settings.get('AUDIT_FLUSH_INTERVAL_MS', 500)) / 1000,
+            batch_size=int(settings.get('AUDIT_BATCH_SIZE', 1000)),
+            capacity=int(settings.get('AUDIT_BUFFER_SIZE', 50_000)),
+            retention_days=int(settings.get('AUDIT_RETENTION_DAYS', 365)))
+
+        # Maps id_token claims onto users; counts the logins where nothing had changed
+        self.claims_sync = ClaimsSync()
+
+        # SSO code redemption, off the request thread unless SSO_REDEEM_WORKERS=0
+        self.redeemer = RedemptionPool.from_env(settings)
+
+        # Failed logins are counted in a host-local SQLite file; only the lock itself touches the user row
+        self.login_attempts = LoginAttemptTracker(
+            settings.get('LOGIN_ATTEMPTS_DB') or os.path.join(app.instance_path, 'login_attempts.db'),
+            max_failures=int(settings.get('LOGIN_MAX_FAILURES', 10)),
+            window=float(settings.get('LOGIN_FAILURE_WINDOW', 24 * 3600)),
+            locked_ttl=float(settings.get('LOGIN_LOCK_CACHE_TTL', 60)))
+
+        # Request/DB/auth-stage histograms behind /metrics, and the sample rate for routine log events
+        self.metrics = Metrics()
+        self.log_sample_rate = float(settings.get('LOG_SAMPLE_RATE', 0.01))
+
+        self._azure = None
+        self._azure_lock = threading.Lock()
+
+    @property
+    def azure(self):
+        """The AzureAuth shared by all applications, imported and built on first use"""
+        if self._azure is None:
+            with self._azure_lock:
+                if self._azure is None:
+                    from .azure_auth import AzureAuth
+                    self._azure = AzureAuth(self.app.extensions['applications'], self.settings,
+                                            self.app.instance_path)
+        return self._azure
+
+    @property
+    def azure_loaded(self) -> bool:
+        return self._azure is not None
+
+    def stats(self) -> dict:
+        """Every component's stats(), for the /metrics gauges"""
+        stats = {
+            'hasher': self.hasher.stats(),
+            'username_index': self.username_index.stats(),
+            'user_search': self.user_search.stats(),
+            'lockout': self.login_attempts.stats(),
+            'write_behind': self.login_bookkeeping.stats(),
+            'audit': self.audit.stats(),
+            'claims_sync': self.claims_sync.stats(),
+            'redemption': self.redeemer.stats(),
+            'permissions': permissions.engine.stats(),
+        }
+        cookie_sessions = self.app.extensions.get('cookie_sessions')
+        if cookie_sessions is not None:
+            stats['cookie_sessions'] = cookie_sessions.stats()
+        else:
+            stats['session_revocations'] = self.app.extensions['session_revocations'].stats()
+        page_cache = self.app.extensions.get('page_cache')
+        if page_cache is not None:
+            stats['page_cache'] = page_cache.stats()
+        # Don't import msal just to report that nothing happened
+        if self.azure_loaded:
+            stats['idp_http'] = self._azure.http_client.stats.snapshot()
+            stats['oidc_cache'] = self._azure.oidc_cache.stats()
+        return stats
+
+
+def services() -> Services:
+    """The current app's Services"""
+    return current_app.extensions['services']
@@ -0,0 +1,225 @@
+"""
+Sharded SQLite server-side session backend for Flask-Session.
+
+The cachelib filesystem backend opens and unpickles a file on every
+request, re-pickles the whole session on any write and prunes by scanning
+its directory. This backend instead keeps sessions as msgspec/msgpack
+blobs in a handful of SQLite files (WAL mode, one connection per thread
+per shard), expires them by TTL from a background sweeper thread, and
+skips the write entirely when the session content did not change.
+
+Select it with SESSION_TYPE=sqlite; any other SESSION_TYPE is handed to
+Flask-Session as before.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import timedelta as TimeDelta
+from typing import Optional
+
+from flask import Flask
+from flask_session import Session
+from flask_session.base import ServerSideSession, ServerSideSessionInterface
+from flask_session.defaults import Defaults
+
+logger = logging.getLogger(__name__)
+
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class SQLiteSession(ServerSideSession):
+    pass
+
+
+class ShardedSQLiteSessionInterface(ServerSideSessionInterface):
+    """Session storage spread over ``shards`` SQLite files with TTL expiry.
+
+    :param directory: Where the shard files live.
+    :param shards: Number of SQLite files; spreads write locks across files.
+    :param sweep_interval: Seconds between background deletes of expired rows.
+    """
+
+    session_class = SQLiteSession
+    ttl = True
+
+    def __init__(
+        self,
+        app: Flask,
+        directory: str,
+        shards: int = 8,
+        sweep_interval: float = 60.0,
+        key_prefix: str = Defaults.SESSION_KEY_PREFIX,
+        permanent: bool = Defaults.SESSION_PERMANENT,
+        sid_length: int = Defaults.SESSION_ID_LENGTH,
+        serialization_format: str = Defaults.SESSION_SERIALIZATION_FORMAT,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.paths = [os.path.join(directory, f'sessions-{i:02d}.db') for i in range(shards)]
+        self._local = threading.local()
+        for shard in range(shards):
+            self._conn(shard).executescript('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    expiry INTEGER NOT NULL,
+                    data BLOB NOT NULL
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS ix_sessions_expiry ON sessions (expiry);
+            ''')
+        self.reads = 0
+        self.writes = 0
+        self.skipped_writes = 0
+        super().__init__(app, key_prefix, False, permanent, sid_length, serialization_format)
+        self._stop = threading.Event()
+        if sweep_interval:
+            self._sweeper = threading.Thread(
+                target=self._sweep_forever, args=(sweep_interval,),
+                name='session-sweeper', daemon=True)
+            self._sweeper.start()
+
+    @classmethod
+    def from_config(cls, app: Flask) -> 'ShardedSQLiteSessionInterface':
+        config = app.config
+        return cls(
+            app,
+            directory=config.get('SESSION_SQLITE_DIR') or config.get('SESSION_FILE_DIR') or 'flask_session',
+            shards=int(config.get('SESSION_SQLITE_SHARDS') or 8),
+            sweep_interval=float(config.get('SESSION_SQLITE_SWEEP_INTERVAL') or 60),
+            key_prefix=config.get('SESSION_KEY_PREFIX', Defaults.SESSION_KEY_PREFIX),
+            permanent=config.get('SESSION_PERMANENT', Defaults.SESSION_PERMANENT),
+            sid_length=config.get('SESSION_ID_LENGTH', Defaults.SESSION_ID_LENGTH),
+            serialization_format=config.get('SESSION_SERIALIZATION_FORMAT',
+                                            Defaults.SESSION_SERIALIZATION_FORMAT),
+        )
+
+    # -- storage helpers --
+
+    def _conn(self, shard: int) -> sqlite3.Connection:
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get(shard)
+        if conn is None:
+            conn = sqlite3.connect(self.paths[shard], timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conns[shard] = conn
+        return conn
+
+    def _shard(self, store_id: str) -> int:
+        return zlib.crc32(store_id.encode()) % len(self.paths)
+
+    def _sweep_forever(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.delete_expired()
+            except Exception as e:
+                logger.warning("Session sweep failed: %s", e)
+
+    def delete_expired(self) -> int:
+        """Delete expired sessions from every shard, returning how many went"""
+        now = int(time.time())
+        deleted = 0
+        for shard in range(len(self.paths)):
+            deleted += self._conn(shard).execute(
+                'DELETE FROM sessions WHERE expiry <= ?', (now,)).rowcount
+        return deleted
+
+    def stop(self):
+        self._stop.set()
+
+    # -- ServerSideSessionInterface --
+
+    def _load_row(self, store_id: str):
+        self.reads += 1
+        return self._conn(self._shard(store_id)).execute(
+            'SELECT data, expiry FROM sessions WHERE id = ? AND expiry > ?',
+            (store_id, int(time.time()))).fetchone()
+
+    def open_session(self, app: Flask, request) -> ServerSideSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            row = self._load_row(self._get_store_id(sid))
+            if row is not None:
+                data, expiry = row
+                session = self.session_class(self.serializer.decode(data), sid=sid)
+                # Remember what was loaded so an unchanged session is never rewritten
+                session._loaded_digest = _digest(data)
+                session._loaded_expiry = expiry
+                return session
+        return self.session_class(sid=self._generate_sid(self.sid_length), permanent=self.permanent)
+
+    def _retrieve_session_data(self, store_id: str) -> Optional[dict]:
+        row = self._load_row(store_id)
+        return self.serializer.decode(row[0]) if row is not None else None
+
+    def _delete_session(self, store_id: str) -> None:
+        self._conn(self._shard(store_id)).execute('DELETE FROM sessions WHERE id = ?', (store_id,))
+
+    def _upsert_session(self, session_lifetime: TimeDelta, session: ServerSideSession, store_id: str) -> None:
+        data = self.serializer.encode(session)
+        now = int(time.time())
+        ttl = int(session_lifetime.total_seconds())
+        conn = self._conn(self._shard(store_id))
+        loaded_digest = getattr(session, '_loaded_digest', None)
+        if loaded_digest is not None and _digest(data) == loaded_digest:
+            # Content unchanged: only slide the expiry once half the TTL is used up
+            if session._loaded_expiry - now < ttl // 2:
+                conn.execute('UPDATE sessions SET expiry = ? WHERE id = ?', (now + ttl, store_id))
+                self.writes += 1
+            else:
+                self.skipped_writes += 1
+            return
+        conn.execute(
+            'INSERT INTO sessions (id, expiry, data) VALUES (?, ?, ?) '
+            'ON CONFLICT(id) DO UPDATE SET expiry = excluded.expiry, data = excluded.data',
+            (store_id, now + ttl, data))
+        self.writes += 1
+
+
+class SessionlessPathsInterface:
+    """Wraps a session interface so requests for the given paths never load or save a session.
+
+    Paths ending in '/' match as prefixes. Flask hands such requests a
+    read-only null session instead.
+    """
+
+    def __init__(self, inner, paths):
+        self.inner = inner
+        self.prefixes = tuple(path for path in paths if path.endswith('/'))
+        self.paths = frozenset(path for path in paths if not path.endswith('/'))
+
+    def open_session(self, app: Flask, request):
+        path = request.path
+        if path in self.paths or path.startswith(self.prefixes):
+            return None
+        return self.inner.open_session(app, request)
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+def sessionless_paths(app: Flask) -> list:
+    """SESSIONLESS_PATHS, defaulting to the static files, built assets and the health check"""
+    paths = app.config.get('SESSIONLESS_PATHS')
+    if paths is None:
+        return [app.static_url_path + '/', '/assets/', '/health']
+    return paths.split() if isinstance(paths, str) else list(paths)
+
+
+def init_session(app: Flask):
+    """Install the session backend selected by SESSION_TYPE, behind signed cookies if SESSION_MODE=cookie"""
+    if (app.config.get('SESSION_TYPE') or '').lower() == 'sqlite':
+        app.session_interface = ShardedSQLiteSessionInterface.from_config(app)
+    else:
+        Session(app)
+    from .cookie_session import init_cookie_session, init_session_revocations
+    # Account locks end existing logins in both modes
+    init_session_revocations(app)
+    if (app.config.get('SESSION_MODE') or 'server').lower() == 'cookie':
+        init_cookie_session(app)
@@ -0,0 +1,93 @@
+"""
+Per-user MSAL token cache persistence.
+
+The MSAL cache used to be serialized into the session, so every request
+carried several kilobytes of token JSON. It now lives in the token_cache
+table keyed by the user's Azure oid, is only loaded on code paths that
+need tokens, and is only written back when MSAL reports a change.
+"""
+import time
+from datetime import datetime, timedelta, timezone
+
+import msal
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, TokenCacheEntry
+
+# Azure AD refresh tokens expire after 90 days without use
+DEFAULT_MAX_AGE = timedelta(days=90)
+
+
+def load_token_cache(oid) -> msal.SerializableTokenCache:
+    """Load the user's token cache, or an empty one if there is none"""
+    cache = msal.SerializableTokenCache()
+    if oid:
+        data = db.session.execute(
+            select(TokenCacheEntry.data).where(TokenCacheEntry.oid == oid)
+        ).scalar_one_or_none()
+        if data:
+            cache.deserialize(data)
+    return cache
+
+
+def _drop_expired_access_tokens(cache: msal.SerializableTokenCache):
+    now = time.time()
+    for at in list(cache.search(msal.TokenCache.CredentialType.ACCESS_TOKEN)):
+        if int(at.get('expires_on', 0)) < now:
+            cache.remove_at(at)
+
+
+def save_token_cache(oid, cache: msal.SerializableTokenCache) -> bool:
+    """Persist the cache if MSAL changed it; returns whether anything was written"""
+    if not oid or not cache.has_state_changed:
+        return False
+    _drop_expired_access_tokens(cache)
+    _upsert(oid, cache.serialize(), datetime.now(timezone.utc))
+    db.session.commit()
+    return True
+
+
+def _upsert(oid, data: str, updated_at: datetime):
+    # One statement, so two overlapping logins of the same user can't both try to INSERT
+    dialect = db.session.get_bind(mapper=TokenCacheEntry).dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(TokenCacheEntry).values(oid=oid, data=data, updated_at=updated_at)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[TokenCacheEntry.oid],
+            set_={'data': statement.excluded.data, 'updated_at': statement.excluded.updated_at}))
+        return
+    values = {'data': data, 'updated_at': updated_at}
+    if db.session.execute(update(TokenCacheEntry).where(TokenCacheEntry.oid == oid).values(values)).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(TokenCacheEntry).values(oid=oid, **values))
+    except IntegrityError:
+        # Inserted by a concurrent login in the meantime
+        db.session.execute(update(TokenCacheEntry).where(TokenCacheEntry.oid == oid).values(values))
+
+
+def delete_token_cache(oid):
+    """Forget a user's tokens, e.g. on logout"""
+    if oid:
+        db.session.execute(delete(TokenCacheEntry).where(TokenCacheEntry.oid == oid))
+        db.session.commit()
+
+
+def id_token_hint(cache: msal.SerializableTokenCache) -> str:
+    """Return the most recent raw id_token in the cache (for the logout hint)"""
+    id_tokens = list(cache.search(msal.TokenCache.CredentialType.ID_TOKEN))
+    return id_tokens[-1].get('secret', '') if id_tokens else ''
+
+
+def evict_expired(max_age: timedelta = DEFAULT_MAX_AGE) -> int:
+    """Delete caches whose refresh tokens have expired from disuse"""
+    cutoff = datetime.now(timezone.utc) - max_age
+    result = db.session.execute(delete(TokenCacheEntry).where(TokenCacheEntry.updated_at < cutoff))
+    db.session.commit()
+    return result.rowcount
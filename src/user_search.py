@@ -0,0 +1,180 @@
+"""
+In-process type-ahead index over usernames and display names.
+
+Every user contributes a few lower-cased tokens: the username key, the
+display name, and each later word of the display name or of the
+username before its "@" (so "smith" finds "John Smith" and
+"john.smith@example.com"). The tokens are kept as one sorted
+list of "realm NUL token NUL id" strings, so a prefix query is a bisect
+followed by a short forward walk. It needs no per-prefix or per-n-gram
+sets, which would be several times larger at a million users.
+
+Building the index scans every user (tens of seconds and a few hundred
+MB at a million users), so it never happens on a request thread:
+warm_up() starts it in a background thread, or else the first search
+does, and searches raise IndexNotReady until it is done. Once built, the
+index stays in sync incrementally. Every check_interval seconds it asks the database for
+users whose updated_at moved past its watermark (ix_user_updated_at), and
+re-indexes only those whose username or display name actually changed.
+Users are never deleted, only deactivated, and search results are
+filtered against the database anyway.
+"""
+import logging
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left, insort
+
+from flask import current_app
+from sqlalchemy import select
+
+from .models import db, User
+
+logger = logging.getLogger(__name__)
+
+_WORD_SPLIT = re.compile(r'[^\w]+')
+_SEP = '\x00'
+
+
+def tokens(username_key: str, display_name: str) -> set:
+    """Search tokens for one user; every prefix of each token matches"""
+    display = (display_name or '').lower()
+    result = {username_key, display}
+    # Later words only: the first is already a prefix of the whole string. The
+    # username's domain is left out, it is shared by most users and finds nobody.
+    local_part = username_key.split('@', 1)[0]
+    for text in (local_part, display):
+        result.update(word for word in _WORD_SPLIT.split(text)[1:] if word)
+    result.discard('')
+    return result
+
+
+class IndexNotReady(Exception):
+    """Raised by a search while the index is still being built"""
+
+
+class UserSearchIndex:
+    """Sorted token list for prefix search, refreshed from updated_at deltas"""
+
+    def __init__(self, check_interval: float = 1.0):
+        self.check_interval = check_interval
+        self._entries = None
+        self._users = {}
+        self._watermark = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._loader = None
+        # Set once the index has been built
+        self.ready = threading.Event()
+        self.searches = 0
+        self.reloads = 0
+        self.updates = 0
+
+    def _columns(self):
+        return select(User.id, User.realm, User.username_key, User.display_name, User.updated_at) \
+            .execution_options(skip_rls=True)
+
+    def load(self):
+        """(Re)build the whole index with one column-only scan"""
+        entries = []
+        users = {}
+        watermark = None
+        for user_id, realm, key, display_name, updated_at in db.session.execute(self._columns()):
+            # One shared realm string rather than a copy per row
+            realm = sys.intern(realm)
+            users[user_id] = (realm, key, display_name)
+            entries.extend(f'{realm}{_SEP}{token}{_SEP}{user_id}' for token in tokens(key, display_name))
+            if watermark is None or updated_at > watermark:
+                watermark = updated_at
+        entries.sort()
+        with self._lock:
+            self._entries = entries
+            self._users = users
+            self._watermark = watermark
+            self._checked_at = time.monotonic()
+            self.reloads += 1
+        self.ready.set()
+
+    def load_in_background(self, app) -> threading.Thread:
+        """Start building the index in a daemon thread, unless that already happened"""
+        with self._lock:
+            if self._entries is not None or (self._loader is not None and self._loader.is_alive()):
+                return self._loader
+            self._loader = threading.Thread(target=self._load_in_app, args=(app,), name='user-search-load',
+                                            daemon=True)
+            self._loader.start()
+            return self._loader
+
+    def _load_in_app(self, app):
+        try:
+            with app.app_context():
+                self.load()
+        except Exception as e:
+            # e.g. migrations not applied yet; the next search tries again
+            logger.warning("User search index build failed: %s", e)
+
+    def _refresh_if_stale(self):
+        if self._entries is None:
+            self.load_in_background(current_app._get_current_object())
+            raise IndexNotReady('The user search index is still being built')
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        query = self._columns()
+        if self._watermark is not None:
+            # >= because updated_at may only have second resolution; re-applying a row is a no-op
+            query = query.where(User.updated_at >= self._watermark)
+        for user_id, realm, key, display_name, updated_at in db.session.execute(query):
+            self.upsert(user_id, realm, key, display_name)
+            if self._watermark is None or updated_at > self._watermark:
+                self._watermark = updated_at
+
+    def upsert(self, user_id: int, realm: str, username_key: str, display_name: str):
+        """Index a new or changed user; unchanged users (e.g. a last_login bump) cost a dict lookup"""
+        with self._lock:
+            if self._entries is None:
+                return
+            old = self._users.get(user_id)
+            if old == (realm, username_key, display_name):
+                return
+            if old is not None:
+                for token in tokens(old[1], old[2]):
+                    entry = f'{old[0]}{_SEP}{token}{_SEP}{user_id}'
+                    i = bisect_left(self._entries, entry)
+                    if i < len(self._entries) and self._entries[i] == entry:
+                        del self._entries[i]
+            for token in tokens(username_key, display_name):
+                insort(self._entries, f'{realm}{_SEP}{token}{_SEP}{user_id}')
+            self._users[user_id] = (realm, username_key, display_name)
+            self.updates += 1
+
+    def search(self, realm: str, query: str, limit: int = 20) -> list:
+        """Ids of users in realm with a token starting with query, at most limit of them;
+        raises IndexNotReady until the index has been built"""
+        self._refresh_if_stale()
+        prefix = f'{realm}{_SEP}{query.strip().lower().replace(_SEP, "")}'
+        found = []
+        seen = set()
+        with self._lock:
+            entries = self._entries
+            i = bisect_left(entries, prefix)
+            while i < len(entries) and len(found) < limit:
+                entry = entries[i]
+                if not entry.startswith(prefix):
+                    break
+                user_id = int(entry.rsplit(_SEP, 1)[1])
+                if user_id not in seen:
+                    seen.add(user_id)
+                    found.append(user_id)
+                i += 1
+            self.searches += 1
+        return found
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'ready': self._entries is not None,
+                    'entries': len(self._entries) if self._entries is not None else 0,
+                    'users': len(self._users), 'searches': self.searches, 'reloads': self.reloads,
+                    'updates': self.updates}
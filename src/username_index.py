@@ -0,0 +1,157 @@
+"""
+In-process username existence index for /check_username.
+
+The login page asks whether a username exists for every username typed,
+so answering from memory instead of loading a full User row matters.
+Each worker keeps the set of active (realm, username key) pairs for every
+application's realm, so lookups ignore case, plus a bounded LRU of recent
+misses. Workers stay consistent through two CacheVersion stamps. A
+registration bumps 'usernames', and every worker that sees the new stamp
+fetches only the users past the highest id it has loaded. A change that
+takes a username away (deactivation, rename) bumps 'usernames.reload',
+and every worker reloads its whole set.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import func, select
+
+from .models import db, User, CacheVersion, DEFAULT_REALM, username_key
+
+VERSION_NAME = 'usernames'
+RELOAD_VERSION_NAME = 'usernames.reload'
+
+
+class UsernameIndex:
+    """Username set + negative LRU, invalidated by a DB version stamp"""
+
+    def __init__(self, negative_size: int = 10_000, check_interval: float = 1.0):
+        self.negative_size = negative_size
+        self.check_interval = check_interval
+        self._names = None
+        self._negative = OrderedDict()
+        self._version = None
+        self._reload_version = None
+        # Highest user id loaded so far; registrations are fetched past it
+        self._max_id = 0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.deltas = 0
+
+    def load(self):
+        """(Re)load every active username key; a scan of ix_user_active_username_key alone"""
+        version = CacheVersion.current(VERSION_NAME)
+        reload_version = CacheVersion.current(RELOAD_VERSION_NAME)
+        max_id = db.session.execute(select(func.max(User.id)).execution_options(skip_rls=True)).scalar() or 0
+        names = set(db.session.execute(
+            select(User.realm, User.username_key).where(User.is_active.is_(True)).execution_options(skip_rls=True)
+        ).tuples())
+        with self._lock:
+            self._names = names
+            self._negative.clear()
+            self._version = version
+            self._reload_version = reload_version
+            self._max_id = max_id
+            self._checked_at = time.monotonic()
+            self.reloads += 1
+
+    def _load_new_users(self, version: int):
+        """Add the users registered since the last load; a primary key range scan"""
+        rows = db.session.execute(
+            select(User.id, User.realm, User.username_key, User.is_active)
+            .where(User.id > self._max_id)
+            .execution_options(skip_rls=True)
+        ).all()
+        with self._lock:
+            for user_id, realm, key, is_active in rows:
+                if is_active:
+                    self._names.add((realm, key))
+                self._max_id = max(self._max_id, user_id)
+            # A registration committed out of id order can be missed here; with
+            # no cached miss in the way, the first lookup finds it in the DB
+            self._negative.clear()
+            self._version = version
+            self.deltas += 1
+
+    def _refresh_if_stale(self):
+        if self._names is None:
+            self.load()
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        if CacheVersion.current(RELOAD_VERSION_NAME) != self._reload_version:
+            self.load()
+            return
+        version = CacheVersion.current(VERSION_NAME)
+        if version != self._version:
+            self._load_new_users(version)
+
+    def exists(self, username: str, realm: str = DEFAULT_REALM) -> bool:
+        """Answer whether an active user in realm has this username, hitting the DB only on a miss"""
+        self._refresh_if_stale()
+        key = (realm, username_key(username))
+        with self._lock:
+            if key in self._names:
+                self.hits += 1
+                return True
+            if key in self._negative:
+                self._negative.move_to_end(key)
+                self.negative_hits += 1
+                return False
+            self.misses += 1
+
+        found = db.session.execute(
+            # Only key columns, so the index answers it without reading the row
+            select(select(User.username_key)
+                   .where(User.realm == realm, User.username_key == key[1], User.is_active.is_(True)).exists())
+            .execution_options(skip_rls=True)
+        ).scalar()
+        with self._lock:
+            if found:
+                self._names.add(key)
+            else:
+                self._negative[key] = True
+                if len(self._negative) > self.negative_size:
+                    self._negative.popitem(last=False)
+        return found
+
+    def add(self, username: str, realm: str = DEFAULT_REALM):
+        """Record a newly registered user locally (call after the commit)"""
+        key = (realm, username_key(username))
+        with self._lock:
+            if self._names is not None:
+                self._names.add(key)
+            self._negative.pop(key, None)
+
+    def discard(self, username: str, realm: str = DEFAULT_REALM):
+        """Forget a user locally, e.g. after an admin deactivates them"""
+        key = (realm, username_key(username))
+        with self._lock:
+            if self._names is not None:
+                self._names.discard(key)
+            self._negative.pop(key, None)
+
+    @staticmethod
+    def bump(reload: bool = False):
+        """Tell other workers about new users, or with reload=True that a username went away (deactivation,
+        rename) and they must reload; call inside the transaction that changes users"""
+        CacheVersion.bump(RELOAD_VERSION_NAME if reload else VERSION_NAME)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._names) if self._names is not None else 0,
+                'negative_size': len(self._negative),
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'reloads': self.reloads,
+                'deltas': self.deltas,
+            }
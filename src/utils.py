@@ -0,0 +1,7 @@
+from flask import flash, render_template
+
+
+def busy_response(template):
+    """Tell the client the server is busy and to retry shortly"""
+    flash('The server is busy right now. Please try again in a moment.', 'error')
+    return render_template(template), 503, {'Retry-After': '1'}
@@ -0,0 +1,161 @@
+"""
+Write-behind buffer for login-time bookkeeping on the user row.
+
+Logins record things like last_login here instead of committing them in
+the request. A background thread applies everything buffered as one
+executemany UPDATE every flush_interval seconds, or sooner once
+batch_size users are waiting. Repeated logins by the same user collapse
+into one pending row, the buffer holds at most max_pending users (extra
+records are dropped and counted; this is bookkeeping, not audit) and
+whatever is left is flushed at interpreter exit.
+
+Bookkeeping leaves User.updated_at alone: that column marks profile
+changes, and the admin search index polls it.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from flask import Flask
+from sqlalchemy import bindparam, update
+
+from .models import db, User
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Coalesces per-user column updates and flushes them in bulk"""
+
+    def __init__(self, app: Flask, flush_interval: float = 0.5, batch_size: int = 500,
+                 max_pending: int = 10_000):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.recorded = 0
+        self.dropped = 0
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+        atexit.register(self.close)
+
+    def record(self, user_id: int, **values):
+        """Queue column values for a user; never touches the database"""
+        with self._lock:
+            row = self._pending.get(user_id)
+            if row is None:
+                if len(self._pending) >= self.max_pending:
+                    self.dropped += 1
+                    self._wake.set()
+                    return
+                self._pending[user_id] = row = {}
+            row.update(values)
+            self.recorded += 1
+            depth = len(self._pending)
+        if self._thread is None:
+            self._start()
+        if depth >= self.batch_size:
+            self._wake.set()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._flush_forever, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def _flush_forever(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("Write-behind flush failed: %s", e)
+
+    def flush(self) -> int:
+        """Apply everything buffered so far; returns the number of rows written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            # One executemany per set of columns
+            groups = {}
+            for user_id, values in batch.items():
+                groups.setdefault(tuple(sorted(values)), []).append({'user_id': user_id, **values})
+            started = time.perf_counter()
+            table = User.__table__
+            with self.app.app_context():
+                try:
+                    for columns, rows in groups.items():
+                        db.session.execute(
+                            update(table)
+                            .where(table.c.id == bindparam('user_id'))
+                            # Setting updated_at to itself keeps its onupdate from firing
+                            .values({**{column: bindparam(column) for column in columns}, 'updated_at': table.c.updated_at}),
+                            rows)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    self._requeue(batch)
+                    with self._lock:
+                        self.failed_flushes += 1
+                    raise
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.flushes += 1
+                self.flushed_rows += len(batch)
+                self.last_flush_ms = elapsed
+                self.max_flush_ms = max(self.max_flush_ms, elapsed)
+                self._total_flush_ms += elapsed
+            return len(batch)
+
+    def _requeue(self, batch: dict):
+        # Newer values recorded since the batch was taken win
+        with self._lock:
+            for user_id, values in batch.items():
+                row = self._pending.get(user_id)
+                if row is None:
+                    if len(self._pending) >= self.max_pending:
+                        self.dropped += 1
+                        continue
+                    self._pending[user_id] = dict(values)
+                else:
+                    self._pending[user_id] = {**values, **row}
+
+    def close(self):
+        """Stop the flusher and write out what is left"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning("Final write-behind flush failed: %s", e)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'depth': len(self._pending),
+                'recorded': self.recorded,
+                'dropped': self.dropped,
+                'flushes': self.flushes,
+                'failed_flushes': self.failed_flushes,
+                'flushed_rows': self.flushed_rows,
+                'last_flush_ms': round(self.last_flush_ms, 3),
+                'max_flush_ms': round(self.max_flush_ms, 3),
+                'avg_flush_ms': round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+            }
@@ -0,0 +1,41 @@
+"""
+The app most tests run against: create_app() with its database, session
+store and login-attempt file in a temporary directory, CSRF off, hashing
+inline and cheap. Each test passes only the settings it cares about.
+"""
+import os
+import tempfile
+
+from src.app import create_app
+
+
+def temporary_directory(add_cleanup) -> str:
+    """A directory removed by add_cleanup (a TestCase's addCleanup or addClassCleanup)"""
+    directory = tempfile.TemporaryDirectory()
+    add_cleanup(directory.cleanup)
+    return directory.name
+
+
+def base_config(directory: str) -> dict:
+    return {
+        'SECRET_KEY': 'test',
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{directory}/app.db',
+        'SESSION_TYPE': 'sqlite',
+        'SESSION_SQLITE_DIR': os.path.join(directory, 'sessions'),
+        'LOGIN_ATTEMPTS_DB': os.path.join(directory, 'login_attempts.db'),
+        'WTF_CSRF_ENABLED': False,
+        'HASH_POOL_WORKERS': 0,
+        'PASSWORD_HASH_ITERATIONS': 1000,
+    }
+
+
+def make_app(add_cleanup, directory: str = None, **overrides):
+    """create_app() with the test settings plus overrides; its files go in directory (a new temporary
+    one by default), and its background writers are closed by add_cleanup"""
+    if directory is None:
+        directory = temporary_directory(add_cleanup)
+    app = create_app(dict(base_config(directory), **overrides))
+    services = app.extensions['services']
+    add_cleanup(services.login_bookkeeping.close)
+    add_cleanup(services.audit.close)
+    return app
@@ -0,0 +1,258 @@
+"""
+Local stub of an Azure AD / OIDC authority for tests and benchmarks.
+
+Serves discovery, JWKS, authorize and token endpoints over real HTTPS on
+127.0.0.1 with a throwaway self-signed certificate, and issues RS256
+signed id_tokens. Latency can be injected on the token endpoint.
+"""
+import base64
+import datetime
+import ipaddress
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import secrets
+import ssl
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import jwt
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from flask import Flask, jsonify, redirect, request
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+TENANT = 'stub-tenant'
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _self_signed_cert(key, directory):
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, '127.0.0.1')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName(
+            [x509.IPAddress(ipaddress.ip_address('127.0.0.1'))]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, 'stub.crt')
+    key_path = os.path.join(directory, 'stub.key')
+    with open(cert_path, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, 'wb') as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    """HTTP/1.1 handler that keeps connections open, unlike werkzeug's dev server"""
+    protocol_version = 'HTTP/1.1'
+
+    def _handle(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        environ = EnvironBuilder(
+            method=self.command, path=self.path, headers=list(self.headers.items()),
+            data=body, base_url=f'https://{self.headers.get("Host", "127.0.0.1")}',
+        ).get_environ()
+        app_iter, status, headers = run_wsgi_app(self.server.app, environ, buffered=True)
+        payload = b''.join(app_iter)
+        self.send_response(int(status.split()[0]))
+        for name, value in headers.items():
+            if name.lower() not in ('content-length', 'connection'):
+                self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+class StubAuthority:
+    """In-process HTTPS authority. Use as a context manager or call start()/stop()"""
+
+    def __init__(self, client_id='stub-client', latency=0.0):
+        self.client_id = client_id
+        self.latency = latency
+        self.kid = 'stub-key-1'
+        self.signing_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.connections = 0
+        self.hits = {}
+        self._codes = {}
+        self._lock = threading.Lock()
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cert_path, self._key_path = _self_signed_cert(self.signing_key, self._tmp.name)
+        self._server = None
+        self._thread = None
+        self.port = None
+
+    # -- lifecycle --
+
+    def start(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _KeepAliveHandler)
+        server.daemon_threads = True
+        server.app = self._build_app()
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.cert_path, self._key_path)
+        # Handshake in the handler thread so slow clients don't stall accept()
+        server.socket = context.wrap_socket(server.socket, server_side=True,
+                                            do_handshake_on_connect=False)
+        original_get_request = server.get_request
+
+        def get_request():
+            conn = original_get_request()
+            with self._lock:
+                self.connections += 1
+            return conn
+
+        server.get_request = get_request
+        self._server = server
+        self.port = server.server_port
+        self._thread = threading.Thread(target=server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self._tmp.cleanup()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # -- helpers for tests --
+
+    @property
+    def base_url(self) -> str:
+        return f'https://127.0.0.1:{self.port}'
+
+    @property
+    def authority(self) -> str:
+        return f'{self.base_url}/{TENANT}'
+
+    @property
+    def issuer(self) -> str:
+        return f'{self.authority}/v2.0'
+
+    def jwks(self) -> dict:
+        numbers = self.signing_key.public_key().public_numbers()
+        return {'keys': [{
+            'kty': 'RSA', 'use': 'sig', 'alg': 'RS256', 'kid': self.kid,
+            'n': _b64(numbers.n.to_bytes((numbers.n.bit_length() + 7) // 8, 'big')),
+            'e': _b64(numbers.e.to_bytes(3, 'big')),
+        }]}
+
+    def authorize(self, auth_uri: str, email: str, oid=None, **claims) -> dict:
+        """Act as the user signing in: return the query args the browser would bring back"""
+        query = {k: v[0] for k, v in parse_qs(urlparse(auth_uri).query).items()}
+        code = secrets.token_urlsafe(16)
+        with self._lock:
+            self._codes[code] = {
+                'nonce': query.get('nonce'),
+                'email': email,
+                'oid': oid or secrets.token_hex(16),
+                'claims': claims,
+            }
+        return {'code': code, 'state': query.get('state')}
+
+    def _count(self, name):
+        with self._lock:
+            self.hits[name] = self.hits.get(name, 0) + 1
+
+    def _id_token(self, grant, client_id=None) -> str:
+        now = int(time.time())
+        claims = {
+            'iss': self.issuer,
+            'aud': client_id or self.client_id,
+            'iat': now,
+            'nbf': now,
+            'exp': now + 3600,
+            'sub': grant['oid'],
+            'oid': grant['oid'],
+            'tid': TENANT,
+            'preferred_username': grant['email'],
+            'name': grant['claims'].get('name', grant['email']),
+            'nonce': grant['nonce'],
+        }
+        claims.update(grant['claims'])
+        return jwt.encode(claims, self.signing_key, algorithm='RS256', headers={'kid': self.kid})
+
+    # -- the stub authority itself --
+
+    def _build_app(self):
+        app = Flask('stub_authority')
+        stub = self
+
+        @app.route(f'/{TENANT}/v2.0/.well-known/openid-configuration')
+        def openid_configuration():
+            stub._count('discovery')
+            response = jsonify({
+                'issuer': stub.issuer,
+                'authorization_endpoint': f'{stub.authority}/oauth2/v2.0/authorize',
+                'token_endpoint': f'{stub.authority}/oauth2/v2.0/token',
+                'end_session_endpoint': f'{stub.authority}/oauth2/v2.0/logout',
+                'jwks_uri': f'{stub.authority}/discovery/v2.0/keys',
+                'id_token_signing_alg_values_supported': ['RS256'],
+            })
+            response.headers['Cache-Control'] = 'max-age=86400'
+            return response
+
+        @app.route(f'/{TENANT}/discovery/v2.0/keys')
+        def keys():
+            stub._count('jwks')
+            response = jsonify(stub.jwks())
+            response.headers['Cache-Control'] = 'max-age=86400'
+            return response
+
+        @app.route(f'/{TENANT}/oauth2/v2.0/authorize')
+        def authorize():
+            stub._count('authorize')
+            args = stub.authorize(request.url, request.args.get('login_hint', 'user@example.com'))
+            return redirect(f"{request.args['redirect_uri']}?code={args['code']}&state={args['state']}")
+
+        @app.route(f'/{TENANT}/oauth2/v2.0/token', methods=['POST'])
+        def token():
+            stub._count('token')
+            if stub.latency:
+                time.sleep(stub.latency)
+            with stub._lock:
+                grant = stub._codes.pop(request.form.get('code', ''), None)
+            if grant is None:
+                return jsonify({'error': 'invalid_grant',
+                                'error_description': 'Unknown or already redeemed code'}), 400
+            client_info = _b64(json.dumps({'uid': grant['oid'], 'utid': TENANT}).encode())
+            return jsonify({
+                'token_type': 'Bearer',
+                'scope': request.form.get('scope', ''),
+                'expires_in': 3600,
+                'access_token': secrets.token_urlsafe(32),
+                'refresh_token': secrets.token_urlsafe(32),
+                'id_token': stub._id_token(grant, request.form.get('client_id')),
+                'client_info': client_info,
+            })
+
+        return app
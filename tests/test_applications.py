@@ -0,0 +1,116 @@
+import unittest
+
+from src.applications import Application, ApplicationRegistry
+from src.models import db, TokenCacheEntry, User
+from tests.app_factory import make_app
+
+APPLICATIONS = [
+    {'name': 'hr', 'path_prefix': '/hr', 'client_id': 'hr-client', 'authority': 'https://login.example.com/hr',
+     'scopes': ['User.Read'], 'redirect_path': '/hr-callback'},
+    {'name': 'ops', 'path_prefix': '/ops', 'client_id': 'ops-client', 'authority': 'https://login.example.com/ops'},
+    {'name': 'portal', 'hosts': ['portal.example.com'], 'client_id': 'portal-client', 'realm': 'hr'},
+]
+
+
+class TestApplicationRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = ApplicationRegistry([Application(**entry) for entry in APPLICATIONS]
+                                            + [Application('default')])
+
+    def test_resolves_host_then_path_prefix_then_fallback(self):
+        resolve = self.registry.resolve
+        self.assertEqual(resolve('portal.example.com:443', '/hr/login'), (self.registry.get('portal'), None))
+        self.assertEqual(resolve('localhost', '/hr/login'), (self.registry.get('hr'), '/hr'))
+        self.assertEqual(resolve('localhost', '/ops'), (self.registry.get('ops'), '/ops'))
+        self.assertEqual(resolve('localhost', '/hrx/login'), (self.registry.get('default'), None))
+
+    def test_no_fallback_without_a_default_application(self):
+        registry = ApplicationRegistry([Application(**APPLICATIONS[0])])
+        self.assertEqual(registry.resolve('localhost', '/login'), (None, None))
+
+    def test_realms_and_token_cache_keys(self):
+        self.assertEqual(self.registry.get('portal').realm, 'hr')
+        self.assertEqual(self.registry.get('default').realm, 'default')
+        self.assertEqual(self.registry.get('default').token_cache_key('oid-1'), 'oid-1')
+        self.assertEqual(self.registry.get('ops').token_cache_key('oid-1'), 'ops:oid-1')
+
+    def test_rejects_nested_prefixes_and_duplicates(self):
+        with self.assertRaises(ValueError):
+            Application('x', path_prefix='/a/b')
+        with self.assertRaises(ValueError):
+            ApplicationRegistry([Application('x'), Application('x', path_prefix='/x')])
+
+    def test_token_cache_keys_fit_their_column(self):
+        with self.assertRaises(ValueError):
+            Application('x', realm='r' * 51)
+        key = Application('x', realm='r' * 50).token_cache_key('o' * User.oid.type.length)
+        self.assertLessEqual(len(key), TokenCacheEntry.oid.type.length)
+
+    def test_client_secret_from_env(self):
+        application = Application.from_dict({'name': 'x', 'client_secret_env': 'X_SECRET'}, {'X_SECRET': 's3'})
+        self.assertEqual(application.client_secret, 's3')
+
+
+class TestMultipleApplications(unittest.TestCase):
+    def setUp(self):
+        self.app = make_app(self.addCleanup, APPLICATIONS=APPLICATIONS)
+        services = self.app.extensions['services']
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(User(realm='hr', username='alice', password=services.hasher.hash('pw'),
+                                display_name='Alice'))
+            db.session.commit()
+        self.client = self.app.test_client()
+
+    def login(self, prefix='', **kwargs):
+        return self.client.post(f'{prefix}/username_password_login',
+                                data={'username': 'alice', 'password': 'pw'}, **kwargs)
+
+    def test_users_are_partitioned_by_realm(self):
+        self.assertEqual(self.client.post('/hr/check_username', json={'username': 'alice'}).status_code, 200)
+        self.assertEqual(self.client.post('/ops/check_username', json={'username': 'alice'}).status_code, 404)
+        # portal shares the hr realm
+        response = self.client.post('/check_username', json={'username': 'alice'},
+                                    base_url='http://portal.example.com')
+        self.assertEqual(response.status_code, 200)
+
+    def test_routes_and_urls_live_under_the_prefix(self):
+        response = self.login('/hr')
+        self.assertEqual(response.headers['Location'], '/hr/')
+        self.assertIn(b'Alice', self.client.get('/hr/').data)
+        self.assertIn(b'href="/hr/logout"', self.client.get('/hr/').data)
+        self.assertEqual(self.login('/ops').headers['Location'], '/ops/login')
+
+    def test_login_does_not_carry_over_to_another_application(self):
+        self.login('/hr')
+        self.assertNotIn(b'Alice', self.client.get('/ops/').data)
+        with self.client.session_transaction() as session:
+            self.assertNotIn('user_id', session)
+
+    def test_visiting_another_application_keeps_the_login(self):
+        self.login('/hr')
+        self.assertEqual(self.client.get('/ops/login').status_code, 200)
+        self.assertIn(b'Alice', self.client.get('/hr/').data)
+
+        # Logging out of one application leaves the other logged in
+        with self.app.app_context():
+            db.session.add(User(realm='ops', username='alice', password=self.app.extensions['services'].hasher.hash('pw'),
+                                display_name='Alice Ops'))
+            db.session.commit()
+        self.login('/ops')
+        self.assertIn(b'Alice Ops', self.client.get('/ops/').data)
+        self.client.get('/ops/logout')
+        self.assertNotIn(b'Alice', self.client.get('/ops/').data)
+        self.assertIn(b'Alice', self.client.get('/hr/').data)
+
+    def test_each_application_gets_its_redirect_path(self):
+        rules = {rule.rule for rule in self.app.url_map.iter_rules() if rule.endpoint == 'azure.authorized'}
+        self.assertEqual(rules, {'/hr-callback', '/getAToken'})
+        self.assertEqual(self.client.get('/ops/hr-callback').status_code, 404)
+
+    def test_unknown_host_and_prefix_is_not_found(self):
+        self.assertEqual(self.client.get('/login').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
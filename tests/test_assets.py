@@ -0,0 +1,62 @@
+import gzip
+import os
+import unittest
+
+from src.assets import MANIFEST, build_assets
+from tests.app_factory import make_app, temporary_directory
+
+CSS = b'body { color: #333; }\n' * 40
+
+
+class TestAssets(unittest.TestCase):
+    def setUp(self):
+        self.directory = temporary_directory(self.addCleanup)
+        self.source = os.path.join(self.directory, 'static')
+        os.makedirs(os.path.join(self.source, 'css'))
+        with open(os.path.join(self.source, 'css', 'styles.css'), 'wb') as f:
+            f.write(CSS)
+        self.out = os.path.join(self.source, 'dist')
+
+    def build_app(self):
+        return make_app(self.addCleanup, self.directory, ASSETS_DIR=self.out)
+
+    def test_build_fingerprints_and_precompresses(self):
+        manifest = build_assets(self.source, self.out)
+        hashed = manifest['css/styles.css']
+        self.assertRegex(hashed, r'^css/styles\.[0-9a-f]{12}\.css$')
+        with gzip.open(os.path.join(self.out, hashed + '.gz')) as f:
+            self.assertEqual(f.read(), CSS)
+        self.assertTrue(os.path.exists(os.path.join(self.out, MANIFEST)))
+        # Rebuilding doesn't pick up its own output, and is byte-for-byte stable
+        self.assertEqual(build_assets(self.source, self.out), manifest)
+
+    def test_serves_the_precompressed_variant_with_immutable_caching(self):
+        hashed = build_assets(self.source, self.out)['css/styles.css']
+        app = self.build_app()
+        client = app.test_client()
+        with app.test_request_context():
+            url = app.jinja_env.globals['asset_url']('css/styles.css')
+        self.assertEqual(url, f'/assets/{hashed}')
+
+        response = client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Content-Type'], 'text/css; charset=utf-8')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+        self.assertEqual(gzip.decompress(response.data), CSS)
+
+        response = client.get(url)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, CSS)
+
+        self.assertEqual(client.get('/assets/css/styles.css').status_code, 404)
+        self.assertEqual(client.get('/assets/manifest.json').status_code, 404)
+
+    def test_falls_back_to_static_without_a_build(self):
+        app = self.build_app()
+        with app.test_request_context():
+            self.assertEqual(app.jinja_env.globals['asset_url']('css/styles.css'), '/static/css/styles.css')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event, insert, select
+
+from src import audit, permissions
+from src.models import db, AuthEvent, Role, User
+from src.permissions import ROUTE, VIEW, PermissionEngine, assign_role, set_grant
+from src.rls import ROW
+from tests.app_factory import make_app
+
+
+class TestAuditLog(unittest.TestCase):
+    def setUp(self):
+        self.app = make_app(self.addCleanup,
+                            LOGIN_MAX_FAILURES=2,
+                            # Flushed by hand below
+                            AUDIT_FLUSH_INTERVAL_MS=60_000)
+        self.services = self.app.extensions['services']
+        self.log = self.services.audit
+        # Tables compiled for another test's user with the same id must not apply here
+        self.addCleanup(setattr, permissions, 'engine', permissions.engine)
+        permissions.engine = PermissionEngine()
+        with self.app.app_context():
+            db.create_all()
+            alice = User(username='alice', password=self.services.hasher.hash('pw'), display_name='Alice')
+            admin = User(username='admin', password=self.services.hasher.hash('pw'), display_name='Admin')
+            db.session.add_all([alice, admin])
+            role = Role(name='admin')
+            db.session.add(role)
+            db.session.flush()
+            for endpoint in ('admin.user_events', 'admin.auth_failures'):
+                set_grant(role, ROUTE, endpoint, VIEW)
+            set_grant(role, ROUTE, 'accounts.unlock_account', 2)
+            set_grant(role, ROW, 'user', VIEW)
+            assign_role(admin.id, role)
+            db.session.commit()
+            self.alice_id = alice.id
+        self.client = self.app.test_client()
+
+    def login(self, client, username, password):
+        return client.post('/username_password_login', data={'username': username, 'password': password})
+
+    def events(self, user_id):
+        with self.app.app_context():
+            return [audit.KIND_NAMES[event.kind] for event in audit.recent_events(user_id)]
+
+    def test_login_lifecycle_is_recorded(self):
+        self.login(self.client, 'alice', 'pw')
+        self.client.get('/logout')
+        self.login(self.client, 'ALICE', 'wrong')
+        self.login(self.client, 'alice', 'wrong')
+        self.login(self.client, 'alice', 'pw')
+        self.login(self.client, 'nobody', 'pw')
+        admin = self.app.test_client()
+        self.login(admin, 'admin', 'pw')
+        admin.post(f'/admin/users/{self.alice_id}/unlock')
+        self.log.flush()
+        self.assertEqual(self.events(self.alice_id),
+                         ['unlocked', 'login_blocked', 'locked', 'login_failed', 'login_failed', 'logout', 'login'])
+        # Turned away before any user lookup, so recorded by name only (and still listed above)
+        with self.app.app_context():
+            by_name = db.session.execute(
+                select(AuthEvent.kind, AuthEvent.username_key, AuthEvent.realm)
+                .where(AuthEvent.user_id.is_(None)).order_by(AuthEvent.id)).all()
+        self.assertEqual(by_name, [(audit.LOGIN_BLOCKED, 'alice', 'default'), (audit.LOGIN_FAILED, 'nobody', 'default')])
+
+        response = admin.get(f'/admin/users/{self.alice_id}/events', query_string={'limit': 2})
+        self.assertEqual([e['event'] for e in response.get_json()['events']], ['unlocked', 'login_blocked'])
+        failures = admin.get('/admin/auth_failures').get_json()['failures']
+        self.assertEqual(sum(bucket['count'] for bucket in failures), 4)
+        self.assertEqual(self.client.get('/admin/auth_failures').status_code, 302)
+
+    def test_recording_does_not_touch_the_database(self):
+        statements = []
+        with self.app.app_context():
+            engine = db.engine
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, 'before_cursor_execute', listener)
+        self.addCleanup(event.remove, engine, 'before_cursor_execute', listener)
+        for _ in range(100):
+            self.log.record(audit.LOGIN, 'default', 1, 'alice')
+        self.assertEqual(statements, [])
+        self.assertEqual(self.log.flush(), 100)
+        self.assertEqual(sum('INSERT INTO auth_event' in s for s in statements), 1)
+
+    def test_full_buffer_drops_the_oldest(self):
+        self.log._buffer = type(self.log._buffer)(maxlen=3)
+        self.log.capacity = 3
+        for user_id in range(5):
+            self.log.record(audit.LOGIN, 'default', user_id)
+        self.log.flush()
+        with self.app.app_context():
+            self.assertEqual(db.session.execute(select(AuthEvent.user_id).order_by(AuthEvent.id)).scalars().all(),
+                             [2, 3, 4])
+        self.assertEqual(self.log.stats()['dropped'], 2)
+
+    def test_failures_per_minute_and_retention(self):
+        now = datetime.now(timezone.utc).replace(second=30, microsecond=0)
+        at = lambda delta: int((now - delta).timestamp() * 1000)
+        with self.app.app_context():
+            db.session.execute(insert(AuthEvent), [
+                {'ts': at(timedelta(minutes=2)), 'kind': audit.LOGIN_FAILED, 'realm': 'default'},
+                {'ts': at(timedelta(minutes=2)), 'kind': audit.SSO_FAILED, 'realm': 'default'},
+                {'ts': at(timedelta(minutes=1)), 'kind': audit.LOGIN_BLOCKED, 'realm': 'default'},
+                {'ts': at(timedelta(minutes=1)), 'kind': audit.LOGIN, 'realm': 'default'},
+                {'ts': at(timedelta(days=3)), 'kind': audit.LOGIN_FAILED, 'realm': 'default'},
+                {'ts': at(timedelta(days=40)), 'kind': audit.LOGIN, 'realm': 'default'},
+            ])
+            db.session.commit()
+            counts = audit.failures_per_minute(now - timedelta(hours=1))
+            self.assertEqual(counts, [(now.replace(second=0) - timedelta(minutes=2), 2),
+                                      (now.replace(second=0) - timedelta(minutes=1), 1)])
+            self.assertEqual(self.log.purge(retention_days=30), 1)
+            self.assertEqual(self.log.purge(retention_days=1), 1)
+            self.assertEqual(db.session.execute(select(db.func.count(AuthEvent.id))).scalar(), 4)
+
+    def test_queries_use_the_indexes(self):
+        captured = []
+        with self.app.app_context():
+            engine = db.engine
+        listener = lambda conn, cursor, statement, parameters, *args: captured.append((statement, parameters))
+        event.listen(engine, 'before_cursor_execute', listener)
+        with self.app.app_context():
+            audit.recent_events(1, 5)
+            audit.failures_per_minute(datetime.now(timezone.utc) - timedelta(hours=1))
+            event.remove(engine, 'before_cursor_execute', listener)
+            recent, failures = [' '.join(row[-1] for row in db.session.connection().exec_driver_sql(
+                'EXPLAIN QUERY PLAN ' + statement, parameters)) for statement, parameters in captured]
+        self.assertIn('SEARCH auth_event USING COVERING INDEX ix_auth_event_user_id_ts (user_id=?)', recent)
+        self.assertIn('SEARCH auth_event USING COVERING INDEX ix_auth_event_realm_username_key_ts '
+                      '(realm=? AND username_key=?)', recent)
+        # Each index is walked in order; only the merged 2 * limit ids are sorted
+        self.assertEqual(recent.count('TEMP B-TREE FOR ORDER BY'), 1)
+        self.assertIn('SEARCH auth_event USING COVERING INDEX ix_auth_event_kind_ts (kind=? AND ts>?)', failures)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+import json
+import unittest
+from unittest import mock
+
+from sqlalchemy import event, select, update
+
+from src.models import db, Role, User, UserRole
+from src.permissions import assign_role
+from tests.app_factory import make_app
+
+ROLE_CLAIMS = {'groups:g-hr': 'hr', 'groups:g-ops': 'ops', 'roles:Directory.Read': 'directory'}
+
+
+class TestClaimsSync(unittest.TestCase):
+    def setUp(self):
+        self.app = make_app(self.addCleanup,
+                            CLIENT_ID='client',
+                            AUTHORITY='https://login.example.com/tenant',
+                            AZURE_ROLE_CLAIMS='{"groups:g-hr": "hr", "groups:g-ops": "ops", "roles:Directory.Read": "directory"}',
+                            # Keep last_login and audit writes out of the statements captured below
+                            WRITE_BEHIND_INTERVAL_MS=60_000,
+                            AUDIT_FLUSH_INTERVAL_MS=60_000,
+                            # Redeem inline so each callback response finishes the login
+                            SSO_REDEEM_WORKERS=0)
+        services = self.app.extensions['services']
+        self.sync = services.claims_sync
+        ctx = self.app.app_context()
+        ctx.push()
+        self.addCleanup(ctx.pop)
+        db.create_all()
+        self.roles = {name: Role(name=name) for name in ('hr', 'ops', 'directory', 'manual')}
+        db.session.add_all(self.roles.values())
+        self.user = User(username='Alice@Example.com', password='x', display_name='alice')
+        db.session.add(self.user)
+        db.session.flush()
+        assign_role(self.user.id, self.roles['manual'])
+        db.session.commit()
+
+    def claims(self, **overrides):
+        claims = {'oid': 'oid-alice', 'preferred_username': 'alice@example.com', 'name': 'Alice Liddell',
+                  'groups': ['g-hr', 'g-unmapped'], 'roles': ['Directory.Read']}
+        claims.update(overrides)
+        return claims
+
+    def role_names(self):
+        return set(db.session.execute(
+            select(Role.name).join(UserRole, UserRole.role_id == Role.id).where(UserRole.user_id == self.user.id)
+        ).scalars())
+
+    def writes(self):
+        captured = []
+
+        def record(conn, cursor, statement, *args):
+            if not statement.lstrip().upper().startswith('SELECT'):
+                captured.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, db.engine, 'before_cursor_execute', record)
+        return captured
+
+    def test_first_login_applies_profile_and_roles(self):
+        self.assertTrue(self.sync.sync(self.user, self.claims(), ROLE_CLAIMS))
+        self.assertEqual((self.user.display_name, self.user.oid), ('Alice Liddell', 'oid-alice'))
+        self.assertEqual(self.role_names(), {'hr', 'directory', 'manual'})
+        self.assertEqual(self.sync.stats(), {'hits': 0, 'misses': 1, 'profile_updates': 1, 'roles_added': 2,
+                                             'roles_removed': 0})
+
+    def test_unchanged_claims_write_nothing(self):
+        self.sync.sync(self.user, self.claims(), ROLE_CLAIMS)
+        writes = self.writes()
+        # Group order in the token doesn't matter
+        self.assertFalse(self.sync.sync(self.user, self.claims(groups=['g-unmapped', 'g-hr']), ROLE_CLAIMS))
+        self.assertEqual(writes, [])
+        self.assertEqual(self.sync.stats()['hits'], 1)
+
+    def test_changes_apply_only_the_difference(self):
+        self.sync.sync(self.user, self.claims(), ROLE_CLAIMS)
+        writes = self.writes()
+        self.assertTrue(self.sync.sync(self.user, self.claims(groups=['g-ops']), ROLE_CLAIMS))
+        self.assertEqual(self.role_names(), {'ops', 'directory', 'manual'})
+        self.assertFalse(any(statement.startswith('UPDATE user SET display_name') for statement in writes))
+        self.assertEqual(self.sync.stats()['profile_updates'], 1)
+
+        # A group overage leaves group-mapped roles alone
+        overage = self.claims(groups=None, _claim_names={'groups': 'src1'})
+        self.sync.sync(self.user, overage, ROLE_CLAIMS)
+        self.assertEqual(self.role_names(), {'ops', 'directory', 'manual'})
+        self.sync.sync(self.user, self.claims(groups=[], roles=[]), ROLE_CLAIMS)
+        self.assertEqual(self.role_names(), {'manual'})
+
+    def test_missing_role_is_retried(self):
+        db.session.delete(self.roles['hr'])
+        db.session.commit()
+        self.sync.sync(self.user, self.claims(), ROLE_CLAIMS)
+        self.assertIsNone(self.user.claims_fingerprint)
+        db.session.add(Role(name='hr'))
+        db.session.commit()
+        self.assertTrue(self.sync.sync(self.user, self.claims(), ROLE_CLAIMS))
+        self.assertIn('hr', self.role_names())
+
+    def azure_login(self, claims, client=None, redeem=None):
+        azure = self.app.extensions['services'].azure
+        client = client or self.app.test_client()
+        with client.session_transaction() as session:
+            session['flow'] = {'state': 's'}
+        redeem = redeem or (lambda application, flow, auth_response, cache: ({'id_token': 'token'}, cache))
+        with mock.patch.object(azure, 'redeem_auth_code', side_effect=redeem), \
+                mock.patch.object(azure, 'validate_id_token', return_value=claims):
+            return client.get('/getAToken?code=c&state=s')
+
+    def test_sso_login_finds_returning_users_by_oid(self):
+        self.assertEqual(self.azure_login(self.claims()).headers['Location'], '/')
+        db.session.expire_all()
+        self.assertEqual(db.session.get(User, self.user.id).oid, 'oid-alice')
+
+        # Same claims again: the login itself writes nothing to the user or its roles
+        writes = self.writes()
+        self.assertEqual(self.azure_login(self.claims()).headers['Location'], '/')
+        self.assertFalse([statement for statement in writes if 'UPDATE user' in statement or 'user_role' in statement])
+        self.assertEqual(self.sync.stats()['hits'], 1)
+
+        # The email changed in Azure AD; the oid still finds the account
+        self.assertEqual(self.azure_login(self.claims(preferred_username='a.liddell@example.com'))
+                         .headers['Location'], '/')
+        # Another identity with the same email can't take the account over
+        response = self.azure_login(self.claims(oid='oid-mallory'))
+        self.assertIn('logout', response.headers['Location'])
+
+    def test_concurrent_first_logins_both_find_the_account(self):
+        engine = db.engine
+        claimed = []
+
+        def claimed_meanwhile(conn, cursor, statement, *args):
+            # The other login ties the account to the oid just before this one looks it up by username
+            if 'oid IS NULL' in statement and not claimed:
+                claimed.append(True)
+                with engine.begin() as other:
+                    other.execute(update(User).where(User.id == self.user.id).values(oid='oid-alice'))
+
+        event.listen(engine, 'before_cursor_execute', claimed_meanwhile)
+        self.addCleanup(event.remove, engine, 'before_cursor_execute', claimed_meanwhile)
+        self.assertEqual(self.azure_login(self.claims()).headers['Location'], '/')
+        self.assertTrue(claimed)
+
+    def test_sso_login_never_redeems_into_the_signed_in_users_cache(self):
+        azure = self.app.extensions['services'].azure
+        client = self.app.test_client()
+        self.azure_login(self.claims(), client)
+        alices_tokens = azure.new_token_cache()
+        alices_tokens.deserialize(json.dumps({'RefreshToken': {'alice-rt': {'secret': 'alice'}}}))
+        redeemed_into = []
+
+        def redeem(application, flow, auth_response, cache):
+            redeemed_into.append(cache.serialize())
+            return {'id_token': 'token'}, cache
+
+        # Still signed in as Alice, the browser signs in again (e.g. as someone else)
+        with mock.patch.object(azure, 'load_token_cache', return_value=alices_tokens):
+            self.azure_login(self.claims(oid='oid-bob'), client, redeem)
+        self.assertEqual(len(redeemed_into), 1)
+        self.assertNotIn('alice-rt', redeemed_into[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
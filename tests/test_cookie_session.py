@@ -0,0 +1,188 @@
+import os
+import unittest
+from unittest import mock
+
+from sqlalchemy.exc import OperationalError
+
+from src import cookie_session
+from src.cookie_session import RevocationList
+from src.lockout import unlock_user
+from src.models import db, SessionRevocation, User
+from tests.app_factory import make_app
+
+
+class TestCookieSession(unittest.TestCase):
+    def setUp(self):
+        self.app = make_app(self.addCleanup,
+                            SESSION_MODE='cookie',
+                            SESSION_TOKEN_LIFETIME=600,
+                            LOGIN_MAX_FAILURES=2)
+        services = self.app.extensions['services']
+        self.interface = self.app.extensions['cookie_sessions']
+        self.store = self.interface.server
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(User(username='alice', password=services.hasher.hash('pw'), display_name='Alice'))
+            db.session.commit()
+        self.client = self.app.test_client()
+
+    def login(self, client):
+        return client.post('/username_password_login', data={'username': 'alice', 'password': 'pw'})
+
+    def logged_in(self, client) -> bool:
+        return b'Welcome Alice' in client.get('/').data
+
+    def token(self, client):
+        return client.get_cookie('session').value
+
+    def payload(self, client):
+        with self.app.test_request_context():
+            return self.interface.get_signing_serializer(self.app).loads(self.token(client))
+
+    def test_logged_in_requests_need_no_session_store(self):
+        self.login(self.client)
+        # The first page shows (and so removes) the login flash message
+        self.assertTrue(self.logged_in(self.client))
+        data, jti, issued_at, version, sid = self.payload(self.client)
+        self.assertEqual(list(data), ['principal'])
+        self.assertEqual(data['principal'][:6], [1, 'alice', 'alice', 'Alice', 'username_password', 'default'])
+        self.assertIsNone(sid)
+
+        reads, writes = self.store.reads, self.store.writes
+        for _ in range(5):
+            self.assertTrue(self.logged_in(self.client))
+        self.assertEqual((self.store.reads, self.store.writes), (reads, writes))
+        # Nothing changed and the token is fresh: it isn't re-signed
+        self.assertEqual(self.payload(self.client)[1:3], [jti, issued_at])
+
+    def test_tokens_are_re_signed_past_half_their_lifetime(self):
+        self.login(self.client)
+        _, jti, issued_at, _, _ = self.payload(self.client)
+        later = issued_at + 301_000
+        with mock.patch.object(cookie_session, 'now_ms', return_value=later):
+            self.assertTrue(self.logged_in(self.client))
+        self.assertEqual(self.payload(self.client)[1:3], [jti, later])
+
+    def test_tampered_and_expired_tokens_are_rejected(self):
+        self.login(self.client)
+        token = self.token(self.client)
+        data, signature = token.rsplit('.', 1)
+        self.client.set_cookie('session', data + '.' + ('A' if signature[0] != 'A' else 'B') + signature[1:])
+        self.assertFalse(self.logged_in(self.client))
+
+        self.client.set_cookie('session', token)
+        self.assertTrue(self.logged_in(self.client))
+        self.interface.lifetime = -1
+        self.assertFalse(self.logged_in(self.client))
+        self.assertEqual(self.interface.stats()['rejected'], 2)
+
+    def test_logout_revokes_the_token(self):
+        self.login(self.client)
+        stolen = self.token(self.client)
+        self.client.get('/logout')
+        self.assertFalse(self.logged_in(self.client))
+
+        replay = self.app.test_client()
+        replay.set_cookie('session', stolen)
+        self.assertFalse(self.logged_in(replay))
+        self.assertEqual(self.interface.stats()['revoked'], 1)
+
+        # Another worker picks the revocation up from the table
+        with self.app.app_context():
+            other_worker = RevocationList(lifetime=600, check_interval=0)
+            data, jti, _, _, _ = self.interface.get_signing_serializer(self.app).loads(stolen)
+            user_id, logged_in_at = data['principal'][0], data['principal'][6]
+            self.assertTrue(other_worker.is_revoked(jti, user_id, logged_in_at))
+            self.assertFalse(other_worker.is_revoked('another', user_id, logged_in_at))
+            # A login with no recorded time only counts as revoked for a user who has a revocation
+            self.assertFalse(other_worker.is_revoked('another', user_id + 1, 0))
+
+    def test_lock_revokes_every_token_of_the_user(self):
+        self.login(self.client)
+        attacker = self.app.test_client()
+        for _ in range(2):
+            attacker.post('/username_password_login', data={'username': 'alice', 'password': 'wrong'})
+        self.assertFalse(self.logged_in(self.client))
+
+        # After an unlock, new logins are fine straight away
+        with self.app.app_context():
+            unlock_user(db.session.get(User, 1), self.app.extensions['services'].login_attempts)
+        self.login(self.client)
+        self.assertTrue(self.logged_in(self.client))
+
+    def test_a_lock_outlives_re_signing_by_a_worker_that_has_not_seen_it(self):
+        self.login(self.client)
+        _, _, issued_at, _, _ = self.payload(self.client)
+        revocations = self.interface.revocations
+        revocations.check_interval = 3600
+        self.assertTrue(self.logged_in(self.client))
+        # Another worker locks the account; this one hasn't polled since
+        with self.app.app_context():
+            RevocationList(lifetime=600).revoke_user(1)
+        later = issued_at + 301_000
+        with mock.patch.object(cookie_session, 'now_ms', return_value=later):
+            self.assertTrue(self.logged_in(self.client))
+        self.assertEqual(self.payload(self.client)[2], later)
+
+        # Once it polls, the re-signed token is as dead as the original
+        revocations.check_interval = 0
+        self.assertFalse(self.logged_in(self.client))
+
+    def test_revocation_checks_survive_a_database_outage_for_a_while(self):
+        with self.app.app_context():
+            revocations = RevocationList(lifetime=600, check_interval=0, max_staleness=60)
+            revocations.revoke_user(1)
+            self.assertTrue(revocations.is_revoked('jti', 1, 0))
+            with mock.patch.object(db.engine, 'connect', side_effect=OperationalError('SELECT', {}, 'down')):
+                # The last list is served while it is recent enough
+                self.assertTrue(revocations.is_revoked('jti', 1, 0))
+                self.assertFalse(revocations.is_revoked('jti', 2, 0))
+                revocations.max_staleness = 0
+                with self.assertRaises(OperationalError):
+                    revocations.is_revoked('jti', 1, 0)
+            self.assertEqual(revocations.stats()['failed_refreshes'], 3)
+
+    def test_revocation_checks_leave_the_request_transaction_alone(self):
+        with self.app.app_context():
+            revocations = RevocationList(lifetime=600, check_interval=0)
+            db.session.add(User(username='bob', password='x', display_name='Bob'))
+            revocations.is_revoked('jti', 1, 0)
+            db.session.rollback()
+            self.assertIsNone(User.query.filter_by(username='bob').first())
+
+    def test_old_revocations_are_purged_from_the_cli(self):
+        with self.app.app_context():
+            db.session.add(SessionRevocation(user_id=1, revoked_at=cookie_session.now_ms() - 601_000))
+            db.session.add(SessionRevocation(user_id=1, revoked_at=cookie_session.now_ms()))
+            db.session.commit()
+        result = self.app.test_cli_runner().invoke(args=['session-revocations-purge'])
+        self.assertEqual(result.output.strip(), 'Purged 1 session revocations')
+
+    def test_sso_flow_stays_on_the_server(self):
+        with self.client.session_transaction() as session:
+            session['flow'] = {'state': 's', 'code_verifier': 'secret'}
+            session['attempted_email'] = 'alice@example.com'
+        data, _, _, _, sid = self.payload(self.client)
+        self.assertEqual(data, {'attempted_email': 'alice@example.com'})
+        self.assertIsNotNone(sid)
+        self.assertNotIn('secret', self.token(self.client))
+        with self.client.session_transaction() as session:
+            self.assertEqual(session['flow']['code_verifier'], 'secret')
+            session.pop('flow')
+        self.assertIsNone(self.payload(self.client)[4])
+        with self.app.app_context():
+            self.assertIsNone(self.store._retrieve_session_data(self.store._get_store_id(sid)))
+
+    def test_oversized_sessions_go_to_the_server(self):
+        big = os.urandom(4000).hex()
+        with self.client.session_transaction() as session:
+            session['big'] = big
+        data, _, _, _, sid = self.payload(self.client)
+        self.assertEqual(data, {})
+        self.assertLess(len(self.token(self.client)), cookie_session.MAX_TOKEN_BYTES)
+        with self.client.session_transaction() as session:
+            self.assertEqual(session['big'], big)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import threading
+import time
+import unittest
+
+from src.hashing import HasherBusy, PasswordHasher, build_method, normalize_method
+
+
+class TestPasswordHasher(unittest.TestCase):
+    def test_process_pool_hash_and_verify(self):
+        hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=1)
+        self.addCleanup(hasher.shutdown)
+        pwhash = hasher.hash('s3cret')
+        self.assertTrue(pwhash.startswith('pbkdf2:sha256:1000$'))
+        self.assertTrue(hasher.verify(pwhash, 's3cret'))
+        self.assertFalse(hasher.verify(pwhash, 'wrong'))
+        stats = hasher.stats()
+        self.assertEqual(stats['completed'], 3)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertGreater(stats['latency_max'], 0)
+
+    def test_full_queue_rejects_immediately(self):
+        hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=0, max_pending=1)
+        release = threading.Event()
+        entered = threading.Event()
+
+        def slow(*args):
+            entered.set()
+            release.wait(5)
+            return True
+
+        worker = threading.Thread(target=hasher._run, args=(slow,))
+        worker.start()
+        entered.wait(5)
+        self.assertEqual(hasher.stats()['queue_depth'], 1)
+        with self.assertRaises(HasherBusy):
+            hasher.verify('pbkdf2:sha256:1000$x$y', 'pw')
+        release.set()
+        worker.join()
+        self.assertEqual(hasher.stats()['rejected'], 1)
+        self.assertEqual(hasher.stats()['queue_depth'], 0)
+
+    def test_timed_out_hash_keeps_its_slot_until_it_finishes(self):
+        hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=1, max_pending=1, timeout=30)
+        self.addCleanup(hasher.shutdown)
+        # Start the worker process so the slow job is running when the wait times out
+        hasher.hash('pw')
+        hasher.timeout = 0.2
+        with self.assertRaises(HasherBusy):
+            hasher._run(time.sleep, 1.5)
+        # The worker is still busy with it: no new slot is handed out yet
+        self.assertEqual(hasher.stats()['queue_depth'], 1)
+        with self.assertRaises(HasherBusy):
+            hasher.hash('pw')
+        deadline = time.monotonic() + 10
+        while hasher.stats()['queue_depth'] and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertTrue(hasher.verify(hasher.hash('pw'), 'pw'))
+        stats = hasher.stats()
+        self.assertEqual((stats['completed'], stats['timed_out'], stats['rejected']), (3, 1, 1))
+
+    def test_needs_rehash_compares_normalized_methods(self):
+        hasher = PasswordHasher(method='pbkdf2:sha256', workers=0)
+        current = hasher.hash('pw')
+        self.assertFalse(hasher.needs_rehash(current))
+        self.assertTrue(hasher.needs_rehash('pbkdf2:sha256:260000$salt$hash'))
+        self.assertTrue(hasher.needs_rehash('scrypt:32768:8:1$salt$hash'))
+        self.assertEqual(normalize_method('scrypt'), 'scrypt:32768:8:1')
+
+    def test_rehash_in_background_upgrades_to_current_method(self):
+        hasher = PasswordHasher(method='scrypt:1024:8:1', workers=1)
+        self.addCleanup(hasher.shutdown)
+        done = threading.Event()
+        release = threading.Event()
+        upgraded = []
+
+        def save(new_hash):
+            upgraded.append(new_hash)
+            done.set()
+            # A slow commit here must not hold up anyone else's hash
+            release.wait(30)
+
+        self.assertTrue(hasher.rehash_in_background('pw', save))
+        self.assertTrue(done.wait(30))
+        self.assertTrue(upgraded[0].startswith('scrypt:1024:8:1$'))
+        self.assertTrue(hasher.verify(upgraded[0], 'pw'))
+        release.set()
+
+    def test_build_method(self):
+        self.assertEqual(build_method('pbkdf2:sha256', '600000'), 'pbkdf2:sha256:600000')
+        self.assertEqual(build_method('pbkdf2:sha256'), 'pbkdf2:sha256')
+        self.assertEqual(build_method('scrypt', '600000'), 'scrypt')
+
+
+if __name__ == "__main__":
+    unittest.main()
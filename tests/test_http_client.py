@@ -0,0 +1,55 @@
+import time
+import unittest
+
+import msal
+import requests
+
+from src.http_client import build_http_client
+from src.msal_apps import MsalAppRegistry
+from tests.stub_authority import StubAuthority
+
+
+class TestIdpHttpClient(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubAuthority().start()
+        self.addCleanup(self.stub.stop)
+        self.http = build_http_client(verify=self.stub.cert_path, retries=0,
+                                      connect_timeout=1, read_timeout=1)
+        self.addCleanup(self.http.close)
+        self.registry = MsalAppRegistry(http_client=self.http, instance_discovery=False)
+
+    def _login(self, email):
+        app = self.registry.get(self.stub.client_id, self.stub.authority, 'secret')
+        flow = app.initiate_auth_code_flow(['User.Read'], redirect_uri='http://localhost/getAToken')
+        cache = msal.SerializableTokenCache()
+        bound = self.registry.with_cache(self.stub.client_id, self.stub.authority, 'secret', cache=cache)
+        result = bound.acquire_token_by_auth_code_flow(flow, self.stub.authorize(flow['auth_uri'], email))
+        return result, cache
+
+    def test_logins_reuse_one_connection_and_one_discovery(self):
+        for i in range(5):
+            result, cache = self._login(f'user{i}@example.com')
+            self.assertNotIn('error', result)
+            self.assertEqual(result['id_token_claims']['preferred_username'], f'user{i}@example.com')
+            self.assertTrue(cache.has_state_changed)
+
+        stats = self.http.stats.snapshot()
+        self.assertEqual(self.stub.hits['discovery'], 1)
+        self.assertEqual(self.stub.hits['token'], 5)
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(self.stub.connections, 1)
+        self.assertEqual(stats['connections_reused'], stats['requests'] - 1)
+
+    def test_slow_authority_hits_read_timeout(self):
+        app = self.registry.get(self.stub.client_id, self.stub.authority, 'secret')
+        flow = app.initiate_auth_code_flow(['User.Read'], redirect_uri='http://localhost/getAToken')
+        self.stub.latency = 3
+        started = time.monotonic()
+        with self.assertRaises(requests.Timeout):
+            app.acquire_token_by_auth_code_flow(flow, self.stub.authorize(flow['auth_uri'], 'slow@example.com'))
+        self.assertLess(time.monotonic() - started, 2.5)
+        self.assertEqual(self.http.stats.snapshot()['errors'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
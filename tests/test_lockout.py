@@ -0,0 +1,135 @@
+import os
+import tempfile
+import time
+import unittest
+
+from flask import Flask
+
+from src.lockout import LoginAttemptTracker, attempt_key, lock_user, unlock_user
+from src.models import db, User
+from tests.app_factory import make_app
+
+
+class TestLockout(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'attempts.db')
+        self.tracker = LoginAttemptTracker(self.path, max_failures=3, window=60, locked_refresh=0)
+
+    def test_locks_on_threshold_and_blocks_afterwards(self):
+        self.assertFalse(self.tracker.record_failure('alice'))
+        self.assertFalse(self.tracker.record_failure('alice'))
+        self.assertFalse(self.tracker.is_locked('alice'))
+        self.assertTrue(self.tracker.record_failure('alice'))
+
+        self.assertTrue(self.tracker.is_locked('alice'))
+        self.assertFalse(self.tracker.is_locked('bob'))
+        stats = self.tracker.stats()
+        self.assertEqual(stats['failures'], 3)
+        self.assertEqual(stats['locks'], 1)
+        self.assertEqual(stats['blocked_attempts'], 1)
+
+    def test_success_resets_and_old_failures_slide_out(self):
+        self.tracker.record_failure('alice')
+        self.tracker.record_failure('alice')
+        self.tracker.reset('alice')
+        self.assertFalse(self.tracker.record_failure('alice'))
+
+        self.tracker.window = 0.0
+        self.assertEqual(self.tracker.prune(), 1)
+        self.assertFalse(self.tracker.record_failure('alice'))
+
+    def test_recording_failures_prunes_old_ones(self):
+        self.tracker.record_failure('alice')
+        self.tracker.record_failure('bob')
+        self.tracker.window = 0.0
+        self.tracker.prune_interval = 0
+        self.tracker.record_failure('carol')
+        count = self.tracker._conn().execute('SELECT COUNT(*) FROM failures').fetchone()[0]
+        self.assertEqual(count, 0)
+
+    def test_lock_is_shared_with_other_workers(self):
+        other = LoginAttemptTracker(self.path, max_failures=3, window=60, locked_refresh=0)
+        for _ in range(2):
+            self.tracker.record_failure('alice')
+        self.assertTrue(other.record_failure('alice'))
+        self.assertTrue(self.tracker.is_locked('alice'))
+
+        other.unlock('alice')
+        self.assertFalse(self.tracker.is_locked('alice'))
+
+    def test_locks_learned_from_the_user_row_expire(self):
+        # Another host, with its own file: it only knows the lock from the user row
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        other_host = LoginAttemptTracker(os.path.join(tmp.name, 'attempts.db'), max_failures=3, window=60,
+                                         locked_refresh=60, locked_ttl=0.2)
+        other_host.mark_locked('alice', blocked=True)
+        self.assertTrue(other_host.is_locked('alice'))
+
+        # Unlocked on this host; the other one checks the user row again once its copy expires
+        self.tracker.unlock('alice')
+        self.assertTrue(other_host.is_locked('alice'))
+        time.sleep(0.3)
+        self.assertFalse(other_host.is_locked('alice'))
+
+    def test_lock_and_unlock_persist_on_user_row(self):
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            user = User(username='alice', password='x', display_name='Alice')
+            db.session.add(user)
+            db.session.commit()
+
+            lock_user(user.id)
+            db.session.refresh(user)
+            self.assertIsNotNone(user.locked_at)
+
+            key = attempt_key(user.realm, 'alice')
+            self.tracker.mark_locked(key)
+            unlock_user(user, self.tracker)
+            db.session.refresh(user)
+            self.assertIsNone(user.locked_at)
+            self.assertFalse(self.tracker.is_locked(key))
+
+
+class TestLockingEndsSessions(unittest.TestCase):
+    def setUp(self):
+        self.app = make_app(self.addCleanup, LOGIN_MAX_FAILURES=2)
+        services = self.app.extensions['services']
+        with self.app.app_context():
+            db.create_all()
+            user = User(username='alice', password=services.hasher.hash('pw'), display_name='Alice')
+            db.session.add(user)
+            db.session.commit()
+            self.user_id = user.id
+        self.client = self.app.test_client()
+
+    def login(self, client, password='pw'):
+        return client.post('/username_password_login', data={'username': 'alice', 'password': password})
+
+    def logged_in(self) -> bool:
+        return b'Welcome Alice' in self.client.get('/').data
+
+    def test_lock_logs_out_server_side_sessions(self):
+        self.login(self.client)
+        self.assertTrue(self.logged_in())
+        attacker = self.app.test_client()
+        for _ in range(2):
+            self.login(attacker, 'wrong')
+        self.assertFalse(self.logged_in())
+        # The login is gone from the stored session, not just hidden
+        with self.client.session_transaction() as session:
+            self.assertNotIn('principal', session)
+
+        with self.app.app_context():
+            unlock_user(db.session.get(User, self.user_id), self.app.extensions['services'].login_attempts)
+        self.login(self.client)
+        self.assertTrue(self.logged_in())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
-from src.main import main
+
+from benchmarks.load import ROUTES, regressions
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_load_worker(routes, **env):
+    """Boot the real app against SQLite and the stub authority and drive a few requests"""
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, 'result.json')
+        subprocess.run(
+            [sys.executable, '-m', 'benchmarks.load', '--worker',
+             '--database-url', f'sqlite:///{directory}/app.db', '--output', output,
+             '--clients', '2', '--requests', '4', '--users', '2', '--idp-latency', '0',
+             '--routes', *routes],
+            cwd=ROOT, env=dict(os.environ, PASSWORD_HASH_ITERATIONS='1000', **env),
+            check=True, stdout=subprocess.DEVNULL, timeout=120)
+        with open(output) as f:
+            return json.load(f)
+
 
 class TestMain(unittest.TestCase):
-    def test_main(self):
-        # Test the main function
-        self.assertIsNone(main())
+    def test_every_route_works_end_to_end(self):
+        results = run_load_worker(ROUTES)
+        self.assertEqual(sorted(results), sorted(ROUTES))
+        for route, result in results.items():
+            self.assertEqual((result['requests'], result['errors']), (4, 0), route)
+
+    def test_sso_redemption_inline(self):
+        results = run_load_worker(['azure_round_trip'], SSO_REDEEM_WORKERS='0')
+        self.assertEqual(results['azure_round_trip']['errors'], 0)
+
+    def test_regressions_compare_p95_and_throughput(self):
+        baseline = {'results': {'sqlite': {'login': {'p95_ms': 10.0, 'rps': 100.0}}}}
+        self.assertEqual(regressions(baseline, {'sqlite': {'login': {'p95_ms': 14.0, 'rps': 80.0}}}, 0.5), [])
+        found = regressions(baseline, {'sqlite': {'login': {'p95_ms': 20.0, 'rps': 50.0}},
+                                       'postgres': {'login': {'p95_ms': 99.0, 'rps': 1.0}}}, 0.5)
+        self.assertEqual(len(found), 2)
+
 
-if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+if __name__ == '__main__':
+    unittest.main()
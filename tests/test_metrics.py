@@ -0,0 +1,92 @@
+import io
+import json
+import logging
+import threading
+import unittest
+
+from src.metrics import Metrics, events, log_event
+from src.models import db, User
+from tests.app_factory import make_app
+
+
+class TestMetrics(unittest.TestCase):
+    def test_shards_are_merged_and_dead_threads_compacted(self):
+        metrics = Metrics(compact_every=2)
+
+        def record():
+            for _ in range(10):
+                metrics.observe('db_query_duration_seconds', 0.003)
+
+        threads = [threading.Thread(target=record) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        record()
+        series = metrics.collect()[('db_query_duration_seconds', ())]
+        self.assertEqual(sum(series[:-1]), 70)
+        self.assertAlmostEqual(series[-1], 0.21)
+        # Only this thread's shard is still live
+        self.assertEqual(len(metrics._shards), 1)
+
+    def test_render_is_cumulative_prometheus_text(self):
+        metrics = Metrics()
+        metrics.observe('auth_stage_duration_seconds', 0.002, 'password_verify')
+        metrics.observe('auth_stage_duration_seconds', 0.2, 'password_verify')
+        text = metrics.render({'auth_hasher_in_flight': 3})
+        self.assertIn('# TYPE auth_stage_duration_seconds histogram', text)
+        self.assertIn('auth_stage_duration_seconds_bucket{stage="password_verify",le="0.0025"} 1', text)
+        self.assertIn('auth_stage_duration_seconds_bucket{stage="password_verify",le="0.25"} 2', text)
+        self.assertIn('auth_stage_duration_seconds_bucket{stage="password_verify",le="+Inf"} 2', text)
+        self.assertIn('auth_stage_duration_seconds_count{stage="password_verify"} 2', text)
+        self.assertIn('auth_hasher_in_flight 3', text)
+
+    def test_log_event_is_sampled_json(self):
+        stream = io.StringIO()
+        handler = logging.StreamHandler(stream)
+        events.addHandler(handler)
+        self.addCleanup(events.removeHandler, handler)
+        log_event('dropped', sample=0.0, user='x')
+        log_event('kept', application='hr')
+        lines = stream.getvalue().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{'event': 'kept', 'application': 'hr'}])
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.app = make_app(self.addCleanup, METRICS_TOKEN='s3cret')
+        services = self.app.extensions['services']
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(User(username='alice', password=services.hasher.hash('pw'), display_name='Alice'))
+            db.session.commit()
+        self.client = self.app.test_client()
+
+    def scrape(self):
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer s3cret'})
+        self.assertEqual(response.status_code, 200)
+        return response.get_data(as_text=True)
+
+    def test_requires_the_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer nope'}).status_code, 401)
+        self.app.config['METRICS_TOKEN'] = None
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    def test_records_requests_queries_and_auth_stages(self):
+        self.client.post('/username_password_login', data={'username': 'alice', 'password': 'pw'})
+        text = self.scrape()
+        self.assertIn('http_request_duration_seconds_count'
+                      '{endpoint="accounts.username_password_login",method="POST",status="302"} 1', text)
+        # At least the user lookup ran inside the request
+        self.assertNotIn('db_queries_per_request_bucket{endpoint="accounts.username_password_login",le="0.0"} 1',
+                         text)
+        for stage in ('password_verify', 'session_load', 'session_save'):
+            self.assertIn(f'auth_stage_duration_seconds_count{{stage="{stage}"}}', text)
+        self.assertIn('auth_username_index_', text)
+        # The Azure AD stack isn't loaded just to be reported on
+        self.assertNotIn('auth_idp_http_', text)
+        self.assertFalse(self.app.extensions['services'].azure_loaded)
+
+
+if __name__ == '__main__':
+    unittest.main()
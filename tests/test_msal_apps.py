@@ -0,0 +1,82 @@
+import json
+import threading
+import unittest
+from unittest import mock
+
+import msal
+
+from src.msal_apps import MsalAppRegistry
+
+AUTHORITY = "https://login.example.com/tenant"
+
+
+class _Response:
+    def __init__(self, payload):
+        self.status_code = 200
+        self.text = json.dumps(payload)
+        self.headers = {}
+
+    def raise_for_status(self):
+        pass
+
+
+class _DiscoveryOnlyHttp:
+    """Answers the OpenID discovery GET and counts calls"""
+    def __init__(self):
+        self.gets = 0
+
+    def get(self, url, **kwargs):
+        self.gets += 1
+        return _Response({
+            "authorization_endpoint": AUTHORITY + "/oauth2/v2.0/authorize",
+            "token_endpoint": AUTHORITY + "/oauth2/v2.0/token",
+            "issuer": AUTHORITY + "/v2.0",
+        })
+
+    def post(self, url, **kwargs):
+        raise AssertionError("unexpected POST to " + url)
+
+    def close(self):
+        pass
+
+
+class TestMsalAppRegistry(unittest.TestCase):
+    def test_builds_one_app_per_client_and_authority(self):
+        registry = MsalAppRegistry()
+        with mock.patch("src.msal_apps.msal.ConfidentialClientApplication") as cca:
+            cca.side_effect = lambda *a, **kw: object()
+            threads = [threading.Thread(target=registry.get, args=("client", AUTHORITY, "secret"))
+                       for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            first = registry.get("client", AUTHORITY, "secret")
+            other = registry.get("client", AUTHORITY + "2", "secret")
+        self.assertEqual(cca.call_count, 2)
+        self.assertIsNot(first, other)
+
+    def test_with_cache_binds_user_cache_without_discovery(self):
+        http = _DiscoveryOnlyHttp()
+        registry = MsalAppRegistry(http_client=http, instance_discovery=False)
+        shared = registry.get("client", AUTHORITY, "secret")
+        gets_after_boot = http.gets
+
+        cache = msal.SerializableTokenCache()
+        bound = registry.with_cache("client", AUTHORITY, "secret", cache=cache)
+
+        self.assertIs(bound.token_cache, cache)
+        self.assertIsNot(shared.token_cache, cache)
+        self.assertEqual(bound.authority.token_endpoint, shared.authority.token_endpoint)
+        self.assertEqual(http.gets, gets_after_boot)
+
+    def test_warm_up_survives_unreachable_authority(self):
+        registry = MsalAppRegistry()
+        with mock.patch("src.msal_apps.msal.ConfidentialClientApplication",
+                        side_effect=ConnectionError("down")):
+            self.assertFalse(registry.warm_up("client", AUTHORITY, "secret"))
+        self.assertFalse(registry.warm_up(None, AUTHORITY))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from src import msal_apps
+from src.http_client import build_http_client
+from src.msal_apps import MsalAppRegistry
+from src.oidc_cache import OidcMetadataCache, cache_lifetime
+from tests.stub_authority import StubAuthority
+
+
+class TestOidcMetadataCache(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubAuthority().start()
+        self.addCleanup(self.stub.stop)
+        self.http = build_http_client(verify=self.stub.cert_path)
+        self.addCleanup(self.http.close)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+
+    def _token(self, **claims):
+        return self.stub._id_token({'oid': 'oid-1', 'email': 'a@example.com', 'nonce': None, 'claims': claims})
+
+    def test_second_worker_validates_from_disk_without_network(self):
+        first = OidcMetadataCache(self.directory, self.http)
+        self.assertEqual(first.validate_id_token(self.stub.authority, self.stub.client_id, self._token())['oid'], 'oid-1')
+        self.assertEqual(self.stub.hits, {'discovery': 1, 'jwks': 1})
+
+        second = OidcMetadataCache(self.directory, self.http)
+        self.assertTrue(second.load(self.stub.authority))
+        second.refresh(self.stub.authority)
+        claims = second.validate_id_token(self.stub.authority, self.stub.client_id, self._token())
+        self.assertEqual(claims['preferred_username'], 'a@example.com')
+        self.assertEqual(self.stub.hits, {'discovery': 1, 'jwks': 1})
+
+    def test_rejects_wrong_audience_and_forged_signature(self):
+        cache = OidcMetadataCache(self.directory, self.http)
+        with self.assertRaises(jwt.InvalidAudienceError):
+            cache.validate_id_token(self.stub.authority, 'someone-else', self._token())
+        forged = jwt.encode({'aud': self.stub.client_id, 'iss': self.stub.issuer},
+                            rsa.generate_private_key(public_exponent=65537, key_size=2048),
+                            algorithm='RS256', headers={'kid': self.stub.kid})
+        with self.assertRaises(jwt.InvalidSignatureError):
+            cache.validate_id_token(self.stub.authority, self.stub.client_id, forged)
+
+    def test_unknown_kid_refetches_keys_once(self):
+        cache = OidcMetadataCache(self.directory, self.http, kid_refetch_interval=0)
+        cache.validate_id_token(self.stub.authority, self.stub.client_id, self._token())
+        # The provider rotates its signing key
+        self.stub.kid = 'stub-key-2'
+        self.stub.signing_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        cache.validate_id_token(self.stub.authority, self.stub.client_id, self._token())
+        self.assertEqual(self.stub.hits['jwks'], 2)
+        self.assertEqual(cache.stats()['kid_misses'], 1)
+
+    def test_lifetime_follows_cache_headers(self):
+        self.assertEqual(cache_lifetime({'Cache-Control': 'public, max-age=3600'}, 100, 10), 3600)
+        self.assertEqual(cache_lifetime({'Cache-Control': 'max-age=3600', 'Age': '600'}, 100, 10), 3000)
+        self.assertEqual(cache_lifetime({'Cache-Control': 'no-cache'}, 100, 10), 10)
+        self.assertEqual(cache_lifetime({}, 100, 10), 100)
+
+    def test_msal_discovery_is_persisted_between_registries(self):
+        path = os.path.join(self.directory, 'msal_http_cache.json')
+        first = MsalAppRegistry(http_client=self.http, instance_discovery=False)
+        first.get(self.stub.client_id, self.stub.authority, 'secret')
+        first.save_http_cache(path)
+        with open(path) as f:
+            self.assertIn('_index_', json.load(f))
+
+        second = MsalAppRegistry(http_client=self.http, instance_discovery=False)
+        with mock.patch.object(msal_apps, '_save_hook_registered', False), \
+                mock.patch.object(msal_apps.atexit, 'register') as register:
+            second.persist_http_cache(path)
+            MsalAppRegistry().persist_http_cache(path)
+        # One exit hook per process, saving the registry built last for the path
+        register.assert_called_once()
+        self.addCleanup(msal_apps._save_at_exit.pop, path, None)
+        second.get(self.stub.client_id, self.stub.authority, 'secret')
+        self.assertEqual(self.stub.hits['discovery'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
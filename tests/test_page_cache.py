@@ -0,0 +1,89 @@
+import os
+import re
+import unittest
+
+from src.models import db, User
+from tests.app_factory import make_app, temporary_directory
+
+
+def _without_csrf(html):
+    return re.sub(r'name="csrf_token" value="[^"]+"', '', html)
+
+
+class TestPageCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = temporary_directory(self.addCleanup)
+        self.app = self.build_app()
+        self.cache = self.app.extensions['page_cache']
+        self.client = self.app.test_client()
+
+    def build_app(self, **overrides):
+        # The pages under test carry real CSRF tokens
+        app = make_app(self.addCleanup, self.directory, WTF_CSRF_ENABLED=True, **overrides)
+        services = app.extensions['services']
+        with app.app_context():
+            db.create_all()
+            if not User.query.filter_by(username='alice').first():
+                db.session.add(User(username='alice', password=services.hasher.hash('pw'),
+                                    display_name='<Alice>'))
+                db.session.commit()
+        return app
+
+    @staticmethod
+    def csrf_token(html):
+        return re.search(r'name="csrf_token" value="([^"]+)"', html).group(1)
+
+    def test_cached_page_matches_a_plain_render(self):
+        plain = self.build_app(PAGE_CACHE='0').test_client()
+        for path in ('/login', '/register', '/'):
+            cached_html = self.client.get(path).get_data(as_text=True)
+            self.client.get(path)
+            plain_html = plain.get(path).get_data(as_text=True)
+            self.assertEqual(_without_csrf(cached_html), _without_csrf(plain_html))
+        self.assertEqual(self.cache.stats()['misses'], 3)
+        self.assertEqual(self.cache.stats()['hits'], 3)
+
+    def test_spliced_csrf_token_is_accepted(self):
+        self.client.get('/login')
+        # The second view comes from the cached skeleton
+        token = self.csrf_token(self.client.get('/login').get_data(as_text=True))
+        response = self.client.post('/username_password_login',
+                                    data={'username': 'alice', 'password': 'pw', 'csrf_token': token})
+        self.assertEqual(response.headers['Location'], '/')
+        html = self.client.get('/').get_data(as_text=True)
+        # Display name is escaped, and so is the flash that followed the login
+        self.assertIn('Welcome &lt;Alice&gt; to', html)
+        self.assertIn('Successfully authenticated!', html)
+        self.assertNotIn('Successfully authenticated!', self.client.get('/').get_data(as_text=True))
+
+    def test_unchanged_page_is_not_modified(self):
+        response = self.client.get('/login')
+        token = self.csrf_token(response.get_data(as_text=True))
+        etag = response.headers['ETag']
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+        response = self.client.get('/login', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        # A flash is news: the page has no ETag and is rendered in full
+        self.client.post('/username_password_login',
+                         data={'username': 'alice', 'password': 'nope', 'csrf_token': token})
+        response = self.client.get('/login', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response.headers)
+
+    def test_template_change_drops_the_cache(self):
+        app = self.build_app(TEMPLATES_AUTO_RELOAD=True)
+        client = app.test_client()
+        cache = app.extensions['page_cache']
+        cache.check_interval = 0
+        client.get('/login')
+        path = os.path.join(app.root_path, app.template_folder, 'login.html')
+        stat = os.stat(path)
+        self.addCleanup(os.utime, path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        client.get('/login')
+        self.assertEqual(cache.stats()['misses'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+
+from flask import Blueprint, Flask, session
+
+from src.models import db, User, Role
+from src.permissions import (EDIT, FIELD, HIDE, ROUTE, VIEW, PermissionEngine, assign_role,
+                             require_permission, set_grant)
+import src.permissions as permissions
+
+
+class TestPermissionEngine(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        app.secret_key = 'test'
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(app)
+        self.app = app
+        ctx = app.app_context()
+        ctx.push()
+        self.addCleanup(ctx.pop)
+        db.create_all()
+
+        self.user = User(username='alice', password='x', display_name='Alice')
+        self.viewer = Role(name='viewer')
+        self.editor = Role(name='editor')
+        db.session.add_all([self.user, self.viewer, self.editor])
+        db.session.flush()
+        set_grant(self.viewer, ROUTE, 'reports', VIEW)
+        set_grant(self.viewer, FIELD, 'user.email', VIEW)
+        set_grant(self.editor, FIELD, 'user.email', EDIT)
+        set_grant(self.editor, FIELD, 'user.password', HIDE)
+        assign_role(self.user.id, self.viewer)
+        db.session.commit()
+
+    def test_compiled_levels_take_the_highest_grant(self):
+        engine = PermissionEngine()
+        table = engine.compile(self.user.id)
+        self.assertEqual(table.level(ROUTE, 'reports'), VIEW)
+        self.assertEqual(table.level(FIELD, 'user.email'), VIEW)
+        self.assertEqual(table.level(FIELD, 'user.password'), HIDE)
+        self.assertEqual(table.level(ROUTE, 'unknown'), HIDE)
+
+        assign_role(self.user.id, self.editor)
+        db.session.commit()
+        table = engine.compile(self.user.id)
+        self.assertEqual(table.level(FIELD, 'user.email'), EDIT)
+        self.assertTrue(table.allows(FIELD, 'user.email', VIEW))
+
+    def test_admin_edit_invalidates_other_workers(self):
+        engine = PermissionEngine(check_interval=0)
+        self.assertFalse(engine.allows(self.user.id, ROUTE, 'admin', VIEW))
+        self.assertEqual(engine.stats()['compiles'], 1)
+        self.assertFalse(engine.allows(self.user.id, ROUTE, 'admin', VIEW))
+        self.assertEqual(engine.stats()['compiles'], 1)
+
+        set_grant(self.viewer, ROUTE, 'admin', EDIT)
+        db.session.commit()
+        self.assertTrue(engine.allows(self.user.id, ROUTE, 'admin', EDIT))
+        self.assertEqual(engine.stats()['compiles'], 2)
+
+    def test_require_permission_decorator(self):
+        @self.app.route('/reports')
+        @require_permission(VIEW)
+        def reports():
+            return 'ok'
+
+        @self.app.route('/reports/edit')
+        @require_permission(EDIT, resource='reports')
+        def edit_reports():
+            return 'ok'
+
+        accounts = Blueprint('accounts', __name__)
+
+        @accounts.route('/login')
+        def login():
+            return 'login'
+        self.app.register_blueprint(accounts)
+
+        @self.app.route('/as/<int:user_id>')
+        def as_user(user_id):
+            session['user_id'] = user_id
+            return ''
+
+        self.addCleanup(setattr, permissions, 'engine', permissions.engine)
+        permissions.engine = PermissionEngine()
+        client = self.app.test_client()
+        self.assertEqual(client.get('/reports').status_code, 302)
+        client.get(f'/as/{self.user.id}')
+        self.assertEqual(client.get('/reports').status_code, 200)
+        self.assertEqual(client.get('/reports/edit').status_code, 403)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+from src.models import db, User
+from src.principal import SESSION_KEY
+from tests.app_factory import make_app
+
+
+class TestPrincipal(unittest.TestCase):
+    def setUp(self):
+        self.app = make_app(self.addCleanup)
+        services = self.app.extensions['services']
+        with self.app.app_context():
+            db.create_all()
+            user = User(username='alice', password=services.hasher.hash('pw'), display_name='Alice')
+            db.session.add(user)
+            db.session.commit()
+            self.user_id = user.id
+        self.store = self.app.session_interface.inner.inner
+        self.client = self.app.test_client()
+
+    def login(self):
+        self.client.post('/username_password_login', data={'username': 'alice', 'password': 'pw'})
+
+    def test_login_stores_one_compact_entry(self):
+        self.login()
+        with self.client.session_transaction() as session:
+            *stored, logged_in_at = session[SESSION_KEY]
+            self.assertEqual(stored, [self.user_id, 'alice', 'alice', 'Alice', 'username_password', 'default'])
+            self.assertIsInstance(logged_in_at, int)
+            self.assertNotIn('user_id', session)
+        self.assertIn(b'Welcome Alice', self.client.get('/').data)
+
+    def test_older_sessions_are_converted(self):
+        with self.client.session_transaction() as session:
+            session.update(user_id=self.user_id, user_oid='alice', user_email='alice',
+                           display_name='Alice', login_method='username_password')
+        self.assertIn(b'Welcome Alice', self.client.get('/').data)
+        with self.client.session_transaction() as session:
+            self.assertEqual(session[SESSION_KEY][0], self.user_id)
+            self.assertNotIn('user_oid', session)
+
+    def test_static_files_and_health_checks_skip_the_session_store(self):
+        self.login()
+        reads = self.store.reads
+        self.assertEqual(self.client.get('/health').status_code, 200)
+        self.assertEqual(self.client.get('/static/css/styles.css').status_code, 200)
+        self.assertEqual(self.store.reads, reads)
+        self.client.get('/')
+        self.assertEqual(self.store.reads, reads + 1)
+
+    def test_logout_forgets_the_principal(self):
+        self.login()
+        self.client.get('/logout')
+        self.assertNotIn(b'Welcome Alice', self.client.get('/').data)
+
+
+if __name__ == '__main__':
+    unittest.main()
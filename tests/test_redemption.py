@@ -0,0 +1,81 @@
+import threading
+import unittest
+from unittest import mock
+
+from src.models import db, User
+from src.redemption import RedemptionBusy, RedemptionPool, RedemptionTimeout
+from tests.app_factory import make_app
+
+
+class TestRedemptionPool(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.pool = RedemptionPool(workers=2, max_pending=3, timeout=30)
+        self.addCleanup(self.pool.shutdown)
+        self.addCleanup(self.release.set)
+
+    def _blocked(self, value):
+        self.release.wait(5)
+        return value
+
+    def test_poll_returns_result_once_done(self):
+        ticket = self.pool.submit(self._blocked, 'tokens')
+        self.assertIsNone(self.pool.poll(ticket))
+        self.release.set()
+        future = None
+        while future is None:
+            future = self.pool.poll(ticket)
+        self.assertEqual(future.result(), 'tokens')
+        with self.assertRaises(KeyError):
+            self.pool.poll(ticket)  # collected tickets are gone
+
+    def test_admission_is_bounded_beyond_the_thread_count(self):
+        tickets = [self.pool.submit(self._blocked, i) for i in range(3)]
+        self.assertEqual(self.pool.stats()['in_flight'], 3)
+        with self.assertRaises(RedemptionBusy):
+            self.pool.submit(self._blocked, 4)
+        self.release.set()
+        for ticket in tickets:
+            while self.pool.poll(ticket) is None:
+                pass
+        self.pool.submit(self._blocked, 5)
+        stats = self.pool.stats()
+        self.assertEqual((stats['rejected'], stats['peak_in_flight']), (1, 3))
+
+    def test_slow_redemptions_time_out(self):
+        self.pool.timeout = 0
+        ticket = self.pool.submit(self._blocked, 'late')
+        with self.assertRaises(RedemptionTimeout):
+            self.pool.poll(ticket)
+        self.assertEqual(self.pool.stats()['timed_out'], 1)
+
+
+class TestDefaultRedemption(unittest.TestCase):
+    def test_callback_hands_off_with_the_default_config(self):
+        app = make_app(self.addCleanup, CLIENT_ID='client', AUTHORITY='https://login.example.com/tenant')
+        with app.app_context():
+            db.create_all()
+            db.session.add(User(username='alice@example.com', password='x', display_name='alice'))
+            db.session.commit()
+        services = app.extensions['services']
+        self.addCleanup(services.redeemer.shutdown)
+        self.assertTrue(services.redeemer.enabled)
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['flow'] = {'state': 's'}
+        claims = {'oid': 'oid-alice', 'preferred_username': 'alice@example.com', 'name': 'Alice'}
+        with mock.patch.object(services.azure, 'redeem_auth_code',
+                               side_effect=lambda application, flow, auth_response, cache: ({'id_token': 't'}, cache)), \
+                mock.patch.object(services.azure, 'validate_id_token', return_value=claims):
+            response = client.get('/getAToken?code=c&state=s')
+            self.assertTrue(response.headers['Location'].endswith('/getAToken/pending'))
+            response = client.get('/getAToken/pending')
+            while response.status_code == 202:
+                response = client.get('/getAToken/pending')
+        self.assertEqual(response.headers['Location'], '/')
+        self.assertEqual(services.redeemer.stats()['completed'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+
+from flask import Flask
+from sqlalchemy import event, func, insert, select
+
+from src.models import db, Role, User
+from src.permissions import VIEW, PermissionEngine, assign_role, set_grant
+from src.rls import ROW, acting_as, init_rls
+import src.permissions as permissions
+import src.rls as rls
+
+ROWS = 20_000
+
+
+class TestRowLevelSecurity(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(app)
+        ctx = app.app_context()
+        ctx.push()
+        self.addCleanup(ctx.pop)
+        db.create_all()
+        init_rls(db)
+        self.addCleanup(setattr, permissions, 'engine', permissions.engine)
+        permissions.engine = PermissionEngine(check_interval=0)
+
+        db.session.execute(insert(User), [
+            {'username': f'user{i}', 'password': 'x', 'display_name': f'User {i}'} for i in range(ROWS)
+        ])
+        db.session.commit()
+        self.user_id = 1234
+
+    def _statements(self):
+        captured = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            captured.append((statement, parameters))
+
+        engine = db.engine
+        event.listen(engine, 'before_cursor_execute', capture)
+        self.addCleanup(event.remove, engine, 'before_cursor_execute', capture)
+        return captured
+
+    def test_user_only_fetches_own_row(self):
+        with acting_as(self.user_id):
+            users = db.session.execute(select(User)).scalars().all()
+            count = db.session.execute(select(func.count()).select_from(User)).scalar()
+            legacy = User.query.filter(User.username.like('user%')).count()
+        self.assertEqual([u.id for u in users], [self.user_id])
+        self.assertEqual(count, 1)
+        self.assertEqual(legacy, 1)
+
+    def test_unfiltered_without_user_or_with_skip_rls(self):
+        self.assertEqual(db.session.execute(select(func.count(User.id))).scalar(), ROWS)
+        with acting_as(self.user_id):
+            total = db.session.execute(
+                select(func.count(User.id)).execution_options(skip_rls=True)).scalar()
+        self.assertEqual(total, ROWS)
+
+    def test_row_grant_change_recompiles_predicate(self):
+        with acting_as(self.user_id):
+            self.assertEqual(db.session.execute(select(func.count(User.id))).scalar(), 1)
+        role = Role(name='directory')
+        db.session.add(role)
+        db.session.flush()
+        set_grant(role, ROW, 'user', VIEW)
+        assign_role(self.user_id, role)
+        db.session.commit()
+        with acting_as(self.user_id):
+            self.assertEqual(db.session.execute(select(func.count(User.id))).scalar(), ROWS)
+
+    def test_compiled_predicates_are_bounded(self):
+        permissions.engine = PermissionEngine(max_users=3, check_interval=0)
+        rls.clear_cache()
+        for user_id in range(1, 11):
+            with acting_as(user_id):
+                db.session.execute(select(User.id)).all()
+        self.assertEqual(len(rls._cache), 3 * len(rls._policies))
+        self.assertEqual({key[0] for key in rls._cache}, {8, 9, 10})
+
+        # A permissions change drops every stale predicate, not only the next user's
+        role = Role(name='directory')
+        db.session.add(role)
+        db.session.flush()
+        set_grant(role, ROW, 'user', VIEW)
+        db.session.commit()
+        with acting_as(1):
+            db.session.execute(select(User.id)).all()
+        self.assertEqual({key[0] for key in rls._cache}, {1})
+
+    def test_filtered_query_plan_uses_the_primary_key(self):
+        captured = self._statements()
+        with acting_as(self.user_id):
+            db.session.execute(select(User).where(User.display_name.like('User%'))).all()
+        statement, parameters = captured[-1]
+        plan = ' '.join(row[-1] for row in db.session.connection().exec_driver_sql(
+            'EXPLAIN QUERY PLAN ' + statement, parameters))
+        self.assertIn('SEARCH', plan)
+        self.assertIn('PRIMARY KEY', plan)
+        self.assertNotIn('SCAN', plan)
+
+
+if __name__ == "__main__":
+    unittest.main()
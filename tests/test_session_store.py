@@ -0,0 +1,73 @@
+import tempfile
+import time
+import unittest
+from datetime import timedelta
+
+from flask import Flask, session
+
+from src.session_store import ShardedSQLiteSessionInterface
+
+
+def make_app(directory):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.session_interface = ShardedSQLiteSessionInterface(app, directory, shards=4, sweep_interval=0)
+
+    @app.route('/set/<value>')
+    def set_value(value):
+        session['value'] = value
+        return 'ok'
+
+    @app.route('/append/<value>')
+    def append_value(value):
+        # Nested mutation that does not mark the session modified
+        session.setdefault('items', []).append(value)
+        session.modified = False
+        return 'ok'
+
+    @app.route('/get')
+    def get_value():
+        return str(session.get('value')) + ',' + ','.join(session.get('items', []))
+
+    return app
+
+
+class TestShardedSQLiteSessions(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.app = make_app(self.tmp.name)
+        self.store = self.app.session_interface
+        self.client = self.app.test_client()
+
+    def test_round_trip_and_unchanged_session_is_not_rewritten(self):
+        self.client.get('/set/a')
+        self.assertEqual(self.store.writes, 1)
+        for _ in range(3):
+            self.assertEqual(self.client.get('/get').text, 'a,')
+        self.assertEqual(self.store.writes, 1)
+        self.assertEqual(self.store.skipped_writes, 3)
+
+    def test_nested_mutation_is_saved(self):
+        self.client.get('/set/a')
+        self.client.get('/append/x')
+        self.assertEqual(self.client.get('/get').text, 'a,x')
+
+    def test_expired_sessions_are_ignored_and_swept(self):
+        self.app.permanent_session_lifetime = timedelta(seconds=1)
+        self.client.get('/set/a')
+        time.sleep(1.1)
+        self.assertEqual(self.client.get('/get').text, 'None,')
+        self.assertEqual(self.store.delete_expired(), 1)
+
+    def test_sessions_spread_over_shards(self):
+        for i in range(40):
+            self.app.test_client().get(f'/set/{i}')
+        counts = [self.store._conn(s).execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+                  for s in range(4)]
+        self.assertEqual(sum(counts), 40)
+        self.assertTrue(all(counts))
+
+
+if __name__ == "__main__":
+    unittest.main()
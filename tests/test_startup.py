@@ -0,0 +1,101 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only needed once someone signs in with Azure AD or runs a migration
+DEFERRED = ('msal', 'requests', 'jwt', 'cryptography', 'flask_migrate', 'alembic')
+
+# Generous ceilings; the factory measured ~0.45 s / ~55 MB where the old import-time setup took ~0.9 s / ~78 MB
+IMPORT_BUDGET_MS = float(os.getenv('STARTUP_IMPORT_BUDGET_MS', 1500))
+RSS_BUDGET_MB = float(os.getenv('STARTUP_RSS_BUDGET_MB', 70))
+
+BOOT = """
+import json, resource, sys
+from src.app import create_app
+app = create_app({'SESSION_TYPE': 'filesystem', 'SESSION_FILE_DIR': sys.argv[1]})
+try:
+    # ru_maxrss can carry over the parent's peak through fork(); VmHWM is this process's own
+    with open('/proc/self/status') as f:
+        rss_kb = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+except OSError:
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    'rss_mb': rss_kb / 1024,
+    'modules': sorted(name for name in sys.modules if name.split('.')[0] in %r),
+    'routes': sorted(rule.endpoint for rule in app.url_map.iter_rules()),
+}))
+""" % (DEFERRED,)
+
+
+def boot_worker():
+    """Build the app in a fresh interpreter under -X importtime, with no Azure settings in the environment"""
+    env = {k: v for k, v in os.environ.items()
+           if k not in ('CLIENT_ID', 'CLIENT_SECRET', 'AUTHORITY', 'SCOPE', 'REDIRECT_PATH', 'SERVER_NAME')}
+    with tempfile.TemporaryDirectory() as directory:
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT, directory],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True, timeout=60)
+    imports = {}
+    for line in proc.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                imports[name.strip()] = int(cumulative) / 1000
+    return json.loads(proc.stdout), imports
+
+
+class TestStartup(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.result, cls.imports = boot_worker()
+
+    def test_factory_registers_every_blueprint(self):
+        routes = self.result['routes']
+        for endpoint in ('main.index', 'accounts.login', 'azure.azure_login', 'azure.authorized'):
+            self.assertIn(endpoint, routes)
+
+    def test_heavy_dependencies_are_deferred(self):
+        self.assertEqual(self.result['modules'], [])
+
+    def test_import_time_budget(self):
+        self.assertLess(self.imports['src.app'], IMPORT_BUDGET_MS)
+
+    def test_rss_budget(self):
+        self.assertLess(self.result['rss_mb'], RSS_BUDGET_MB)
+
+    def test_boots_without_any_optional_settings(self):
+        env = {k: v for k, v in os.environ.items()
+               if not k.startswith(('SESSION_', 'CLIENT_', 'AUTHORITY', 'SCOPE', 'REDIRECT_PATH', 'SERVER_NAME',
+                                    'DATABASE_URL', 'APPLICATIONS_FILE'))}
+        with tempfile.TemporaryDirectory() as directory:
+            env.update(PYTHONPATH=ROOT, LOGIN_ATTEMPTS_DB=os.path.join(directory, 'login_attempts.db'))
+            proc = subprocess.run(
+                [sys.executable, '-c', 'from src.app import create_app; print(type(create_app().session_interface'
+                                       '.inner.inner).__name__)'],
+                cwd=directory, env=env, capture_output=True, text=True, timeout=60)
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        self.assertEqual(proc.stdout.strip(), 'ShardedSQLiteSessionInterface')
+
+    def test_flask_cli_skips_the_worker_warm_up(self):
+        # Against an empty database the username index warm-up fails loudly, so it shows when it ran
+        env = {k: v for k, v in os.environ.items() if k not in ('DATABASE_URL', 'AZURE_WARM_UP')}
+        with tempfile.TemporaryDirectory() as directory:
+            env.update(PYTHONPATH=ROOT, AZURE_WARM_UP='false',
+                       LOGIN_ATTEMPTS_DB=os.path.join(directory, 'login_attempts.db'),
+                       DATABASE_URL=f'sqlite:///{directory}/app.db')
+            served = subprocess.run([sys.executable, '-c', 'import wsgi'],
+                                    cwd=directory, env=env, capture_output=True, text=True, timeout=60)
+            cli = subprocess.run([sys.executable, '-m', 'flask', '--app', 'wsgi', 'routes'],
+                                 cwd=directory, env=env, capture_output=True, text=True, timeout=60)
+        self.assertIn('warm-up failed', served.stderr)
+        self.assertEqual(cli.returncode, 0, cli.stderr)
+        self.assertNotIn('warm-up failed', cli.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
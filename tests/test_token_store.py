@@ -0,0 +1,81 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import msal
+from flask import Flask
+from sqlalchemy import event, func, select
+
+from src.http_client import build_http_client
+from src.models import db, TokenCacheEntry
+from src.msal_apps import MsalAppRegistry
+from src.token_store import evict_expired, id_token_hint, load_token_cache, save_token_cache
+from tests.stub_authority import StubAuthority
+
+
+class TestTokenStore(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # One real token exchange against the stub gives us a realistic cache
+        with StubAuthority() as stub:
+            http = build_http_client(verify=stub.cert_path)
+            registry = MsalAppRegistry(http_client=http, instance_discovery=False)
+            app = registry.get(stub.client_id, stub.authority, 'secret')
+            flow = app.initiate_auth_code_flow(['User.Read'], redirect_uri='http://localhost/cb')
+            cls.cache = msal.SerializableTokenCache()
+            bound = registry.with_cache(stub.client_id, stub.authority, 'secret', cache=cls.cache)
+            result = bound.acquire_token_by_auth_code_flow(flow, stub.authorize(flow['auth_uri'], 'a@example.com'))
+            cls.id_token = result['id_token']
+            cls.serialized = cls.cache.serialize()
+            http.close()
+
+    def setUp(self):
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(app)
+        ctx = app.app_context()
+        ctx.push()
+        self.addCleanup(ctx.pop)
+        db.create_all()
+
+    def _fresh_cache(self):
+        cache = msal.SerializableTokenCache()
+        cache.deserialize(self.serialized)
+        cache.has_state_changed = True
+        return cache
+
+    def test_saves_only_when_changed_and_loads_back(self):
+        cache = self._fresh_cache()
+        self.assertTrue(save_token_cache('oid-1', cache))
+        self.assertFalse(save_token_cache('oid-1', cache))
+
+        loaded = load_token_cache('oid-1')
+        self.assertFalse(loaded.has_state_changed)
+        self.assertEqual(len(list(loaded.search(msal.TokenCache.CredentialType.REFRESH_TOKEN))), 1)
+        self.assertEqual(id_token_hint(loaded), self.id_token)
+        self.assertEqual(id_token_hint(load_token_cache('unknown')), '')
+
+    def test_save_is_a_single_upsert(self):
+        save_token_cache('oid-1', self._fresh_cache())
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        self.addCleanup(event.remove, db.engine, 'before_cursor_execute', listener)
+        # Another login for the same user: no SELECT-then-INSERT that a concurrent login could race
+        self.assertTrue(save_token_cache('oid-1', self._fresh_cache()))
+        self.assertEqual(len(statements), 1)
+        self.assertIn('ON CONFLICT', statements[0])
+        self.assertEqual(db.session.execute(select(func.count()).select_from(TokenCacheEntry)).scalar(), 1)
+
+    def test_evicts_caches_unused_past_refresh_token_lifetime(self):
+        save_token_cache('fresh', self._fresh_cache())
+        save_token_cache('stale', self._fresh_cache())
+        db.session.get(TokenCacheEntry, 'stale').updated_at = datetime.now(timezone.utc) - timedelta(days=91)
+        db.session.commit()
+
+        self.assertEqual(evict_expired(), 1)
+        self.assertIsNone(db.session.get(TokenCacheEntry, 'stale'))
+        self.assertIsNotNone(db.session.get(TokenCacheEntry, 'fresh'))
+
+
+if __name__ == "__main__":
+    unittest.main()
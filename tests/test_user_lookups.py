@@ -0,0 +1,131 @@
+import os
+import unittest
+
+from sqlalchemy import create_engine, event, insert, text
+
+from src.models import db, User
+from src.username_index import UsernameIndex
+from tests.app_factory import make_app
+
+ROWS = 100_000
+
+
+class TestUserLookups(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = make_app(cls.addClassCleanup)
+        services = cls.app.extensions['services']
+        with cls.app.app_context():
+            db.create_all()
+            db.session.execute(insert(User), [
+                {'username': f'User{i}@Example.com', 'password': 'x', 'display_name': f'User {i}',
+                 'is_active': i % 10 != 0} for i in range(ROWS)
+            ])
+            db.session.add(User(username='Alice@Example.com', password=services.hasher.hash('pw'),
+                                display_name='Alice'))
+            db.session.commit()
+            db.session.execute(text('ANALYZE'))
+
+    def setUp(self):
+        self.client = self.app.test_client()
+
+    def capture(self):
+        captured = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT') and 'FROM user' in statement:
+                captured.append((statement, parameters))
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, engine, 'before_cursor_execute', record)
+        return captured
+
+    def plan(self, statement, parameters):
+        with self.app.app_context():
+            return ' '.join(row[-1] for row in db.session.connection().exec_driver_sql(
+                'EXPLAIN QUERY PLAN ' + statement, parameters))
+
+    def test_lookups_ignore_case(self):
+        self.assertEqual(self.client.post('/check_username', json={'username': 'ALICE@example.com'}).status_code,
+                         200)
+        response = self.client.post('/username_password_login',
+                                    data={'username': 'alice@EXAMPLE.com', 'password': 'pw'})
+        self.assertEqual(response.headers['Location'], '/')
+        response = self.client.post('/register', data={'username': 'alice@example.COM', 'password': 'pw',
+                                                       'display_name': 'Other Alice'}, follow_redirects=True)
+        self.assertIn(b'Username already exists', response.data)
+
+    def test_existence_checks_are_index_only(self):
+        captured = self.capture()
+        with self.app.app_context():
+            index = UsernameIndex()
+            index.load()
+            self.assertFalse(index.exists('nobody@example.com'))
+        self.client.post('/register', data={'username': 'Nobody@example.com', 'password': 'pw',
+                                            'display_name': 'Nobody'})
+        self.assertEqual(len(captured), 4)
+        max_id, load, active_check, register_check = [self.plan(*query) for query in captured]
+        for statement, _ in captured[1:]:
+            self.assertIn('username_key', statement)
+            self.assertNotIn('password', statement)
+        # Where later registrations start: one probe of the end of the primary key
+        self.assertNotIn('SCAN', max_id)
+        # Loading active usernames reads only the partial index
+        self.assertIn('SCAN user USING COVERING INDEX ix_user_active_username_key', load)
+        # Point checks are one probe of the unique index; registration's doesn't even read the row.
+        # (SQLite reads the one row for is_active; Postgres uses the partial index, see below.)
+        self.assertRegex(active_check, r'SEARCH user USING INDEX \S+ \(realm=\? AND username_key=\?\)')
+        self.assertNotIn('SCAN user', active_check)
+        self.assertRegex(register_check, r'SEARCH user USING COVERING INDEX \S+ \(realm=\? AND username_key=\?\)')
+
+    def test_login_lookup_is_one_index_search_of_the_needed_columns(self):
+        captured = self.capture()
+        self.client.post('/username_password_login', data={'username': 'user7@example.com', 'password': 'nope'})
+        statement, parameters = captured[0]
+        self.assertNotIn('created_at', statement)
+        self.assertNotIn('SCAN', self.plan(statement, parameters))
+        self.assertIn('SEARCH user USING INDEX', self.plan(statement, parameters))
+
+
+@unittest.skipUnless(os.environ.get('TEST_POSTGRES_URL'), 'set TEST_POSTGRES_URL to run the Postgres plan checks')
+class TestUserLookupsOnPostgres(unittest.TestCase):
+    """Index-only scans at a million users; needs a throwaway Postgres database"""
+    ROWS = 1_000_000
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine(os.environ['TEST_POSTGRES_URL'])
+        User.__table__.drop(cls.engine, checkfirst=True)
+        User.__table__.create(cls.engine)
+        with cls.engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO \"user\" (username, username_key, password, display_name, is_active) "
+                "SELECT 'User' || i || '@Example.com', 'user' || i || '@example.com', 'x', 'User ' || i, i % 10 <> 0 "
+                "FROM generate_series(1, :rows) AS i"), {'rows': cls.ROWS})
+        # Index-only scans need the visibility map
+        with cls.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text('VACUUM ANALYZE "user"'))
+
+    @classmethod
+    def tearDownClass(cls):
+        User.__table__.drop(cls.engine, checkfirst=True)
+        cls.engine.dispose()
+
+    def plan(self, where):
+        with self.engine.connect() as conn:
+            return '\n'.join(row[0] for row in conn.execute(text(
+                f'EXPLAIN SELECT realm, username_key FROM "user" WHERE {where}')))
+
+    def test_active_user_check_is_an_index_only_scan(self):
+        plan = self.plan("realm = 'default' AND username_key = 'user7@example.com' AND is_active IS TRUE")
+        self.assertIn('Index Only Scan using ix_user_active_username_key', plan)
+
+    def test_existence_check_is_an_index_only_scan(self):
+        plan = self.plan("realm = 'default' AND username_key = 'user10@example.com'")
+        self.assertIn('Index Only Scan using uq_user_realm_username_key', plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
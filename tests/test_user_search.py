@@ -0,0 +1,130 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, update
+
+from src.blueprints.admin import MAX_MATCHES
+from src.models import db, Role, User
+from src.permissions import ROUTE, VIEW, assign_role, set_grant
+from src.rls import ROW
+from src.user_search import UserSearchIndex, tokens
+from tests.app_factory import make_app
+
+ROWS = 2_000
+
+
+class TestUserSearchIndex(unittest.TestCase):
+    def test_tokens_cover_each_word(self):
+        self.assertEqual(tokens('john.smith@example.com', 'John Smith'),
+                         {'john.smith@example.com', 'john smith', 'smith'})
+        self.assertEqual(tokens('ada', ''), {'ada'})
+
+
+class TestAdminDirectory(unittest.TestCase):
+    def setUp(self):
+        self.app = make_app(self.addCleanup, USER_SEARCH_CHECK_INTERVAL=0)
+        self.services = self.app.extensions['services']
+        self.created = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        with self.app.app_context():
+            db.create_all()
+            db.session.execute(insert(User), [
+                {'username': f'user{i:04}@example.com', 'password': 'x', 'display_name': f'Member {i:04}',
+                 'is_active': i % 4 != 0, 'created_at': self.created + timedelta(days=i % 10)}
+                for i in range(ROWS)
+            ])
+            admin = User(username='admin', password=self.services.hasher.hash('pw'), display_name='Ada Admin')
+            db.session.add(admin)
+            role = Role(name='directory')
+            db.session.add(role)
+            db.session.flush()
+            set_grant(role, ROUTE, 'admin.list_users', VIEW)
+            set_grant(role, ROW, 'user', VIEW)
+            assign_role(admin.id, role)
+            db.session.add(User(username='nobody', password=self.services.hasher.hash('pw'), display_name='Nobody'))
+            db.session.commit()
+        self.services.user_search.load_in_background(self.app).join()
+        self.client = self.app.test_client()
+        self.client.post('/username_password_login', data={'username': 'admin', 'password': 'pw'})
+
+    def get(self, **params):
+        response = self.client.get('/admin/users', query_string=params)
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        return response.get_json()
+
+    def walk(self, **params):
+        ids = []
+        after = None
+        while True:
+            page = self.get(**params, **({'after': after} if after else {}))
+            ids.extend(user['id'] for user in page['users'])
+            after = page['next']
+            if after is None:
+                return ids
+
+    def test_keyset_pages_cover_every_user_once(self):
+        ids = self.walk(limit=170)
+        self.assertEqual(len(ids), ROWS + 2)
+        self.assertEqual(len(set(ids)), len(ids))
+        first = self.get(limit=3)['users']
+        self.assertEqual([user['username'] for user in first], ['admin', 'nobody', 'user0000@example.com'])
+
+    def test_filters(self):
+        inactive = self.walk(active='false', limit=200)
+        self.assertEqual(len(inactive), ROWS // 4)
+        recent = self.get(created_after=(self.created + timedelta(days=8)).isoformat(), active='true', limit=200)
+        self.assertTrue(all(user['is_active'] for user in recent['users']))
+        self.assertTrue(all(user['created_at'] >= '2026-01-09' for user in recent['users']))
+        self.assertEqual(self.client.get('/admin/users?created_after=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/admin/users?after=nonsense').status_code, 400)
+
+    def test_search_by_prefix_of_any_word(self):
+        found = self.get(q='Member 012')['users']
+        self.assertEqual([user['username'] for user in found], [f'user{i:04}@example.com' for i in range(120, 130)])
+        self.assertEqual([user['username'] for user in self.get(q='ada')['users']], ['admin'])
+        self.assertEqual(self.get(q='zzz')['users'], [])
+        # Filters and pagination apply to the matches
+        self.assertEqual(len(self.walk(q='user01', active='true', limit=7)), 75)
+
+    def test_search_says_when_matches_were_cut_off(self):
+        self.assertFalse(self.get(q='Member 012')['truncated'])
+        self.assertFalse(self.get(q='zzz')['truncated'])
+        page = self.get(q='member', limit=200)
+        self.assertTrue(page['truncated'])
+        self.assertEqual(len(self.walk(q='member', limit=200)), MAX_MATCHES)
+        self.assertFalse(self.get(limit=3)['truncated'])
+
+    def test_index_follows_renames_and_registrations(self):
+        self.assertEqual(self.get(q='grace')['users'], [])
+        self.client.post('/register', data={'username': 'grace@example.com', 'password': 'pw',
+                                            'display_name': 'Grace Hopper'})
+        self.assertEqual([user['username'] for user in self.get(q='hopp')['users']], ['grace@example.com'])
+        # A write from another worker shows up through updated_at
+        with self.app.app_context():
+            db.session.execute(update(User).where(User.username == 'nobody')
+                               .values(display_name='Katherine Johnson',
+                                       updated_at=datetime.now(timezone.utc) + timedelta(seconds=1)))
+            db.session.commit()
+        self.assertEqual([user['username'] for user in self.get(q='kath')['users']], ['nobody'])
+        self.assertEqual(self.get(q='nobody')['users'][0]['display_name'], 'Katherine Johnson')
+        self.assertEqual(self.services.user_search.stats()['reloads'], 1)
+
+    def test_searches_wait_for_the_index_to_be_built(self):
+        self.services.user_search = index = UserSearchIndex(check_interval=0)
+        response = self.client.get('/admin/users', query_string={'q': 'ada'})
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+        # The first search started the build off the request thread
+        self.assertTrue(index.ready.wait(10))
+        self.assertEqual([user['username'] for user in self.get(q='ada')['users']], ['admin'])
+        # Listing without a query never needs the index
+        self.assertEqual(len(self.get(limit=3)['users']), 3)
+
+    def test_needs_permission(self):
+        client = self.app.test_client()
+        self.assertEqual(client.get('/admin/users').status_code, 302)
+        client.post('/username_password_login', data={'username': 'nobody', 'password': 'pw'})
+        self.assertEqual(client.get('/admin/users').status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+
+from flask import Flask
+from sqlalchemy import select
+
+from src.models import db, User, CacheVersion
+from src.username_index import UsernameIndex
+
+
+def make_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    return app
+
+
+class TestUsernameIndex(unittest.TestCase):
+    def setUp(self):
+        self.app = make_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        db.session.add_all([
+            User(username='alice', password='x', display_name='Alice'),
+            User(username='gone', password='x', display_name='Gone', is_active=False),
+        ])
+        db.session.commit()
+        self.addCleanup(self.ctx.pop)
+
+    def test_hits_negative_cache_and_misses(self):
+        index = UsernameIndex(check_interval=60)
+        self.assertTrue(index.exists('alice'))
+        self.assertFalse(index.exists('gone'))
+        self.assertFalse(index.exists('bob'))
+        self.assertFalse(index.exists('bob'))
+        stats = index.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['negative_hits'], 1)
+
+    def test_negative_cache_is_bounded(self):
+        index = UsernameIndex(negative_size=2, check_interval=60)
+        for name in ('a', 'b', 'c'):
+            index.exists(name)
+        self.assertEqual(index.stats()['negative_size'], 2)
+
+    def test_other_worker_sees_registration_through_version_stamp(self):
+        ours = UsernameIndex(check_interval=0)
+        theirs = UsernameIndex(check_interval=0)
+        self.assertFalse(ours.exists('bob'))
+        self.assertFalse(theirs.exists('bob'))
+
+        db.session.add(User(username='bob', password='x', display_name='Bob'))
+        ours.bump()
+        db.session.commit()
+        ours.add('bob')
+
+        self.assertEqual(CacheVersion.current('usernames'), 1)
+        self.assertTrue(ours.exists('bob'))
+        self.assertTrue(theirs.exists('bob'))
+        # Only the new user was fetched, not the whole set again
+        self.assertEqual((theirs.stats()['reloads'], theirs.stats()['deltas']), (1, 1))
+
+    def test_deactivation_makes_other_workers_reload(self):
+        theirs = UsernameIndex(check_interval=0)
+        self.assertTrue(theirs.exists('alice'))
+        user = db.session.execute(select(User).filter_by(username='alice')).scalar_one()
+        user.is_active = False
+        UsernameIndex.bump(reload=True)
+        db.session.commit()
+        self.assertFalse(theirs.exists('alice'))
+        self.assertEqual(theirs.stats()['reloads'], 2)
+
+    def test_usernames_are_per_realm(self):
+        db.session.add(User(realm='hr', username='carol', password='x', display_name='Carol'))
+        db.session.commit()
+        index = UsernameIndex(check_interval=60)
+        self.assertTrue(index.exists('carol', 'hr'))
+        self.assertFalse(index.exists('carol'))
+        self.assertFalse(index.exists('alice', 'hr'))
+        index.add('dave', 'hr')
+        self.assertTrue(index.exists('dave', 'hr'))
+        self.assertFalse(index.exists('dave'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from datetime import datetime, timezone
+
+from flask import Flask
+from sqlalchemy import event, update
+
+from src.models import db, User
+from src.write_behind import WriteBehindBuffer
+
+
+class TestWriteBehind(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        with self.app.app_context():
+            db.create_all()
+            db.session.add_all([User(username=f'u{i}', password='x', display_name='U') for i in range(5)])
+            db.session.commit()
+        # Flush by hand; the background thread only starts on the first record
+        self.buffer = WriteBehindBuffer(self.app, flush_interval=3600, batch_size=1000, max_pending=3)
+        self.addCleanup(self.buffer.close)
+
+    def _statements(self):
+        statements = []
+        with self.app.app_context():
+            engine = db.engine
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, 'before_cursor_execute', listener)
+        self.addCleanup(event.remove, engine, 'before_cursor_execute', listener)
+        return statements
+
+    def test_flush_writes_buffered_users_in_bulk(self):
+        first = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        later = datetime(2026, 1, 2, tzinfo=timezone.utc)
+        self.buffer.record(1, last_login=first)
+        self.buffer.record(2, last_login=first)
+        self.buffer.record(1, last_login=later, updated_by='sso')
+        self.assertEqual(self.buffer.stats()['depth'], 2)
+
+        statements = self._statements()
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(sum(s.startswith('UPDATE') for s in statements), 2)  # one per column set
+
+        with self.app.app_context():
+            one, two = db.session.get(User, 1), db.session.get(User, 2)
+            self.assertEqual(one.last_login.replace(tzinfo=timezone.utc), later)
+            self.assertEqual(one.updated_by, 'sso')
+            self.assertEqual(two.last_login.replace(tzinfo=timezone.utc), first)
+        stats = self.buffer.stats()
+        self.assertEqual((stats['depth'], stats['flushes'], stats['flushed_rows']), (0, 1, 2))
+
+    def test_flush_leaves_updated_at_alone(self):
+        # updated_at marks profile changes; the admin search index polls it
+        edited = datetime(2026, 1, 1)
+        with self.app.app_context():
+            db.session.execute(update(User).values(updated_at=edited))
+            db.session.commit()
+        self.buffer.record(1, last_login=datetime.now(timezone.utc))
+        self.buffer.flush()
+        with self.app.app_context():
+            self.assertEqual(db.session.get(User, 1).updated_at, edited)
+
+    def test_buffer_is_bounded_and_close_flushes(self):
+        now = datetime.now(timezone.utc)
+        for user_id in range(1, 6):
+            self.buffer.record(user_id, last_login=now)
+        # Overflow wakes the flusher, so how many get dropped depends on timing
+        stats = self.buffer.stats()
+        self.assertGreater(stats['dropped'], 0)
+        self.assertEqual(stats['recorded'] + stats['dropped'], 5)
+
+        self.buffer.close()
+        with self.app.app_context():
+            logged_in = db.session.query(User).filter(User.last_login.isnot(None)).count()
+        self.assertEqual(logged_in, stats['recorded'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,15 @@
-from src.app import app
+import os
+
+import click
+
+from src.app import create_app, warm_up
+
+app = create_app()
+
+# Each worker imports this module when it boots; AZURE_WARM_UP=false leaves msal unloaded until the first Azure sign-in.
+# The flask CLI imports it too (e.g. `flask db upgrade`), and has nothing to warm up for.
+if click.get_current_context(silent=True) is None:
+    warm_up(app, azure=os.getenv('AZURE_WARM_UP', 'true').lower() not in ('0', 'false', 'no'))
 
 if __name__ == "__main__":
-    app.run(host='localhost', port=5000, debug=True)
\ No newline at end of file
+    app.run(host='localhost', port=5000, debug=True)